@@ -1,9 +1,52 @@
 # bot.py
 
+from contextvars import ContextVar
+
 from aiogram import Bot, Dispatcher
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.webhook import AnswerCallbackQuery, AnswerInlineQuery
 from config import BOT_TOKEN
+from db import end_write_section
+from fsm_storage import SQLiteStorage
+from middlewares import UnitOfWorkMiddleware
+
+# Ответ, который можно вернуть Telegram в теле ответа на запрос webhook (см. webhook.py).
+# Вне обработки webhook – None.
+webhook_reply = ContextVar('webhook_reply', default=None)
+
+
+class WebhookBot(Bot):
+    """
+    Bot, который в режиме webhook отвечает на callback query и inline query в теле ответа на запрос Telegram:
+    первый ответ при обработке апдейта не делает отдельного запроса к API, а повторные ответы на тот же запрос
+    отбрасываются (Telegram всё равно принимает только первый).
+
+    Перед каждым запросом к API изменения текущего апдейта фиксируются (db.end_write_section),
+    чтобы блокировка записи не держалась, пока Telegram отвечает.
+    """
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        await end_write_section()
+        return await super().request(method, data, files, **kwargs)
+
+    async def answer_callback_query(self, callback_query_id, text=None, show_alert=None, url=None, cache_time=None):
+        reply = webhook_reply.get()
+        response = AnswerCallbackQuery(callback_query_id, text, show_alert, url, cache_time)
+        if reply is not None and reply.take(response, callback_query_id):
+            return True
+        return await super().answer_callback_query(callback_query_id, text, show_alert, url, cache_time)
+
+    async def answer_inline_query(self, inline_query_id, results, cache_time=None, is_personal=None, next_offset=None,
+                                  switch_pm_text=None, switch_pm_parameter=None):
+        reply = webhook_reply.get()
+        response = AnswerInlineQuery(inline_query_id, results, cache_time, is_personal, next_offset,
+                                     switch_pm_text, switch_pm_parameter)
+        if reply is not None and reply.take(response, inline_query_id):
+            return True
+        return await super().answer_inline_query(inline_query_id, results, cache_time, is_personal, next_offset,
+                                                 switch_pm_text, switch_pm_parameter)
+
 
-bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+bot = WebhookBot(token=BOT_TOKEN)
+storage = SQLiteStorage()
 dp = Dispatcher(bot, storage=storage)
+dp.middleware.setup(UnitOfWorkMiddleware())
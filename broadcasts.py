@@ -0,0 +1,156 @@
+# broadcasts.py
+
+"""Рассылки сообщений всем пользователям.
+
+Рассылка (кампания) сохраняется в таблице campaigns вместе с текстом, курсором по id получателей
+и счётчиками. Получатели читаются порциями по BROADCAST_CHUNK в порядке id, каждая порция отправляется
+пулом из BROADCAST_CONCURRENCY отправителей в очередь outbox с приоритетом BULK. Скорость рассылки
+ограничивает только общее ведро очереди (OUTBOX_RATE, при нескольких воркерах – его доля): ответы
+пользователям и уведомления администраторам уходят раньше, а RetryAfter и сетевые ошибки повторяет
+сама очередь. Пользователи, заблокировавшие бота, помечаются id.blocked и в следующие рассылки не попадают.
+
+После каждой порции курсор и счётчики записываются в базу, поэтому после перезапуска рассылка
+продолжается с места остановки (resume_campaigns). Доставка – "хотя бы один раз": если процесс
+остановится посреди порции, после перезапуска её получатели (до BROADCAST_CHUNK) получат сообщение повторно.
+"""
+
+import asyncio
+import logging
+import time
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.utils.exceptions import Unauthorized, ChatNotFound, MessageNotModified, TelegramAPIError
+
+from bot import bot
+from callbacks import pack
+from config import BROADCAST_CONCURRENCY, BROADCAST_CHUNK, BROADCAST_PROGRESS_INTERVAL
+from db import fetchone, fetchall, execute, executemany
+import outbox
+
+log = logging.getLogger(__name__)
+
+_tasks = {}
+
+
+async def create_campaign(text, admin_chat=None, progress_message=None):
+    """Сохраняет новую рассылку и возвращает её id. Число получателей фиксируется при создании."""
+    total = (await fetchone('SELECT count(*) FROM id WHERE blocked = 0'))[0]
+    return await execute(
+        'INSERT INTO campaigns (text, total, created_at, admin_chat, progress_message) VALUES (?, ?, ?, ?, ?)',
+        (text, total, int(time.time()), admin_chat, progress_message)
+    )
+
+
+def start_campaign(campaign_id):
+    """Запускает отправку рассылки в фоне (повторный запуск уже идущей рассылки ничего не делает)."""
+    task = _tasks.get(campaign_id)
+    if task is None or task.done():
+        task = _tasks[campaign_id] = asyncio.create_task(run_campaign(campaign_id))
+        task.add_done_callback(lambda _: _tasks.pop(campaign_id, None))
+    return task
+
+
+async def resume_campaigns():
+    """Продолжает рассылки, прерванные перезапуском бота. Вызывается при старте."""
+    for (campaign_id,) in await fetchall("SELECT id FROM campaigns WHERE status = 'running'"):
+        log.info('Продолжаем рассылку %s', campaign_id)
+        start_campaign(campaign_id)
+
+
+def progress_markup(campaign_id):
+    """Кнопка «Отменить рассылку» под сообщением с прогрессом идущей рассылки."""
+    return InlineKeyboardMarkup().add(InlineKeyboardButton('Отменить рассылку', callback_data=pack('cancelCampaign', campaign_id)))
+
+
+async def cancel_campaign(campaign_id):
+    """
+    Останавливает рассылку: отправка прекращается после текущей порции.
+    Возвращает False, если рассылка уже завершена или остановлена.
+    """
+    row = await fetchone('SELECT status FROM campaigns WHERE id = ?', (campaign_id,))
+    if row is None or row[0] != 'running':
+        return False
+    await execute("UPDATE campaigns SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'running'",
+                  (int(time.time()), campaign_id))
+    return True
+
+
+async def _send(chat_id, text):
+    """Отправляет сообщение одному получателю. Возвращает 'sent', 'blocked' или 'failed'."""
+    try:
+        await outbox.send_message(chat_id, text, priority=outbox.BULK)
+        return 'sent'
+    except (Unauthorized, ChatNotFound):
+        return 'blocked'
+    except TelegramAPIError:
+        return 'failed'
+
+
+async def _send_chunk(recipients, text):
+    """Отправляет порцию пулом из BROADCAST_CONCURRENCY отправителей и возвращает результаты по получателям."""
+    queue = list(recipients)
+    results = {}
+
+    async def sender():
+        while queue:
+            chat_id = queue.pop()
+            results[chat_id] = await _send(chat_id, text)
+
+    await asyncio.gather(*(sender() for _ in range(min(BROADCAST_CONCURRENCY, len(queue)))))
+    return results
+
+
+async def _report(campaign):
+    """Обновляет сообщение с прогрессом рассылки у администратора."""
+    campaign_id, status, total, sent, failed, blocked, admin_chat, progress_message = campaign
+    if admin_chat is None or progress_message is None:
+        return
+    title = {'running': 'идёт', 'done': 'завершена', 'cancelled': 'остановлена'}.get(status, status)
+    text = (f'Рассылка #{campaign_id} {title}\n'
+            f'Отправлено: {sent} из {total}\nОшибок: {failed}\nЗаблокировали бота: {blocked}')
+    markup = progress_markup(campaign_id) if status == 'running' else None
+    try:
+        await bot.edit_message_text(text, admin_chat, progress_message, reply_markup=markup)
+    except MessageNotModified:
+        pass
+    except TelegramAPIError:
+        log.warning('Не удалось обновить прогресс рассылки %s', campaign_id, exc_info=True)
+
+
+async def _load(campaign_id):
+    return await fetchone(
+        'SELECT id, status, total, sent, failed, blocked, admin_chat, progress_message, text, cursor FROM campaigns WHERE id = ?',
+        (campaign_id,)
+    )
+
+
+async def run_campaign(campaign_id):
+    """Отправляет рассылку, начиная с сохранённого курсора, пока не закончатся получатели или её не остановят."""
+    row = await _load(campaign_id)
+    text, cursor = row[8], row[9]
+    reported = 0.0
+    while row[1] == 'running':
+        recipients = [r[0] for r in await fetchall(
+            'SELECT users FROM id WHERE users > ? AND blocked = 0 ORDER BY users LIMIT ?', (cursor, BROADCAST_CHUNK)
+        )]
+        if not recipients:
+            await execute("UPDATE campaigns SET status = 'done', finished_at = ? WHERE id = ? AND status = 'running'",
+                          (int(time.time()), campaign_id))
+            row = await _load(campaign_id)
+            break
+        results = await _send_chunk(recipients, text)
+        blocked = [chat_id for chat_id, result in results.items() if result == 'blocked']
+        if blocked:
+            await executemany('UPDATE id SET blocked = 1 WHERE users = ?', [(chat_id,) for chat_id in blocked])
+        cursor = recipients[-1]
+        values = list(results.values())
+        await execute(
+            'UPDATE campaigns SET cursor = ?, sent = sent + ?, failed = failed + ?, blocked = blocked + ? WHERE id = ?',
+            (cursor, values.count('sent'), values.count('failed'), len(blocked), campaign_id)
+        )
+        row = await _load(campaign_id)
+        if time.monotonic() - reported >= BROADCAST_PROGRESS_INTERVAL:
+            reported = time.monotonic()
+            await _report(row[:8])
+    await _report(row[:8])
+    log.info('Рассылка %s: %s, отправлено %s из %s', campaign_id, row[1], row[3], row[2])
@@ -0,0 +1,44 @@
+# cache_bus.py
+
+"""Межпроцессная инвалидация кэшей в памяти.
+
+В режиме нескольких процессов (sharding.py) у каждого воркера свои кэши каталога и счётчиков меню.
+Процесс, изменивший данные, сам обновляет свой кэш и публикует имя кэша (publish) – после фиксации
+изменений оно доставляется остальным воркерам, и там вызывается функция сброса, зарегистрированная
+через subscribe. В однопроцессном режиме публиковать некому, и publish ничего не делает.
+"""
+
+from db import after_commit
+
+CATALOG, COUNTERS = 'catalog', 'counters'
+
+_handlers = {}
+_publisher = None
+
+
+def subscribe(name):
+    """Регистрирует функцию, сбрасывающую кэш name по сообщению из другого процесса."""
+    def decorator(func):
+        _handlers[name] = func
+        return func
+    return decorator
+
+
+def set_publisher(func):
+    """Задаёт отправку сообщений другим процессам: func(name). Вызывается в воркере при старте."""
+    global _publisher
+    _publisher = func
+
+
+def publish(name):
+    """Сообщает другим процессам, что кэш name устарел (после фиксации текущей единицы работы)."""
+    if _publisher is not None:
+        publisher = _publisher
+        after_commit(lambda: publisher(name))
+
+
+def receive(name):
+    """Сбрасывает кэш name по сообщению из другого процесса."""
+    func = _handlers.get(name)
+    if func is not None:
+        func()
@@ -0,0 +1,166 @@
+# callbacks.py
+
+"""Маршрутизация нажатий inline-кнопок.
+
+callback_data имеет вид "<действие>" или "<действие>:<аргумент>:<аргумент>..." (pack/unpack).
+Обработчики регистрируются на действие (route), и один общий обработчик aiogram выбирает нужный
+поиском в словаре: стоимость не зависит от числа обработчиков, а совпадения по префиксу
+(sale/sales, cart/cart1, feedback/feedback_add) невозможны. Повторная регистрация действия – ошибка.
+
+Кнопки, отправленные до перехода на этот формат, остаются в чатах: их callback_data
+переводится в новый формат по таблице LEGACY, где для каждого старого формата задано точное
+регулярное выражение (префикс и числовые аргументы или поля через '|'). Остальные данные
+передаются дальше (SkipHandler), а если их не обработал и никто другой – на нажатие отвечает
+StaleCallbackMiddleware («Кнопка устарела»).
+
+Большие или чужие данные кнопки не кладутся в callback_data: pack_payload сохраняет их на стороне бота
+(payloads.py), а в кнопку попадает "<действие>:~<токен>[:<аргументы>]" – токен одних данных может стоять
+в нескольких кнопках (payload_ref). Обработчик, зарегистрированный с route(..., payload=Тип), получает
+данные аргументом payload, а остальные аргументы – как обычно, через callback_args.
+"""
+
+import inspect
+import re
+
+from aiogram import types
+from aiogram.dispatcher import FSMContext
+from aiogram.dispatcher.handler import SkipHandler
+from aiogram.dispatcher.filters.state import State
+
+import payloads
+from bot import dp
+from middlewares import StaleCallbackMiddleware, mark_callback_handled
+
+SEPARATOR = ':'
+# Признак токена данных, сохранённых на стороне бота
+PAYLOAD_MARK = '~'
+
+# Форматы callback_data старых кнопок -> действие; группы выражения – аргументы.
+# Выражение должно совпасть со всей строкой.
+LEGACY = [(re.compile(pattern, re.DOTALL), action) for pattern, action in [
+    (r'assort_(\d+)', 'assort'), (r'brand_(\d+)', 'brand'), (r'product_(\d+)', 'product'),
+    (r'addCart_(\d+)', 'addCart'), (r'cart(\d+)', 'cart'), (r'inc(\d+)', 'inc'), (r'dec(\d+)', 'dec'),
+    (r'moveLeft(\d+)', 'moveLeft'), (r'moveRight(\d+)', 'moveRight'), (r'delCart(\d+)', 'delCart'),
+    (r'orderConfirm(\d+)', 'orderConfirm'),
+    (r'feedback_add\|(-?\d+)\|(\d+)\|.*', 'feedback_add'), (r'feedback_del\|(-?\d+)\|(\d+)', 'feedback_del'),
+    (r'feedback_ban(-?\d+)', 'feedback_ban'), (r'sale(\d+)', 'sale'),
+    (r'historyOlder_(\d+)', 'historyOlder'), (r'historyNewer_(\d+)', 'historyNewer'),
+    (r'askManager (\d+)', 'askManager'), (r'sendContact (\d+)', 'sendContact'),
+    (r'fbPage_(\d+)', 'fbPage'), (r'fb_(\d+)', 'fb'),
+    (r'delAssort_(\d+)', 'delAssort'), (r'delBrand_(\d+)', 'delBrand'), (r'delItem_(\d+)', 'delItem'),
+    (r'delComplete_(\d+)', 'delComplete'), (r'delAlternate_(\d+)', 'delAlternate'),
+    (r'delSingle_(\d+)', 'delSingle'),
+]]
+
+
+def pack(action, *args):
+    """Собирает callback_data из действия и аргументов."""
+    return SEPARATOR.join((action,) + tuple(map(str, args)))
+
+
+async def payload_ref(payload):
+    """
+    Сохраняет данные payload (NamedTuple) на стороне бота и возвращает первый аргумент callback_data
+    со ссылкой на них. Одна ссылка годится для нескольких кнопок: pack(action, ref, <аргументы кнопки>).
+    """
+    return PAYLOAD_MARK + await payloads.store(payload)
+
+
+async def pack_payload(action, payload, *args):
+    """Собирает callback_data со ссылкой на данные payload (NamedTuple), сохранённые на стороне бота."""
+    return pack(action, await payload_ref(payload), *args)
+
+
+def unpack(data):
+    """Разбирает callback_data на действие и список аргументов (строки)."""
+    action, *args = data.split(SEPARATOR)
+    return action, args
+
+
+def callback_args(callback_query):
+    """Аргументы из callback_data нажатой кнопки."""
+    return unpack(callback_query.data)[1]
+
+
+class _Route:
+    __slots__ = ('handler', 'states', 'with_state', 'payload')
+
+    def __init__(self, handler, state, payload):
+        self.handler = handler
+        self.payload = payload
+        # None – только вне диалога, '*' – в любом состоянии (как фильтр state в aiogram)
+        if state == '*':
+            self.states = None
+        else:
+            states = state if isinstance(state, (list, tuple, set)) else (state,)
+            self.states = {s.state if isinstance(s, State) else s for s in states}
+        self.with_state = 'state' in inspect.signature(handler).parameters
+
+    def accepts(self, current):
+        return self.states is None or current in self.states
+
+    async def load_payload(self, args):
+        """Данные кнопки: по токену или, для кнопок старого формата, из аргументов callback_data."""
+        if args and args[0].startswith(PAYLOAD_MARK):
+            return await payloads.load(args[0][len(PAYLOAD_MARK):], self.payload)
+        field_types = self.payload.__annotations__.values()
+        try:
+            return self.payload(*(field_type(arg) for field_type, arg in zip(field_types, args)))
+        except (TypeError, ValueError):
+            return None
+
+
+class CallbackRouter:
+    """Таблица действие -> обработчик."""
+
+    def __init__(self):
+        self.routes = {}
+
+    def route(self, *actions, state=None, payload=None):
+        """
+        Регистрирует обработчик на одно или несколько действий.
+
+        payload – тип (NamedTuple) данных кнопки, сохранённых через pack_payload.
+        """
+        def decorator(handler):
+            for action in actions:
+                if action in self.routes:
+                    raise ValueError(f'Действие {action!r} уже зарегистрировано')
+                self.routes[action] = _Route(handler, state, payload)
+            return handler
+        return decorator
+
+    def resolve(self, data):
+        """Обработчик для callback_data и callback_data в новом формате (None, если обработчика нет)."""
+        route = self.routes.get(unpack(data)[0])
+        if route is not None:
+            return route, data
+        for pattern, action in LEGACY:
+            match = pattern.fullmatch(data)
+            if match is not None:
+                return self.routes.get(action), pack(action, *match.groups())
+        return None, data
+
+    async def dispatch(self, callback_query: types.CallbackQuery, state: FSMContext):
+        route, data = self.resolve(callback_query.data or '')
+        if route is None or not route.accepts(await state.get_state()):
+            # Даём шанс обработчикам, зарегистрированным в dp напрямую; если их нет,
+            # на нажатие ответит StaleCallbackMiddleware
+            raise SkipHandler
+        mark_callback_handled()
+        callback_query.data = data
+        kwargs = {}
+        if route.with_state:
+            kwargs['state'] = state
+        if route.payload is not None:
+            kwargs['payload'] = await route.load_payload(callback_args(callback_query))
+            if kwargs['payload'] is None:
+                return await callback_query.answer('Кнопка устарела', show_alert=True)
+        return await route.handler(callback_query, **kwargs)
+
+
+router = CallbackRouter()
+route = router.route
+
+dp.register_callback_query_handler(router.dispatch, state='*')
+dp.middleware.setup(StaleCallbackMiddleware(router.dispatch))
@@ -0,0 +1,356 @@
+# catalog.py
+
+"""Доступ к каталогу товаров.
+
+Каталог хранится в одной таблице catalog_nodes в виде дерева:
+    уровень 0 – ассортимент, 1 – бренд, 2 – линейка (товар с фото и ценой), 3 – вкус.
+Узлы адресуются глобальным id, который используется в callback_data, в корзине (sku) и в photos.names.
+
+Всё дерево и метаданные photos держатся в памяти процесса: каталог меняется только из админки,
+поэтому навигация по нему в установившемся режиме не делает запросов к базе. Изменения каталога
+проходят через функции этого модуля, которые пишут в базу и сразу же обновляют кэш; другие процессы
+сбрасывают свой кэш по сообщению cache_bus.
+
+Вместе с photos кэшируются file_id фото, уже загруженных в Telegram (photo_files): карточка товара
+отправляется по file_id, и Telegram не скачивает картинку заново. file_id привязан к ссылке, с которой
+фото загружено, и сбрасывается, когда ссылка меняется.
+
+Поиск (search) идёт по полнотекстовому индексу catalog_search (FTS5, строка на линейку: названия
+ассортимента, бренда, линейки, вкусов и описание). Функции изменения каталога обновляют строки
+затронутых линеек в той же транзакции. Для inline-режима есть поиск без обращения к базе
+(find_products): отсортированный список слов из названий каталога, по которому префикс ищется бинарным поиском.
+"""
+
+import bisect
+import re
+
+from db import fetchall, execute, executemany, on_rollback
+from cache_bus import CATALOG, subscribe, publish
+
+CATEGORY, BRAND, PRODUCT, FLAVOR = range(4)
+
+# Сколько линеек возвращает поиск; веса колонок индекса в ранжировании bm25
+# (ассортимент, бренд, линейка, вкусы, описание)
+SEARCH_LIMIT = 10
+SEARCH_WEIGHTS = (1.0, 4.0, 5.0, 3.0, 1.0)
+
+
+class CatalogCache:
+    """Дерево каталога и данные photos в памяти со счётчиками попаданий и промахов."""
+
+    def __init__(self):
+        self.loaded = False
+        self.nodes = {}      # id -> (parent_id, level, name, position)
+        self.children = {}   # parent_id -> [id, ...] в порядке position
+        self.photos = {}     # id линейки -> (photos, desc, price)
+        self.files = {}      # id линейки -> (ссылка, file_id)
+        # Префиксный индекс для find_products: (слова по возрастанию, id линеек) и линейки по названию.
+        # Строится при первом поиске после изменения дерева
+        self.words = None
+        self.titles = None
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        # Растёт при каждом изменении дерева и каждой загрузке из базы (см. version)
+        self.version = 0
+
+    def fill(self, nodes, photos, files):
+        self.nodes = {}
+        self.children = {}
+        for node_id, parent_id, level, name, position in nodes:
+            self.nodes[node_id] = (parent_id, level, name, position)
+            self.children.setdefault(parent_id, []).append(node_id)
+        for siblings in self.children.values():
+            siblings.sort(key=lambda node_id: (self.nodes[node_id][3], node_id))
+        self.photos = {int(names): (photo, desc, price) for names, photo, desc, price in photos if str(names).isdigit()}
+        self.files = {product_id: (url, file_id) for product_id, url, file_id in files}
+        self.words = self.titles = None
+        self.version += 1
+        self.loaded = True
+        self.loads += 1
+
+    def add(self, node_id, parent_id, level, name, position):
+        self.nodes[node_id] = (parent_id, level, name, position)
+        self.children.setdefault(parent_id, []).append(node_id)
+        self.words = self.titles = None
+        self.version += 1
+
+    def remove(self, node_ids):
+        for node_id in node_ids:
+            parent_id = self.nodes.pop(node_id)[0]
+            siblings = self.children.get(parent_id)
+            if siblings is not None and node_id in siblings:
+                siblings.remove(node_id)
+            self.children.pop(node_id, None)
+            self.photos.pop(node_id, None)
+            self.files.pop(node_id, None)
+        self.words = self.titles = None
+        self.version += 1
+
+    def title(self, product_id):
+        """Название линейки для списков: "бренд линейка"."""
+        parent_id, _, name, _ = self.nodes[product_id]
+        brand = self.nodes.get(parent_id)
+        return f'{brand[2]} {name}' if brand is not None else name
+
+    def build_words(self):
+        """Строит префиксный индекс: слова названий ассортимента, бренда, линейки и вкусов каждой линейки."""
+        products = [node_id for node_id, node in self.nodes.items() if node[1] == PRODUCT]
+        self.titles = sorted(((self.title(node_id), node_id) for node_id in products), key=lambda item: item[0].lower())
+        pairs = set()
+        for product_id in products:
+            names = [self.nodes[child][2] for child in self.children.get(product_id, ())]
+            node_id = product_id
+            while node_id in self.nodes:
+                names.append(self.nodes[node_id][2])
+                node_id = self.nodes[node_id][0]
+            pairs.update((word, product_id) for name in names for word in _words(name))
+        pairs = sorted(pairs)
+        self.words = ([word for word, _ in pairs], [product_id for _, product_id in pairs])
+
+    def subtree(self, node_id):
+        ids = [node_id]
+        for current in ids:
+            ids.extend(self.children.get(current, ()))
+        return ids
+
+
+def _words(text):
+    """Слова текста в нижнем регистре, ё приравнивается к е."""
+    return re.findall(r'\w+', text.lower().replace('ё', 'е'))
+
+
+_cache = CatalogCache()
+
+
+async def _tree():
+    """Возвращает загруженный кэш, при промахе читая каталог из базы тремя запросами."""
+    if _cache.loaded:
+        _cache.hits += 1
+        return _cache
+    _cache.misses += 1
+    nodes = await fetchall('SELECT id, parent_id, level, name, position FROM catalog_nodes')
+    photos = await fetchall('SELECT names, photos, desc, price FROM photos')
+    files = await fetchall('SELECT product_id, url, file_id FROM photo_files')
+    _cache.fill(nodes, photos, files)
+    return _cache
+
+
+@on_rollback
+@subscribe(CATALOG)
+def invalidate():
+    """Сбрасывает кэш: следующее обращение перечитает каталог из базы."""
+    _cache.loaded = False
+
+
+def stats():
+    """Счётчики кэша каталога: попадания, промахи, полные загрузки и число узлов."""
+    return {'hits': _cache.hits, 'misses': _cache.misses, 'loads': _cache.loads, 'nodes': len(_cache.nodes)}
+
+
+async def version():
+    """
+    Версия дерева каталога в этом процессе: меняется при добавлении и удалении узлов и при перечитывании
+    каталога из базы (в том числе после изменения в другом процессе). Пока версия та же, ни один узел не удалён.
+    """
+    return (await _tree()).version
+
+
+async def get_children(parent_id):
+    """Возвращает дочерние узлы [(id, name), ...] в порядке position. parent_id=None – список ассортиментов."""
+    tree = await _tree()
+    return [(node_id, tree.nodes[node_id][2]) for node_id in tree.children.get(parent_id, ())]
+
+
+async def get_node(node_id):
+    """Возвращает (id, parent_id, level, name) или None, если узла нет."""
+    tree = await _tree()
+    node = tree.nodes.get(node_id)
+    if node is None:
+        return None
+    return (node_id,) + node[:3]
+
+
+async def resolve_path(node_id):
+    """Возвращает цепочку [(id, level, name), ...] от ассортимента до узла включительно."""
+    tree = await _tree()
+    path = []
+    while node_id is not None and node_id in tree.nodes:
+        parent_id, level, name, _ = tree.nodes[node_id]
+        path.append((node_id, level, name))
+        node_id = parent_id
+    path.reverse()
+    return path
+
+
+async def resolve_names(node_id):
+    """Возвращает названия всех предков узла и самого узла, начиная с ассортимента."""
+    return [name for _, _, name in await resolve_path(node_id)]
+
+
+async def find_child(parent_id, name):
+    """Ищет дочерний узел по названию и возвращает его id или None."""
+    tree = await _tree()
+    for node_id in tree.children.get(parent_id, ()):
+        if tree.nodes[node_id][2] == name:
+            return node_id
+    return None
+
+
+async def get_photo(product_id):
+    """Возвращает (photos, desc, price) линейки или None, если данных нет."""
+    tree = await _tree()
+    return tree.photos.get(product_id)
+
+
+async def get_file_id(product_id, url):
+    """Возвращает file_id фото линейки, загруженного по ссылке url, или None."""
+    tree = await _tree()
+    cached = tree.files.get(product_id)
+    return cached[1] if cached is not None and cached[0] == url else None
+
+
+async def save_file_id(product_id, url, file_id):
+    """
+    Запоминает file_id фото линейки, загруженного по ссылке url, или забывает его (file_id=None).
+
+    Изменение не публикуется другим процессам: каждый процесс получает file_id при первой отправке фото.
+    """
+    tree = await _tree()
+    if file_id is None:
+        if tree.files.pop(product_id, None) is not None:
+            await execute('DELETE FROM photo_files WHERE product_id = ?', (product_id,))
+        return
+    await execute('INSERT OR REPLACE INTO photo_files (product_id, url, file_id) VALUES (?, ?, ?)', (product_id, url, file_id))
+    tree.files[product_id] = (url, file_id)
+
+
+async def _reindex(tree, product_ids):
+    """Перезаписывает строки поискового индекса линеек по данным кэша; линеек, которых нет в кэше, – удаляет."""
+    rows = []
+    for product_id in product_ids:
+        node = tree.nodes.get(product_id)
+        if node is None:
+            continue
+        brand = tree.nodes.get(node[0])
+        category = tree.nodes.get(brand[0]) if brand is not None else None
+        photo = tree.photos.get(product_id)
+        rows.append((
+            product_id,
+            category[2] if category is not None else '',
+            brand[2] if brand is not None else '',
+            node[2],
+            ' '.join(tree.nodes[child][2] for child in tree.children.get(product_id, ())),
+            photo[1] if photo is not None and photo[1] else ''
+        ))
+    await executemany('DELETE FROM catalog_search WHERE rowid = ?', [(product_id,) for product_id in product_ids])
+    if rows:
+        await executemany(
+            'INSERT INTO catalog_search (rowid, category, brand, line, flavors, desc) VALUES (?, ?, ?, ?, ?, ?)', rows
+        )
+
+
+async def search(text, limit=SEARCH_LIMIT):
+    """
+    Ищет линейки по словам из text (каждое слово – префикс) и возвращает [(id линейки, "бренд линейка"), ...]
+    от наиболее подходящих. Поиск – один запрос к индексу, названия берутся из кэша.
+    """
+    terms = re.findall(r'\w+', text.lower())
+    if not terms:
+        return []
+    query = ' '.join(f'"{term}"*' for term in terms)
+    weights = ', '.join(map(str, SEARCH_WEIGHTS))
+    rows = await fetchall(
+        f'SELECT rowid FROM catalog_search WHERE catalog_search MATCH ? ORDER BY bm25(catalog_search, {weights}) LIMIT ?',
+        (query, limit)
+    )
+    tree = await _tree()
+    return [(product_id, tree.title(product_id)) for (product_id,) in rows if product_id in tree.nodes]
+
+
+async def find_products(text):
+    """
+    Ищет линейки, у которых для каждого слова text есть начинающееся с него слово в названиях ассортимента,
+    бренда, линейки или вкусов. Возвращает [(id линейки, "бренд линейка"), ...] по алфавиту;
+    пустой text – все линейки. Запросов к базе нет: индекс строится из кэша каталога.
+    """
+    tree = await _tree()
+    if tree.words is None:
+        tree.build_words()
+    found = None
+    for term in _words(text):
+        words, ids = tree.words
+        matched = set()
+        index = bisect.bisect_left(words, term)
+        while index < len(words) and words[index].startswith(term):
+            matched.add(ids[index])
+            index += 1
+        found = matched if found is None else found & matched
+        if not found:
+            return []
+    return [(product_id, title) for title, product_id in tree.titles if found is None or product_id in found]
+
+
+async def add_node(parent_id, level, name):
+    """Добавляет узел в конец списка детей родителя и возвращает его id."""
+    tree = await _tree()
+    siblings = tree.children.get(parent_id, ())
+    position = max((tree.nodes[node_id][3] for node_id in siblings), default=0) + 1
+    node_id = await execute(
+        'INSERT INTO catalog_nodes (parent_id, level, name, position) VALUES (?, ?, ?, ?)',
+        (parent_id, level, name, position)
+    )
+    tree.add(node_id, parent_id, level, name, position)
+    if level == PRODUCT:
+        await _reindex(tree, [node_id])
+    elif level == FLAVOR:
+        await _reindex(tree, [parent_id])
+    publish(CATALOG)
+    return node_id
+
+
+async def get_or_add_child(parent_id, level, name):
+    """Возвращает id дочернего узла с указанным названием, создавая его при необходимости."""
+    node_id = await find_child(parent_id, name)
+    if node_id is None:
+        node_id = await add_node(parent_id, level, name)
+    return node_id
+
+
+async def save_photo(product_id, photo=None, desc=None, price=None):
+    """
+    Создаёт или обновляет запись photos линейки. Поля со значением None остаются без изменений.
+    """
+    tree = await _tree()
+    current = tree.photos.get(product_id)
+    if current is None:
+        record = (photo, desc, price)
+        await execute('INSERT INTO photos (names, photos, desc, price) VALUES (?, ?, ?, ?)', (str(product_id),) + record)
+    else:
+        record = tuple(new if new is not None else old for new, old in zip((photo, desc, price), current))
+        await execute('UPDATE photos SET photos=?, desc=?, price=? WHERE names=?', record + (str(product_id),))
+    tree.photos[product_id] = record
+    if current is None or record[0] != current[0]:
+        # Фото заменено: загруженное раньше больше не показывается
+        await save_file_id(product_id, record[0], None)
+    await _reindex(tree, [product_id])
+    publish(CATALOG)
+
+
+async def delete_subtree(node_id):
+    """Удаляет узел вместе со всеми потомками и их фото. Если узла уже нет, ничего не делает."""
+    tree = await _tree()
+    if node_id not in tree.nodes:
+        return
+    ids = tree.subtree(node_id)
+    # Строки индекса удалённых линеек удаляются, у линейки удалённого вкуса – перезаписываются
+    products = [i for i in ids if tree.nodes[i][1] == PRODUCT]
+    if tree.nodes[node_id][1] == FLAVOR:
+        products.append(tree.nodes[node_id][0])
+    placeholders = ','.join('?' * len(ids))
+    await execute(f'DELETE FROM photos WHERE names IN ({placeholders})', [str(i) for i in ids])
+    await execute(f'DELETE FROM photo_files WHERE product_id IN ({placeholders})', ids)
+    await execute(f'DELETE FROM catalog_nodes WHERE id IN ({placeholders})', ids)
+    tree.remove(ids)
+    await _reindex(tree, products)
+    publish(CATALOG)
@@ -7,4 +7,63 @@ load_dotenv()  # Читает файл .env
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_IDS = set(map(int, os.getenv('ADMIN_IDS').split(',')))
-DB_NAME = 'Products.db'
\ No newline at end of file
+DB_NAME = os.getenv('DB_NAME', 'Products.db')
+# Окно группового commit в миллисекундах: апдейты, завершившиеся в пределах окна, фиксируются одним fsync.
+# 0 – каждый апдейт фиксируется сразу.
+GROUP_COMMIT_DELAY = float(os.getenv('GROUP_COMMIT_DELAY', '5'))
+
+# WAL: уровень PRAGMA synchronous для писателя (NORMAL достаточно для WAL, FULL – fsync на каждый commit),
+# порог автоматического checkpoint в страницах (0 – отключить), периодический checkpoint
+# раз в CHECKPOINT_INTERVAL секунд (0 – отключить) и его режим (PASSIVE, FULL, RESTART, TRUNCATE).
+SYNCHRONOUS = os.getenv('SYNCHRONOUS', 'NORMAL')
+WAL_AUTOCHECKPOINT = int(os.getenv('WAL_AUTOCHECKPOINT', '1000'))
+CHECKPOINT_INTERVAL = float(os.getenv('CHECKPOINT_INTERVAL', '0'))
+CHECKPOINT_MODE = os.getenv('CHECKPOINT_MODE', 'PASSIVE')
+# Сколько миллисекунд соединение ждёт блокировку базы, занятую другим процессом (WORKERS > 1),
+# прежде чем получить "database is locked".
+BUSY_TIMEOUT = int(os.getenv('BUSY_TIMEOUT', '30000'))
+# Число соединений только для чтения
+READ_POOL_SIZE = int(os.getenv('READ_POOL_SIZE', '4'))
+
+# Рассылки: число параллельных отправок (скорость ограничивает OUTBOX_RATE), размер порции получателей,
+# читаемой из базы, и минимальный интервал обновления прогресса в секундах.
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '10'))
+BROADCAST_CHUNK = int(os.getenv('BROADCAST_CHUNK', '500'))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv('BROADCAST_PROGRESS_INTERVAL', '5'))
+
+# Очередь исходящих сообщений: общий лимит в секунду (глобальный лимит Telegram ~30, делится между воркерами),
+# лимит на один чат (в секунду и всплеск) и число параллельных исполнителей.
+OUTBOX_RATE = float(os.getenv('OUTBOX_RATE', '30'))
+OUTBOX_CHAT_RATE = float(os.getenv('OUTBOX_CHAT_RATE', '1'))
+OUTBOX_CHAT_BURST = int(os.getenv('OUTBOX_CHAT_BURST', '3'))
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', '8'))
+
+# Уведомления о заказах: при потоке заказов администраторам уходит сводка не чаще раза
+# в ORDER_DIGEST_INTERVAL секунд или сразу после ORDER_DIGEST_SIZE накопившихся заказов.
+ORDER_DIGEST_INTERVAL = float(os.getenv('ORDER_DIGEST_INTERVAL', '10'))
+ORDER_DIGEST_SIZE = int(os.getenv('ORDER_DIGEST_SIZE', '20'))
+
+# Режим получения апдейтов: polling или webhook. SKIP_UPDATES=1 – пропускать апдейты, накопившиеся за время простоя.
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+SKIP_UPDATES = os.getenv('SKIP_UPDATES', '0') == '1'
+# Webhook: внешний адрес (https://host[:port]), путь, секретный токен (заголовок X-Telegram-Bot-Api-Secret-Token),
+# адрес встроенного aiohttp-сервера и число апдейтов, обрабатываемых одновременно.
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', '8080'))
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv('WEBHOOK_MAX_CONCURRENCY', '40'))
+
+# Состояния диалогов (FSM): сколько состояний держать в памяти, раз в сколько секунд записывать изменения
+# в базу и через сколько секунд без действий брошенный диалог удаляется.
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', '10000'))
+FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL', '1'))
+FSM_TTL = int(os.getenv('FSM_TTL', '86400'))
+# Число процессов-воркеров: больше 1 – апдейты принимает один процесс и распределяет по воркерам по id пользователя.
+WORKERS = int(os.getenv('WORKERS', '1'))
+# Данные inline-кнопок на стороне бота (payloads.py): сколько токенов держать в памяти и сколько секунд живёт кнопка.
+PAYLOAD_CACHE_SIZE = int(os.getenv('PAYLOAD_CACHE_SIZE', '10000'))
+PAYLOAD_TTL = int(os.getenv('PAYLOAD_TTL', '604800'))
+# Inline-режим: сколько секунд Telegram может отдавать сохранённый ответ на тот же запрос.
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '300'))
@@ -0,0 +1,49 @@
+# counters.py
+
+"""Глобальные счётчики главного меню: активные акции, опубликованные и ожидающие модерации отзывы.
+
+Значения считаются один раз и дальше хранятся в памяти. Обработчики, меняющие таблицы
+sales, otz и feedbacks, сразу корректируют счётчик (adjust) или пересчитывают его (refresh),
+поэтому построение меню не делает запросов count(*). Другие процессы сбрасывают свои значения
+по сообщению cache_bus.
+"""
+
+from db import fetchone, on_rollback
+from cache_bus import COUNTERS, subscribe, publish
+
+SALES, OTZ, FEEDBACKS = 'sales', 'otz', 'feedbacks'
+
+_QUERIES = {
+    SALES: 'SELECT count(*) FROM sales',
+    OTZ: 'SELECT count(*) FROM otz',
+    FEEDBACKS: 'SELECT count(*) FROM feedbacks',
+}
+
+_values = {}
+
+
+async def get(name):
+    """Возвращает значение счётчика, при первом обращении считая его по базе."""
+    if name not in _values:
+        _values[name] = (await fetchone(_QUERIES[name]))[0]
+    return _values[name]
+
+
+async def refresh(name):
+    """Пересчитывает счётчик по базе (используется после массовых удалений)."""
+    _values[name] = (await fetchone(_QUERIES[name]))[0]
+    publish(COUNTERS)
+
+
+def adjust(name, delta):
+    """Изменяет счётчик на известную величину после вставки или удаления строк."""
+    if name in _values:
+        _values[name] += delta
+    publish(COUNTERS)
+
+
+@on_rollback
+@subscribe(COUNTERS)
+def invalidate():
+    """Сбрасывает все счётчики: следующее обращение пересчитает их по базе."""
+    _values.clear()
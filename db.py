@@ -1,31 +1,401 @@
 # db.py
 
+"""Асинхронный слой доступа к базе данных.
+
+База работает в режиме WAL. Все изменения идут через одно соединение-писатель, которое
+обслуживает выделенный поток. Чтение идёт через пул потоков, у каждого из которых своё
+соединение только для чтения, поэтому каталог и корзина доступны во время оформления заказа
+и массовых правок из админки. Корутины обработчиков ждут результат через run_in_executor,
+поэтому медленный запрос или fsync при commit не останавливают event loop aiogram.
+
+Изменения одного апдейта выполняются как единица работы (unit_of_work): первая запись
+захватывает блокировку записи и открывает SAVEPOINT, при исключении изменения апдейта
+откатываются, при успехе фиксируются одним commit. Если задан GROUP_COMMIT_DELAY, commit
+нескольких апдейтов, завершившихся в пределах этой задержки, объединяется в один.
+Чтения единицы работы после её первой записи идут через писателя и видят её изменения.
+Запись вне единицы работы фиксируется сразу.
+
+Блокировка записи не держится во время обращений к Telegram: перед запросом к Bot API
+(bot.WebhookBot.request) участок записи завершается (end_write_section) – изменения, сделанные
+до запроса, фиксируются, блокировка и транзакция освобождаются, а следующая запись апдейта
+открывает новый участок. Исключение обработчика откатывает только последний участок.
+"""
+
+import asyncio
+import contextvars
+import itertools
+import logging
 import sqlite3
-from config import DB_NAME
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from config import (DB_NAME, GROUP_COMMIT_DELAY, READ_POOL_SIZE, SYNCHRONOUS, WAL_AUTOCHECKPOINT,
+                    CHECKPOINT_INTERVAL, CHECKPOINT_MODE, BUSY_TIMEOUT)
+from migrations import migrate
+
+log = logging.getLogger(__name__)
+
+# Соединение-писатель. Опция check_same_thread=False нужна, так как соединение используется из потока БД.
+connection = sqlite3.connect(DB_NAME, check_same_thread=False)
+connection.execute('PRAGMA journal_mode=WAL')
+connection.execute(f'PRAGMA synchronous={SYNCHRONOUS}')
+connection.execute(f'PRAGMA wal_autocheckpoint={int(WAL_AUTOCHECKPOINT)}')
+connection.execute(f'PRAGMA busy_timeout={int(BUSY_TIMEOUT)}')
+
+# Один поток на писателя: sqlite3 не допускает параллельной работы с одним соединением.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db')
+
+# Пул читателей: у каждого потока своё соединение только для чтения, открываемое при первом запросе.
+_read_executor = ThreadPoolExecutor(max_workers=READ_POOL_SIZE, thread_name_prefix='db-read')
+_reader = threading.local()
+_readers = []
+_trace_callback = None
+
+
+def _read_connection():
+    conn = getattr(_reader, 'connection', None)
+    if conn is None:
+        conn = sqlite3.connect(Path(DB_NAME).absolute().as_uri() + '?mode=ro', uri=True, check_same_thread=False)
+        conn.set_trace_callback(_trace_callback)
+        _reader.connection = conn
+        _readers.append(conn)
+    return conn
+
+
+def set_trace_callback(callback):
+    """Устанавливает трассировку запросов на писателя и все соединения пула чтения."""
+    global _trace_callback
+    _trace_callback = callback
+    for conn in [connection] + _readers:
+        conn.set_trace_callback(callback)
 
-# Подключение к базе. Опция check_same_thread=False помогает при использовании одного соединения в разных частях бота.
-db = sqlite3.connect(DB_NAME, check_same_thread=False)
-cursor = db.cursor()
 
 def init_db():
-    # Создаем таблицы, если их нет
-    cursor.execute('CREATE TABLE IF NOT EXISTS "Ассортимент🗂" (tastes TEXT, id INTEGER PRIMARY KEY)')
-    cursor.execute('CREATE TABLE IF NOT EXISTS photos (names TEXT, photos TEXT, desc TEXT, price TEXT)')
-    cursor.execute('CREATE TABLE IF NOT EXISTS sales (positions TEXT, desc TEXT, id INTEGER PRIMARY KEY)')
-    cursor.execute('CREATE TABLE IF NOT EXISTS feedbacks (chat INTEGER, message INTEGER, product TEXT)')
-    cursor.execute('CREATE TABLE IF NOT EXISTS otz (chat INTEGER, message INTEGER, product TEXT)')
-    cursor.execute('CREATE TABLE IF NOT EXISTS users (user_id INTEGER, history TEXT DEFAULT NULL, first_client INTEGER DEFAULT 1, first_pressed INTEGER DEFAULT 0, spend INTEGER DEFAULT 0, start INTEGER DEFAULT NULL, product TEXT DEFAULT NULL, ban INTEGER DEFAULT 0)')
-    db.commit()
-
-init_db()
-
-def get_table_name(code: str) -> str:
-    return '_'.join(code.split('_')[:-1])
-
-def decrypt_code(code: str) -> str:
-    base_code = get_table_name(code)
-    code_id = code.split('_')[-1]
-    return cursor.execute(
-        'SELECT tastes FROM "{}" WHERE id=?'.format(base_code),
-        (code_id,)
-    ).fetchone()[0]
+    """Приводит схему базы к актуальной версии. Вызывается один раз при запуске бота."""
+    return migrate(connection)
+
+
+def _fetchone(conn, sql, params):
+    cur = conn.cursor()
+    try:
+        return cur.execute(sql, params).fetchone()
+    finally:
+        cur.close()
+
+
+def _fetchall(conn, sql, params):
+    cur = conn.cursor()
+    try:
+        return cur.execute(sql, params).fetchall()
+    finally:
+        cur.close()
+
+
+def _reader_fetchone(sql, params):
+    return _fetchone(_read_connection(), sql, params)
+
+
+def _reader_fetchall(sql, params):
+    return _fetchall(_read_connection(), sql, params)
+
+
+def _begin_savepoint(name):
+    # SAVEPOINT вне транзакции сам открывает её и фиксирует при RELEASE, поэтому сначала явный BEGIN.
+    # IMMEDIATE сразу берёт блокировку записи: при нескольких процессах (sharding.py) транзакция ждёт
+    # чужую запись до BUSY_TIMEOUT, а не получает SQLITE_BUSY при первой записи после чтения.
+    # Транзакция закрывается до запросов к Bot API (end_write_section), поэтому ждать приходится
+    # только чужие запросы к базе, а не ответы Telegram.
+    # Возвращает True, если транзакцию открыл этот SAVEPOINT.
+    began = not connection.in_transaction
+    if began:
+        connection.execute('BEGIN IMMEDIATE')
+    connection.execute(f'SAVEPOINT {name}')
+    return began
+
+
+def _release_savepoint(name):
+    connection.execute(f'RELEASE {name}')
+
+
+def _rollback_savepoint(name, whole_transaction):
+    if whole_transaction:
+        # В транзакции нет чужих изменений – закрываем её целиком, чтобы не держать пустой BEGIN
+        connection.rollback()
+        return
+    connection.execute(f'ROLLBACK TO {name}')
+    connection.execute(f'RELEASE {name}')
+
+
+def _autocommit(func, *args):
+    result = func(*args)
+    connection.commit()
+    return result
+
+
+def _checkpoint(mode):
+    return connection.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+
+
+def _execute(sql, params):
+    cur = connection.cursor()
+    try:
+        cur.execute(sql, params)
+        return cur.lastrowid
+    finally:
+        cur.close()
+
+
+def _executemany(sql, seq_of_params):
+    cur = connection.cursor()
+    try:
+        cur.executemany(sql, seq_of_params)
+        return cur.rowcount
+    finally:
+        cur.close()
+
+
+async def _run(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, func, *args)
+
+
+async def _read(reader_func, writer_func, sql, params):
+    uow = current_unit_of_work()
+    if uow is not None and uow.savepoint is not None:
+        # Единица работы уже пишет: читаем через писателя, чтобы видеть собственные изменения
+        return await _run(writer_func, connection, sql, params)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_read_executor, reader_func, sql, params)
+
+
+_uow_ids = itertools.count(1)
+_current_uow = contextvars.ContextVar('unit_of_work', default=None)
+_rollback_hooks = []
+_lock = asyncio.Lock()
+
+
+def _write_lock():
+    """Блокировка записи: в каждый момент пишет одна единица работы (или одна запись вне неё)."""
+    return _lock
+
+
+def on_rollback(func):
+    """Регистрирует функцию, которая вызывается после отката (сброс кэшей, заполненных в транзакции)."""
+    _rollback_hooks.append(func)
+    return func
+
+
+def _after_rollback():
+    for func in _rollback_hooks:
+        func()
+
+
+class UnitOfWork:
+    """Изменения одного апдейта: SAVEPOINT в общей транзакции соединения на каждый участок записи."""
+
+    def __init__(self):
+        # Единица работы принадлежит задаче, которая её открыла: задачи, запущенные из обработчика,
+        # копируют контекст, но пишут уже вне неё
+        self.task = asyncio.current_task()
+        self.savepoint = None
+        self.began_transaction = False
+        self.failed = False
+        self.callbacks = []
+
+    async def _begin_write(self):
+        if self.savepoint is None:
+            await _write_lock().acquire()
+            name = f'uow_{next(_uow_ids)}'
+            try:
+                self.began_transaction = await _run(_begin_savepoint, name)
+            except BaseException:
+                _write_lock().release()
+                raise
+            self.savepoint = name
+
+    async def complete(self):
+        """
+        Сливает SAVEPOINT участка записи в общую транзакцию, дожидается её фиксации
+        и вызывает функции, зарегистрированные через after_commit.
+        """
+        if self.savepoint is None:
+            return
+        try:
+            await _run(_release_savepoint, self.savepoint)
+            if not GROUP_COMMIT_DELAY:
+                await _run(connection.commit)
+        finally:
+            self.savepoint = None
+            _write_lock().release()
+        if GROUP_COMMIT_DELAY:
+            await _group_commit.wait()
+        self._run_callbacks()
+
+    def _run_callbacks(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for func in callbacks:
+            func()
+
+    async def rollback(self):
+        """Откатывает изменения апдейта, не трогая изменения других апдейтов в общей транзакции."""
+        if self.savepoint is None:
+            return
+        try:
+            await _run(_rollback_savepoint, self.savepoint, self.began_transaction)
+        finally:
+            self.savepoint = None
+            _write_lock().release()
+            _after_rollback()
+
+
+class _GroupCommit:
+    """Объединяет commit единиц работы, завершившихся в пределах GROUP_COMMIT_DELAY миллисекунд."""
+
+    def __init__(self):
+        self.pending = None
+        self.waiters = 0
+
+    async def wait(self):
+        if self.pending is None:
+            self.pending = asyncio.get_running_loop().create_future()
+            asyncio.create_task(self._flush(self.pending))
+        self.waiters += 1
+        await asyncio.shield(self.pending)
+
+    async def _flush(self, future):
+        await asyncio.sleep(GROUP_COMMIT_DELAY / 1000)
+        async with _write_lock():
+            self.pending, waiters, self.waiters = None, self.waiters, 0
+            try:
+                await _run(connection.commit)
+            except Exception as e:
+                await _run(connection.rollback)
+                _after_rollback()
+                future.set_exception(e)
+            else:
+                future.set_result(waiters)
+        log.debug('Групповой commit: %s апдейтов', waiters)
+
+
+_group_commit = _GroupCommit()
+
+
+def current_unit_of_work():
+    """Возвращает единицу работы текущей задачи или None."""
+    uow = _current_uow.get()
+    if uow is not None and uow.task is asyncio.current_task():
+        return uow
+    return None
+
+
+def begin_unit_of_work():
+    """Открывает единицу работы в текущей задаче. Возвращает её и токен для end_unit_of_work."""
+    uow = UnitOfWork()
+    return uow, _current_uow.set(uow)
+
+
+async def end_unit_of_work(uow, token):
+    """Фиксирует единицу работы (или откатывает, если она помечена failed) и закрывает её."""
+    try:
+        if uow.failed:
+            await uow.rollback()
+        else:
+            await uow.complete()
+            # Функции after_commit единицы работы без записей после последнего участка
+            uow._run_callbacks()
+    finally:
+        _current_uow.reset(token)
+
+
+async def end_write_section():
+    """
+    Фиксирует изменения текущей единицы работы, сделанные к этому моменту, и освобождает блокировку записи.
+    Вызывается перед обращением к сети, чтобы другие апдейты не ждали ответа Telegram.
+    """
+    uow = current_unit_of_work()
+    if uow is not None and not uow.failed:
+        await uow.complete()
+
+
+def after_commit(func):
+    """
+    Вызывает func после фиксации изменений текущей единицы работы (при откате – не вызывает):
+    при завершении её участка записи или самой единицы работы.
+    Вне единицы работы записи уже зафиксированы, и func вызывается сразу.
+    """
+    uow = current_unit_of_work()
+    if uow is None:
+        func()
+    else:
+        uow.callbacks.append(func)
+
+
+@asynccontextmanager
+async def unit_of_work():
+    """Контекст, в котором все изменения фиксируются одним commit или откатываются при исключении."""
+    uow, token = begin_unit_of_work()
+    try:
+        yield uow
+    except BaseException:
+        uow.failed = True
+        await end_unit_of_work(uow, token)
+        raise
+    await end_unit_of_work(uow, token)
+
+
+async def _write(func, *args):
+    uow = current_unit_of_work()
+    if uow is not None:
+        await uow._begin_write()
+        return await _run(func, *args)
+    # Запись вне единицы работы не должна попасть в чужой SAVEPOINT и фиксируется сразу,
+    # чтобы её видели читатели из пула
+    async with _write_lock():
+        return await _run(_autocommit, func, *args)
+
+
+async def fetchone(sql: str, params=()):
+    """Выполняет запрос и возвращает первую строку результата (или None)."""
+    return await _read(_reader_fetchone, _fetchone, sql, params)
+
+
+async def fetchall(sql: str, params=()):
+    """Выполняет запрос и возвращает все строки результата."""
+    return await _read(_reader_fetchall, _fetchall, sql, params)
+
+
+async def execute(sql: str, params=()):
+    """Выполняет изменяющий запрос и возвращает lastrowid."""
+    return await _write(_execute, sql, params)
+
+
+async def executemany(sql: str, seq_of_params):
+    """Выполняет запрос для каждого набора параметров и возвращает число затронутых строк."""
+    return await _write(_executemany, sql, seq_of_params)
+
+
+async def commit():
+    """
+    Фиксирует текущую транзакцию писателя. Внутри единицы работы ничего не делает:
+    её изменения фиксируются один раз при завершении апдейта.
+    """
+    if current_unit_of_work() is not None:
+        return
+    async with _write_lock():
+        await _run(connection.commit)
+
+
+async def checkpoint(mode=CHECKPOINT_MODE):
+    """Переносит журнал WAL в основной файл базы. Возвращает (busy, log, checkpointed)."""
+    async with _write_lock():
+        return await _run(_checkpoint, mode)
+
+
+async def checkpoint_loop():
+    """Периодический checkpoint раз в CHECKPOINT_INTERVAL секунд (запускается при старте бота)."""
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL)
+        busy, wal_pages, checkpointed = await checkpoint()
+        log.debug('Checkpoint %s: %s из %s страниц WAL', CHECKPOINT_MODE, checkpointed, wal_pages)
@@ -0,0 +1,179 @@
+# fsm_storage.py
+
+"""Хранилище состояний диалогов (FSM) aiogram в базе данных.
+
+Состояния FSMAdmin, FSMFeedback, FSMSale, FSMBroadcast и других диалогов хранятся в таблице fsm_states,
+поэтому перезапуск бота не обрывает начатые диалоги. В памяти держится не больше FSM_CACHE_SIZE
+последних использованных состояний (LRU, включая пустые – чтобы не читать базу на каждый апдейт
+пользователя без диалога). Изменения записываются в базу отложенно (write-behind): не чаще раза
+в FSM_FLUSH_INTERVAL секунд одним executemany, а также при остановке бота (close).
+Диалог, к которому не возвращались FSM_TTL секунд, считается брошенным и удаляется.
+"""
+
+import asyncio
+import itertools
+import collections
+import copy
+import json
+import logging
+import time
+
+from aiogram.dispatcher.storage import BaseStorage
+
+from config import FSM_CACHE_SIZE, FSM_FLUSH_INTERVAL, FSM_TTL
+from db import fetchone, executemany, execute
+
+log = logging.getLogger(__name__)
+
+# Как часто удалять из базы брошенные диалоги, которые никто не прочитал (секунды)
+SWEEP_INTERVAL = 60
+
+
+class _Record:
+    __slots__ = ('state', 'data', 'bucket', 'updated')
+
+    def __init__(self, state=None, data=None, bucket=None, updated=0):
+        self.state = state
+        self.data = data if data is not None else {}
+        self.bucket = bucket if bucket is not None else {}
+        self.updated = updated
+
+    def empty(self):
+        return self.state is None and not self.data and not self.bucket
+
+    def clear(self):
+        self.state, self.data, self.bucket = None, {}, {}
+
+
+class SQLiteStorage(BaseStorage):
+    """Состояния диалогов в таблице fsm_states с LRU-кэшем и отложенной записью."""
+
+    def __init__(self, cache_size=FSM_CACHE_SIZE):
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()  # (chat, user) -> _Record
+        self.dirty = set()                      # ключи, изменения которых ещё не записаны в базу
+        self.loop = None
+        self.timer = None
+        self.swept = time.time()
+
+    def _key(self, chat, user):
+        return tuple(map(str, self.check_address(chat=chat, user=user)))
+
+    async def _get(self, chat, user):
+        key = self._key(chat, user)
+        record = self.cache.get(key)
+        if record is None:
+            row = await fetchone('SELECT state, data, bucket, updated_at FROM fsm_states WHERE chat = ? AND user = ?', key)
+            # Пока шло чтение, состояние могли загрузить или изменить
+            record = self.cache.get(key)
+            if record is None:
+                record = _Record(row[0], json.loads(row[1]), json.loads(row[2]), row[3]) if row else _Record()
+                self.cache[key] = record
+                self._evict()
+        self.cache.move_to_end(key)
+        if not record.empty() and record.updated < time.time() - FSM_TTL:
+            # Брошенный диалог
+            record.clear()
+            self._touch(key, record)
+        return key, record
+
+    def _touch(self, key, record):
+        """Отмечает изменение состояния: запись в базу произойдёт при ближайшем flush."""
+        record.updated = int(time.time())
+        self.dirty.add(key)
+        if self.loop is not asyncio.get_running_loop():
+            self.loop, self.timer = asyncio.get_running_loop(), None
+        if self.timer is None:
+            self.timer = self.loop.call_later(FSM_FLUSH_INTERVAL, self._start_flush)
+
+    def _start_flush(self):
+        self.loop.create_task(self.flush())
+
+    def _evict(self):
+        """Вытесняет давно не использованные состояния; ещё не записанные остаются до flush."""
+        overflow = len(self.cache) - self.cache_size
+        if overflow <= 0:
+            return
+        # Обход с начала (самые старые) до overflow чистых записей, а не по всему кэшу
+        for key in list(itertools.islice((key for key in self.cache if key not in self.dirty), overflow)):
+            del self.cache[key]
+
+    async def flush(self):
+        """Записывает изменённые состояния в базу и удаляет брошенные диалоги."""
+        self.timer = None
+        keys, self.dirty = self.dirty, set()
+        upserts, deletes = [], []
+        for key in keys:
+            record = self.cache[key]
+            if record.empty():
+                deletes.append(key)
+            else:
+                upserts.append((*key, record.state, json.dumps(record.data, ensure_ascii=False),
+                                json.dumps(record.bucket, ensure_ascii=False), record.updated))
+        try:
+            if upserts:
+                await executemany(
+                    'INSERT OR REPLACE INTO fsm_states (chat, user, state, data, bucket, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                    upserts
+                )
+            if deletes:
+                await executemany('DELETE FROM fsm_states WHERE chat = ? AND user = ?', deletes)
+            if time.time() - self.swept >= SWEEP_INTERVAL:
+                self.swept = time.time()
+                await execute('DELETE FROM fsm_states WHERE updated_at < ?', (int(time.time()) - FSM_TTL,))
+        except Exception:
+            log.exception('Не удалось записать состояния диалогов')
+            self.dirty |= keys
+        self._evict()
+        if self.dirty and self.timer is None:
+            self.timer = self.loop.call_later(FSM_FLUSH_INTERVAL, self._start_flush)
+
+    async def close(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.dirty:
+            await self.flush()
+
+    async def wait_closed(self):
+        pass
+
+    async def get_state(self, *, chat=None, user=None, default=None):
+        _, record = await self._get(chat, user)
+        return record.state if record.state is not None else self.resolve_state(default)
+
+    async def get_data(self, *, chat=None, user=None, default=None):
+        _, record = await self._get(chat, user)
+        return copy.deepcopy(record.data)
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        key, record = await self._get(chat, user)
+        record.state = self.resolve_state(state)
+        self._touch(key, record)
+
+    async def set_data(self, *, chat=None, user=None, data=None):
+        key, record = await self._get(chat, user)
+        record.data = copy.deepcopy(data) if data else {}
+        self._touch(key, record)
+
+    async def update_data(self, *, chat=None, user=None, data=None, **kwargs):
+        key, record = await self._get(chat, user)
+        record.data.update(data or {}, **kwargs)
+        self._touch(key, record)
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *, chat=None, user=None, default=None):
+        _, record = await self._get(chat, user)
+        return copy.deepcopy(record.bucket)
+
+    async def set_bucket(self, *, chat=None, user=None, bucket=None):
+        key, record = await self._get(chat, user)
+        record.bucket = copy.deepcopy(bucket) if bucket else {}
+        self._touch(key, record)
+
+    async def update_bucket(self, *, chat=None, user=None, bucket=None, **kwargs):
+        key, record = await self._get(chat, user)
+        record.bucket.update(bucket or {}, **kwargs)
+        self._touch(key, record)
@@ -6,4 +6,6 @@ from . import cart
 from . import feedback
 from . import broadcast
 from . import admin
+from . import search
+from . import inline
 from . import client
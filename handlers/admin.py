@@ -10,13 +10,18 @@
 
 from aiogram import types
 from aiogram.dispatcher import FSMContext
-from aiogram.dispatcher.filters import Text
 from aiogram.types import ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.dispatcher.filters.state import State, StatesGroup
 
 from bot import dp, bot
-from db import cursor, db, decrypt_code, get_table_name
+from callbacks import route, pack, callback_args
+from db import execute, commit
+import counters
+import outbox
+from catalog import (CATEGORY, BRAND, PRODUCT, FLAVOR, get_children, get_node, get_photo, find_child,
+                     get_or_add_child, add_node, save_photo, delete_subtree, stats)
 from config import ADMIN_IDS
+from pricing import format_price, parse_price
 
 btn_back = InlineKeyboardButton('Меню', callback_data='back')
 
@@ -43,7 +48,22 @@ class FSMSale(StatesGroup):
     sale_description = State()
 
 
-@dp.callback_query_handler(text='Добавить', state=None)
+async def _find_product(data):
+    """
+    Ищет уже существующую линейку по названиям, введённым в мастере добавления.
+
+    Возвращает id линейки или None, если ассортимент, бренд или линейка ещё не созданы.
+    """
+    category_id = await find_child(None, data['category'])
+    if category_id is None:
+        return None
+    brand_id = await find_child(category_id, data['brand'])
+    if brand_id is None:
+        return None
+    return await find_child(brand_id, data['product_name'])
+
+
+@route('Добавить')
 async def handle_add_initiate(callback_query: types.CallbackQuery):
     """
     Инициализирует процесс добавления нового продукта.
@@ -51,11 +71,8 @@ async def handle_add_initiate(callback_query: types.CallbackQuery):
     Отправляет сообщение с выбором или вводом названия ассортимента.
     """
     kb = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    try:
-        for item in cursor.execute('SELECT * FROM "Ассортимент🗂"').fetchall():
-            kb.insert(item[0])
-    except Exception:
-        pass
+    for _, name in await get_children(None):
+        kb.insert(name)
     kb.add(btn_back)
     await callback_query.message.answer(
         'Введите название нового ассортимента или выберите существующий',
@@ -75,14 +92,10 @@ async def handle_admin_category(message: types.Message, state: FSMContext):
     kb = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     async with state.proxy() as data:
         data['category'] = message.text
-        try:
-            code = str(cursor.execute(
-                'SELECT id FROM "Ассортимент🗂" WHERE tastes== ?', (data["category"],)
-            ).fetchone()[0])
-            for item in cursor.execute(f'SELECT * FROM "{code}"').fetchall():
-                kb.insert(item[0])
-        except Exception:
-            pass
+        category_id = await find_child(None, data['category'])
+        if category_id is not None:
+            for _, name in await get_children(category_id):
+                kb.insert(name)
     kb.add(btn_back)
     await message.answer('Введите название нового бренда или выберите существующий', reply_markup=kb)
     await FSMAdmin.next()
@@ -98,17 +111,11 @@ async def handle_admin_brand(message: types.Message, state: FSMContext):
     async with state.proxy() as data:
         kb = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
         data['brand'] = message.text
-        try:
-            code = str(cursor.execute(
-                'SELECT id FROM "Ассортимент🗂" WHERE tastes== ?', (data["category"],)
-            ).fetchone()[0])
-            brand_code = code + '_' + str(cursor.execute(
-                'SELECT id FROM "{}" WHERE tastes== ?'.format(code), (data["brand"],)
-            ).fetchone()[0])
-            for item in cursor.execute(f'SELECT * FROM "{brand_code}"').fetchall():
-                kb.insert(item[0])
-        except Exception:
-            pass
+        category_id = await find_child(None, data['category'])
+        brand_id = await find_child(category_id, data['brand']) if category_id is not None else None
+        if brand_id is not None:
+            for _, name in await get_children(brand_id):
+                kb.insert(name)
     kb.add(btn_back)
     await FSMAdmin.next()
     await message.answer('Введите название линейки товаров', reply_markup=kb)
@@ -123,30 +130,13 @@ async def handle_admin_product_name(message: types.Message, state: FSMContext):
     """
     async with state.proxy() as data:
         data['product_name'] = message.text
-        try:
-            code = str(cursor.execute(
-                'SELECT id FROM "Ассортимент🗂" WHERE tastes== ?', (data["category"],)
-            ).fetchone()[0])
-            brand_code = code + '_' + str(cursor.execute(
-                'SELECT id FROM "{}" WHERE tastes== ?'.format(code), (data["brand"],)
-            ).fetchone()[0])
-            product_code = brand_code + '_' + str(cursor.execute(
-                'SELECT id FROM "{}" WHERE tastes== ?'.format(brand_code), (data["product_name"],)
-            ).fetchone()[0])
-            if cursor.execute(
-                'SELECT count(*) FROM photos WHERE names = ?', (product_code,)
-            ).fetchone()[0] != 0:
-                current_desc = cursor.execute(
-                    'SELECT desc FROM photos WHERE names=?', (product_code,)
-                ).fetchone()[0]
-                kb = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-                kb.add('без изменений', btn_back)
-                await message.answer('Текущее описание:\n' + current_desc, reply_markup=kb)
-            else:
-                await message.answer('Введите описание', reply_markup=ReplyKeyboardMarkup(
-                    resize_keyboard=True, row_width=2
-                ).add(btn_back))
-        except Exception:
+        product_id = await _find_product(data)
+        photo_record = await get_photo(product_id)
+        if photo_record is not None:
+            kb = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
+            kb.add('без изменений', btn_back)
+            await message.answer('Текущее описание:\n' + photo_record[1], reply_markup=kb)
+        else:
             await message.answer('Введите описание', reply_markup=ReplyKeyboardMarkup(
                 resize_keyboard=True, row_width=2
             ).add(btn_back))
@@ -162,30 +152,13 @@ async def handle_admin_description(message: types.Message, state: FSMContext):
     """
     async with state.proxy() as data:
         data['description'] = message.text
-        try:
-            code = str(cursor.execute(
-                'SELECT id FROM "Ассортимент🗂" WHERE tastes== ?', (data["category"],)
-            ).fetchone()[0])
-            brand_code = code + '_' + str(cursor.execute(
-                'SELECT id FROM "{}" WHERE tastes== ?'.format(code), (data["brand"],)
-            ).fetchone()[0])
-            product_code = brand_code + '_' + str(cursor.execute(
-                'SELECT id FROM "{}" WHERE tastes== ?'.format(brand_code), (data["product_name"],)
-            ).fetchone()[0])
-            if cursor.execute(
-                'SELECT count(*) FROM photos WHERE names = ?', (product_code,)
-            ).fetchone()[0] != 0:
-                current_price = cursor.execute(
-                    'SELECT price FROM photos WHERE names=?', (product_code,)
-                ).fetchone()[0]
-                kb = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-                kb.add('без изменений', btn_back)
-                await message.answer('Текущая цена:\n' + current_price, reply_markup=kb)
-            else:
-                await message.answer('Введите цену', reply_markup=ReplyKeyboardMarkup(
-                    resize_keyboard=True, row_width=2
-                ).add(btn_back))
-        except Exception:
+        product_id = await _find_product(data)
+        photo_record = await get_photo(product_id)
+        if photo_record is not None:
+            kb = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
+            kb.add('без изменений', btn_back)
+            await message.answer('Текущая цена:\n' + format_price(photo_record[2]), reply_markup=kb)
+        else:
             await message.answer('Введите цену', reply_markup=ReplyKeyboardMarkup(
                 resize_keyboard=True, row_width=2
             ).add(btn_back))
@@ -201,34 +174,16 @@ async def handle_admin_display_price(message: types.Message, state: FSMContext):
     """
     async with state.proxy() as data:
         data['display_price'] = message.text.replace('₽', '') + '₽'
-        try:
-            code = str(cursor.execute(
-                'SELECT id FROM "Ассортимент🗂" WHERE tastes== ?', (data["category"],)
-            ).fetchone()[0])
-            brand_code = code + '_' + str(cursor.execute(
-                'SELECT id FROM "{}" WHERE tastes== ?'.format(code), (data["brand"],)
-            ).fetchone()[0])
-            product_code = brand_code + '_' + str(cursor.execute(
-                'SELECT id FROM "{}" WHERE tastes== ?'.format(brand_code), (data["product_name"],)
-            ).fetchone()[0])
-            if cursor.execute(
-                'SELECT count(*) FROM photos WHERE names = ?', (product_code,)
-            ).fetchone()[0] != 0:
-                current_photo = cursor.execute(
-                    'SELECT photos FROM photos WHERE names=?', (product_code,)
-                ).fetchone()[0]
-                kb = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-                kb.add('без изменений', 'без фото', btn_back)
-                await message.answer(
-                    f"Текущее изображение:\n{current_photo}\nСсылка на фото для {data['product_name']}\nhttps://ibb.org.ru/?lang=ru",
-                    reply_markup=kb
-                )
-            else:
-                await message.answer(
-                    f"Введите ссылку на фото для {data['product_name']}\nhttps://ibb.org.ru/?lang=ru",
-                    reply_markup=ReplyKeyboardMarkup(resize_keyboard=True, row_width=2).add('без фото', btn_back)
-                )
-        except Exception:
+        product_id = await _find_product(data)
+        photo_record = await get_photo(product_id)
+        if photo_record is not None:
+            kb = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
+            kb.add('без изменений', 'без фото', btn_back)
+            await message.answer(
+                f"Текущее изображение:\n{photo_record[0]}\nСсылка на фото для {data['product_name']}\nhttps://ibb.org.ru/?lang=ru",
+                reply_markup=kb
+            )
+        else:
             await message.answer(
                 f"Введите ссылку на фото для {data['product_name']}\nhttps://ibb.org.ru/?lang=ru",
                 reply_markup=ReplyKeyboardMarkup(resize_keyboard=True, row_width=2).add('без фото', btn_back)
@@ -245,23 +200,13 @@ async def handle_admin_photo_url(message: types.Message, state: FSMContext):
     """
     async with state.proxy() as data:
         data['photo_url'] = message.text
-        try:
-            code = str(cursor.execute(
-                'SELECT id FROM "Ассортимент🗂" WHERE tastes== ?', (data["category"],)
-            ).fetchone()[0])
-            brand_code = code + '_' + str(cursor.execute(
-                'SELECT id FROM "{}" WHERE tastes== ?'.format(code), (data["brand"],)
-            ).fetchone()[0])
-            product_code = brand_code + '_' + str(cursor.execute(
-                'SELECT id FROM "{}" WHERE tastes== ?'.format(brand_code), (data["product_name"],)
-            ).fetchone()[0])
-            tastes_str = ''
-            for item in cursor.execute(f'SELECT tastes FROM "{product_code}"').fetchall():
-                tastes_str += item[0] + ','
+        product_id = await _find_product(data)
+        if product_id is not None:
+            tastes_str = ','.join(name for _, name in await get_children(product_id))
             kb = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
             kb.add('без изменений', btn_back)
-            await message.answer('Вкусы:\n' + tastes_str[:-1], reply_markup=kb)
-        except Exception:
+            await message.answer('Вкусы:\n' + tastes_str, reply_markup=kb)
+        else:
             await message.answer('Введите вкусы', reply_markup=ReplyKeyboardMarkup(
                 resize_keyboard=True, row_width=2
             ).add(btn_back))
@@ -274,69 +219,75 @@ async def handle_admin_price_options(message: types.Message, state: FSMContext):
     Обрабатывает ввод вариантов цены или вкусов.
     
     В зависимости от ввода:
-        - Добавляет новый ассортимент, бренд, продукт и их таблицы, если необходимо.
-        - Обновляет или добавляет информацию в таблицу photos.
-        - Добавляет варианты цены/вкусов в соответствующую таблицу.
+        - Добавляет новый ассортимент, бренд и продукт в каталог, если необходимо.
+        - Обновляет или добавляет информацию в таблицу photos (вместе с кэшем каталога).
+        - Добавляет варианты цены/вкусов дочерними узлами продукта.
     После обработки выводит итоговое сообщение с деталями созданного продукта.
     """
     async with state.proxy() as data:
         data['price_options'] = message.text
-        if cursor.execute('SELECT count(*) FROM "Ассортимент🗂" WHERE tastes = ?', (data['category'],)).fetchone()[0] == 0:
-            cursor.execute('INSERT INTO "Ассортимент🗂" (tastes) VALUES (?)', (data['category'],))
-        code = str(cursor.execute(
-            'SELECT id FROM "Ассортимент🗂" WHERE tastes== ?', (data["category"],)
-        ).fetchone()[0])
-        db.execute(f'CREATE TABLE IF NOT EXISTS "{code}" (tastes TEXT, id INTEGER PRIMARY KEY)')
-        if cursor.execute('SELECT count(*) FROM "{}" WHERE tastes = ?'.format(code), (data['brand'],)).fetchone()[0] == 0:
-            cursor.execute('INSERT INTO "{}" (tastes) VALUES (?)'.format(code), (data['brand'],))
-        brand_code = code + '_' + str(cursor.execute(
-            'SELECT id FROM "{}" WHERE tastes== ?'.format(code), (data["brand"],)
-        ).fetchone()[0])
-        db.execute(f'CREATE TABLE IF NOT EXISTS "{brand_code}" (tastes TEXT, id INTEGER PRIMARY KEY)')
-        if cursor.execute('SELECT count(*) FROM "{}" WHERE tastes = ?'.format(brand_code), (data['product_name'],)).fetchone()[0] == 0:
-            cursor.execute('INSERT INTO "{}" (tastes) VALUES (?)'.format(brand_code), (data['product_name'],))
-        product_code = brand_code + '_' + str(cursor.execute(
-            'SELECT id FROM "{}" WHERE tastes== ?'.format(brand_code), (data["product_name"],)
-        ).fetchone()[0])
-        db.execute(f'CREATE TABLE IF NOT EXISTS "{product_code}" (tastes TEXT, id INTEGER PRIMARY KEY)')
-        if cursor.execute('SELECT count(*) FROM photos WHERE names = ?', (product_code,)).fetchone()[0] == 0:
-            cursor.execute('INSERT INTO photos VALUES (?, ?, ?, ?)', (product_code, data['photo_url'], data['description'], data['display_price']))
+        category_id = await get_or_add_child(None, CATEGORY, data['category'])
+        brand_id = await get_or_add_child(category_id, BRAND, data['brand'])
+        product_id = await get_or_add_child(brand_id, PRODUCT, data['product_name'])
+        if await get_photo(product_id) is None:
+            await save_photo(product_id, data['photo_url'], data['description'], parse_price(data['display_price']))
         else:
-            if data['photo_url'] != 'без изменений':
-                cursor.execute('UPDATE photos SET photos=? WHERE names = ?', (data['photo_url'], product_code))
-            if data['description'] != 'без изменений':
-                cursor.execute('UPDATE photos SET desc=? WHERE names = ?', (data['description'], product_code))
-            if data['display_price'].replace('₽', '') != 'без изменений':
-                cursor.execute('UPDATE photos SET price=? WHERE names = ?', (data['display_price'], product_code))
+            # Значение None оставляет поле без изменений
+            await save_photo(
+                product_id,
+                photo=data['photo_url'] if data['photo_url'] != 'без изменений' else None,
+                desc=data['description'] if data['description'] != 'без изменений' else None,
+                price=parse_price(data['display_price']) if data['display_price'].replace('₽', '') != 'без изменений' else None
+            )
         if data['price_options'] != 'без изменений':
             price_str = str(data['price_options']).replace(', ', ',').replace(' , ', ',').replace(' ,', ',').replace(',,', ',')
             for price_option in price_str.split(','):
-                cursor.execute('INSERT INTO "{}" (tastes) VALUES (?)'.format(product_code), (price_option,))
-        db.commit()
-        try:
-            photo_record = cursor.execute('SELECT * FROM photos WHERE names=?', (product_code,)).fetchone()
-            tastes_str = ''
-            for item in cursor.execute(f'SELECT tastes FROM "{photo_record[0]}"').fetchall():
-                tastes_str += item[0] + ','
-            await message.answer(
-                f"*{data['product_name']}*\n{photo_record[2]}\n*со вкусами:* {tastes_str[:-1]}\n*ценой в* {photo_record[3]}\n*обновлен*[​]({photo_record[1]})",
-                parse_mode='Markdown'
-            )
-        except Exception:
-            if data['photo_url'] == 'без фото':
-                await message.answer(
-                    f"*{data['product_name']}*\n{data['description']}\n*со вкусами:* {data['price_options']}\n*ценой в* {data['display_price']}\n*создан*[​]({data['photo_url']})",
-                    parse_mode='Markdown'
-                )
-            else:
-                await message.answer(
-                    f"*{data['product_name']}*\n{data['description']}\n*со вкусами:* {data['price_options']}\n*ценой в* {data['display_price']}\n*создан*",
-                    parse_mode='Markdown'
-                )
+                await add_node(product_id, FLAVOR, price_option)
+        await commit()
+        photo_record = await get_photo(product_id)
+        tastes_str = ','.join(name for _, name in await get_children(product_id))
+        await message.answer(
+            f"*{data['product_name']}*\n{photo_record[1]}\n*со вкусами:* {tastes_str}\n*ценой в* {format_price(photo_record[2])}\n*обновлен*[​]({photo_record[0]})",
+            parse_mode='Markdown'
+        )
     await state.finish()
 
 
-@dp.callback_query_handler(text='Удалить')
+async def _show_brands(callback_query: types.CallbackQuery, category_id):
+    """Показывает бренды ассортимента с кнопками перехода к удалению."""
+    kb = InlineKeyboardMarkup(row_width=2)
+    for node_id, name in await get_children(category_id):
+        kb.insert(InlineKeyboardButton(name, callback_data=pack('delBrand', node_id)))
+    kb.add(InlineKeyboardButton('<<Назад', callback_data='Удалить'))
+    await callback_query.message.edit_text((await get_node(category_id))[3])
+    await callback_query.message.edit_reply_markup(kb)
+
+
+async def _show_products(callback_query: types.CallbackQuery, brand_id):
+    """Показывает линейки бренда и кнопку удаления всего бренда."""
+    kb = InlineKeyboardMarkup(row_width=2)
+    for node_id, name in await get_children(brand_id):
+        kb.add(InlineKeyboardButton(name, callback_data=pack('delItem', node_id)))
+    _, category_id, _, brand_name = await get_node(brand_id)
+    kb.add(InlineKeyboardButton('Удалить ' + brand_name, callback_data=pack('delComplete', brand_id)))
+    kb.add(InlineKeyboardButton('<<Назад', callback_data=pack('delAssort', category_id)))
+    await callback_query.message.edit_text(brand_name)
+    await callback_query.message.edit_reply_markup(kb)
+
+
+async def _show_flavors(callback_query: types.CallbackQuery, product_id):
+    """Показывает вкусы линейки и кнопку удаления всей линейки."""
+    kb = InlineKeyboardMarkup(row_width=2)
+    for node_id, name in await get_children(product_id):
+        kb.insert(InlineKeyboardButton(f'Удалить {name}', callback_data=pack('delSingle', node_id)))
+    _, brand_id, _, product_name = await get_node(product_id)
+    kb.add(InlineKeyboardButton('Удалить ' + product_name, callback_data=pack('delAlternate', product_id)))
+    kb.add(InlineKeyboardButton('<<Назад', callback_data=pack('delBrand', brand_id)))
+    await callback_query.message.edit_text(product_name)
+    await callback_query.message.edit_reply_markup(kb)
+
+
+@route('Удалить')
 async def handle_delete_initiate(callback_query: types.CallbackQuery):
     """
     Инициализирует процесс удаления продуктов и брендов.
@@ -344,145 +295,133 @@ async def handle_delete_initiate(callback_query: types.CallbackQuery):
     Выводит клавиатуру с ассортиментом для выбора.
     """
     kb = InlineKeyboardMarkup(row_width=2)
-    for item in cursor.execute('SELECT * FROM "Ассортимент🗂"').fetchall():
-        kb.insert(InlineKeyboardButton(item[0], callback_data=f'delAssort_{item[1]}'))
+    for node_id, name in await get_children(None):
+        kb.insert(InlineKeyboardButton(name, callback_data=pack('delAssort', node_id)))
     kb.add(btn_back)
     await callback_query.message.edit_text('Ассортимент🗂')
     await callback_query.message.edit_reply_markup(kb)
     await callback_query.answer()
 
 
-@dp.callback_query_handler(Text(startswith='delAssort_'))
+@route('delAssort')
 async def handle_delete_selection(callback_query: types.CallbackQuery):
     """
     Обрабатывает выбор ассортимента для удаления.
     
     Выводит список брендов в выбранном ассортименте.
     """
-    assortment_id = callback_query.data[len("delAssort_"):]
-    kb = InlineKeyboardMarkup(row_width=2)
-    for item in cursor.execute(f'SELECT * FROM "{assortment_id}"').fetchall():
-        kb.insert(InlineKeyboardButton(item[0], callback_data=f'delBrand_{assortment_id}_{item[1]}'))
-    kb.add(InlineKeyboardButton('<<Назад', callback_data='Удалить'))
-    text = cursor.execute('SELECT tastes FROM "Ассортимент🗂" WHERE id=?', (assortment_id,)).fetchone()[0]
-    await callback_query.message.edit_text(text)
-    await callback_query.message.edit_reply_markup(kb)
+    await _show_brands(callback_query, int(callback_args(callback_query)[0]))
     await callback_query.answer()
 
 
-@dp.callback_query_handler(Text(startswith='delBrand_'))
+@route('delBrand')
 async def handle_delete_brand_selection(callback_query: types.CallbackQuery):
     """
     Обрабатывает выбор бренда для удаления.
     
     Выводит список товаров для выбранного бренда и опции удаления.
     """
-    data = callback_query.data[len("delBrand_"):]
-    kb = InlineKeyboardMarkup(row_width=2)
-    query = cursor.execute(f'SELECT * FROM "{data}"')
-    for item in query.fetchall():
-        kb.add(InlineKeyboardButton(item[0], callback_data=f'delItem_{data}_{item[1]}'))
-    kb.add(InlineKeyboardButton('Удалить ' + decrypt_code(data), callback_data='delComplete_' + data))
-    kb.add(InlineKeyboardButton('<<Назад', callback_data=f'delAssort_' + "_".join(data.split("_")[:-1])))
-    text = decrypt_code(data)
-    await callback_query.message.edit_text(text)
-    await callback_query.message.edit_reply_markup(kb)
+    await _show_products(callback_query, int(callback_args(callback_query)[0]))
     await callback_query.answer()
 
 
-@dp.callback_query_handler(Text(startswith='delItem_'))
+@route('delItem')
 async def handle_delete_item_selection(callback_query: types.CallbackQuery):
     """
     Обрабатывает выбор конкретного товара для удаления.
     
     Выводит опции для удаления отдельного товара.
     """
-    kb = InlineKeyboardMarkup(row_width=2)
-    data = callback_query.data[len("delItem_"):]
-    for item in cursor.execute(f'SELECT * FROM "{data}"').fetchall():
-        kb.insert(InlineKeyboardButton(f'Удалить {item[0]}', callback_data=f'delSingle_{data}_{item[1]}'))
-    kb.add(InlineKeyboardButton('Удалить ' + decrypt_code(data), callback_data='delAlternate_' + data))
-    kb.add(InlineKeyboardButton('<<Назад', callback_data=f'delBrand_' + "_".join(data.split("_")[:-1])))
-    await callback_query.message.edit_text(decrypt_code(data))
-    await callback_query.message.edit_reply_markup(kb)
+    await _show_flavors(callback_query, int(callback_args(callback_query)[0]))
     await callback_query.answer()
 
 
-@dp.callback_query_handler(Text(startswith='delComplete_'))
+@route('delComplete')
 async def handle_delete_complete_selection(callback_query: types.CallbackQuery):
     """
-    Выполняет полное удаление бренда или линейки.
+    Выполняет полное удаление бренда.
     
-    Удаляет записи из таблицы photos, сбрасывает таблицы и обновляет родительскую таблицу.
-    """
-    data = callback_query.data[len("delComplete_"):]
-    del_name = decrypt_code(data)
-    history_text = cursor.execute(
-        'SELECT tastes FROM "Ассортимент🗂" WHERE id=?', (data.split('_')[0],)
-    ).fetchone()[0]
-    await callback_query.message.edit_text(history_text)
+    Удаляет узел бренда со всеми линейками, вкусами и записями photos, затем показывает оставшиеся бренды.
+    """
+    brand_id = int(callback_args(callback_query)[0])
+    node = await get_node(brand_id)
+    if node is None:
+        # Повторное нажатие или кнопка, оставшаяся после удаления
+        await callback_query.answer('Уже удалено')
+        return
+    _, category_id, _, del_name = node
+    await delete_subtree(brand_id)
+    await commit()
     await callback_query.answer(del_name + ' удален')
-    for item in cursor.execute(f'SELECT * FROM "{data}"').fetchall():
-        cursor.execute('DELETE FROM photos WHERE names = ?', (item[0],))
-        db.commit()
-        cursor.execute('DROP TABLE "{}_{}"'.format(data, item[1]))
-        db.commit()
-    cursor.execute('DROP TABLE "{}"'.format(data))
-    db.commit()
-    cursor.execute('DELETE FROM "{}" WHERE tastes = ?'.format(get_table_name(data)), (del_name,))
-    db.commit()
-    kb = InlineKeyboardMarkup(row_width=2)
-    for item in cursor.execute(f'SELECT * FROM "{get_table_name(data)}"').fetchall():
-        kb.insert(InlineKeyboardButton(item[0], callback_data=f'delBrand_{data}_{item[1]}'))
-    kb.add(InlineKeyboardButton('<<Назад', callback_data='Удалить'))
-    await callback_query.message.edit_reply_markup(kb)
+    await _show_brands(callback_query, category_id)
 
 
-@dp.callback_query_handler(Text(startswith='delAlternate_'))
+@route('delAlternate')
 async def handle_delete_alternate(callback_query: types.CallbackQuery):
     """
-    Альтернативное удаление: удаляет таблицу товара и соответствующие записи.
-    """
-    kb = InlineKeyboardMarkup(row_width=2)
-    data = callback_query.data[len("delAlternate_"):]
-    del_name = decrypt_code(data)
-    cursor.execute('DELETE FROM photos WHERE names = ?', (del_name,))
-    db.commit()
-    cursor.execute('DROP TABLE "{}"'.format(data))
-    db.commit()
-    cursor.execute('DELETE FROM "{}" WHERE tastes = ?'.format(get_table_name(data)), (del_name,))
-    db.commit()
-    query = cursor.execute(f'SELECT * FROM "{get_table_name(data)}"')
-    for item in query.fetchall():
-        kb.add(InlineKeyboardButton(item[0], callback_data=f'delItem_{get_table_name(data)}_{item[1]}'))
-    kb.add(InlineKeyboardButton('Удалить ' + decrypt_code(get_table_name(data)), callback_data='delComplete_' + get_table_name(data)))
-    kb.add(InlineKeyboardButton('<<Назад', callback_data=f'delAssort_' + get_table_name(get_table_name(data))))
+    Альтернативное удаление: удаляет линейку товара вместе со вкусами и записью photos.
+    """
+    product_id = int(callback_args(callback_query)[0])
+    node = await get_node(product_id)
+    if node is None:
+        # Повторное нажатие или кнопка, оставшаяся после удаления
+        await callback_query.answer('Уже удалено')
+        return
+    _, brand_id, _, del_name = node
+    await delete_subtree(product_id)
+    await commit()
     await callback_query.answer(f'{del_name} удален')
-    await callback_query.message.edit_text(decrypt_code(get_table_name(data)))
-    await callback_query.message.edit_reply_markup(kb)
+    await _show_products(callback_query, brand_id)
 
 
-@dp.callback_query_handler(Text(startswith='delSingle_'))
+@route('delSingle')
 async def handle_delete_individual_item(callback_query: types.CallbackQuery):
     """
     Выполняет индивидуальное удаление товара.
     
-    Удаляет запись из таблицы, обновляет клавиатуру и уведомляет об удалении.
-    """
-    data = callback_query.data[len("delSingle_"):]
-    del_name = decrypt_code(data)
-    cursor.execute('DELETE FROM "{}" WHERE tastes = ?'.format(get_table_name(data)), (del_name,))
-    db.commit()
-    kb = InlineKeyboardMarkup(row_width=2)
-    for item in cursor.execute(f'SELECT * FROM "{get_table_name(data)}"').fetchall():
-        kb.insert(InlineKeyboardButton(f'Удалить {item[0]}', callback_data=f'delSingle_{get_table_name(data)}_{item[1]}'))
-    kb.add(InlineKeyboardButton('Удалить ' + decrypt_code(get_table_name(data)), callback_data='delAlternate_' + get_table_name(data)))
-    kb.add(InlineKeyboardButton('<<Назад', callback_data=f'delBrand_' + get_table_name(get_table_name(data))))
-    await callback_query.message.edit_reply_markup(kb)
+    Удаляет вкус из каталога, обновляет клавиатуру и уведомляет об удалении.
+    """
+    flavor_id = int(callback_args(callback_query)[0])
+    node = await get_node(flavor_id)
+    if node is None:
+        # Повторное нажатие или кнопка, оставшаяся после удаления
+        await callback_query.answer('Уже удалено')
+        return
+    _, product_id, _, del_name = node
+    await delete_subtree(flavor_id)
+    await commit()
+    await _show_flavors(callback_query, product_id)
     await callback_query.answer(f'{del_name} удален')
 
 
-@dp.callback_query_handler(text='Добавитьакцию', state=None)
+@dp.message_handler(commands=['catalog_stats'], user_id=ADMIN_IDS)
+async def handle_catalog_stats(message: types.Message):
+    """
+    Показывает администратору счётчики кэша каталога.
+    """
+    cache_stats = stats()
+    await message.answer(
+        f"Кэш каталога:\nузлов: {cache_stats['nodes']}\nпопаданий: {cache_stats['hits']}\n"
+        f"промахов: {cache_stats['misses']}\nзагрузок: {cache_stats['loads']}"
+    )
+
+
+@dp.message_handler(commands=['outbox_stats'], user_id=ADMIN_IDS)
+async def handle_outbox_stats(message: types.Message):
+    """
+    Показывает администратору состояние очереди исходящих сообщений.
+    """
+    queue_stats = outbox.stats()
+    depth = ', '.join(f'{name}: {count}' for name, count in queue_stats['depth'].items()) or 'пусто'
+    text = (f"Очередь сообщений:\nв очереди: {depth}\nпоставлено: {queue_stats['enqueued']}\n"
+            f"отправлено: {queue_stats['sent']}\nошибок: {queue_stats['failed']}")
+    if 'latency_avg' in queue_stats:
+        text += (f"\nзадержка: средняя {queue_stats['latency_avg']:.2f} с, "
+                 f"p95 {queue_stats['latency_p95']:.2f} с, максимум {queue_stats['latency_max']:.2f} с")
+    await message.answer(text)
+
+
+@route('Добавитьакцию')
 async def handle_add_sale_initiate(callback_query: types.CallbackQuery):
     """
     Инициализирует процесс добавления акции.
@@ -521,7 +460,8 @@ async def handle_sale_desc(message: types.Message, state: FSMContext):
     """
     async with state.proxy() as data:
         data['sale_description'] = message.text
-        cursor.execute('INSERT INTO sales (positions, desc) VALUES (?, ?)', (data['sale_name'], data['sale_description']))
-    db.commit()
+        await execute('INSERT INTO sales (positions, desc) VALUES (?, ?)', (data['sale_name'], data['sale_description']))
+    await commit()
+    counters.adjust(counters.SALES, 1)
     await message.answer(f'Акция {data["sale_name"]} создана')
     await state.finish()
@@ -5,20 +5,22 @@
 Обрабатывает:
     1. Отображение главного меню "Ассортимент🗂".
     2. Выбор конкретного ассортимента и бренда.
-    3. Отображение деталей товара.
+    3. Отображение карточки товара (фото с подписью, см. media.py).
     4. Добавление выбранного варианта (вкуса) товара в корзину.
 """
 
 from aiogram import types
-from aiogram.dispatcher.filters import Text
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-from bot import dp, bot
-from db import cursor, db, decrypt_code, get_table_name
+from callbacks import route, pack, callback_args
+from db import execute, commit
+from catalog import BRAND, PRODUCT, get_children, get_node, get_photo, resolve_path
+from media import NO_PHOTO, card_caption, show_card, show_text
+from pricing import cart_counts, format_price
 
 btn_back = InlineKeyboardButton('Меню', callback_data='back')
 
-@dp.callback_query_handler(Text('Ассортимент🗂'))
+@route('Ассортимент🗂')
 async def handle_assortment_menu(callback_query: types.CallbackQuery):
     """
     Отображает главное меню ассортимента.
@@ -29,16 +31,15 @@ async def handle_assortment_menu(callback_query: types.CallbackQuery):
         callback_query (types.CallbackQuery): Callback-запрос от пользователя.
     """
     kb = InlineKeyboardMarkup(row_width=2)
-    # Извлекаем все элементы ассортимента из таблицы "Ассортимент🗂"
-    for item in cursor.execute('SELECT * FROM "Ассортимент🗂"').fetchall():
-        # item[0] – название, item[1] – идентификатор ассортимента
-        kb.insert(InlineKeyboardButton(item[0], callback_data=f'assort_{item[1]}'))
+    # Извлекаем все элементы ассортимента (корневые узлы каталога)
+    for node_id, name in await get_children(None):
+        kb.insert(InlineKeyboardButton(name, callback_data=pack('assort', node_id)))
     kb.add(btn_back)
     await callback_query.message.edit_text('Ассортимент🗂')
     await callback_query.message.edit_reply_markup(kb)
     await callback_query.answer()
 
-@dp.callback_query_handler(Text(startswith='assort_'))
+@route('assort')
 async def handle_assortment_selection(callback_query: types.CallbackQuery):
     """
     Обрабатывает выбор конкретного ассортимента.
@@ -46,22 +47,21 @@ async def handle_assortment_selection(callback_query: types.CallbackQuery):
     Формирует клавиатуру с брендами, относящимися к выбранному ассортименту.
     
     Аргументы:
-        callback_query (types.CallbackQuery): Callback-запрос с данными вида "assort_{id}".
+        callback_query (types.CallbackQuery): Callback-запрос с данными вида "assort:{id}".
     """
-    assortment_id = callback_query.data[len("assort_"):]
+    assortment_id = int(callback_args(callback_query)[0])
     kb = InlineKeyboardMarkup(row_width=2)
-    # Извлекаем бренды из таблицы с именем, соответствующим assortment_id
-    for item in cursor.execute(f'SELECT * FROM "{assortment_id}"').fetchall():
-        # item[0] – название бренда, item[1] – идентификатор бренда
-        kb.insert(InlineKeyboardButton(item[0], callback_data=f'brand_{assortment_id}_{item[1]}'))
+    # Извлекаем бренды – дочерние узлы выбранного ассортимента
+    for node_id, name in await get_children(assortment_id):
+        kb.insert(InlineKeyboardButton(name, callback_data=pack('brand', node_id)))
     kb.add(InlineKeyboardButton('<<Назад', callback_data='Ассортимент🗂'))
-    # Получаем описание выбранного ассортимента
-    text = cursor.execute('SELECT tastes FROM "Ассортимент🗂" WHERE id=?', (assortment_id,)).fetchone()[0]
+    # Получаем название выбранного ассортимента
+    text = (await get_node(assortment_id))[3]
     await callback_query.message.edit_text(text)
     await callback_query.message.edit_reply_markup(kb)
     await callback_query.answer()
 
-@dp.callback_query_handler(Text(startswith='brand_'))
+@route('brand')
 async def handle_assortment_brand_selection(callback_query: types.CallbackQuery):
     """
     Обрабатывает выбор бренда в рамках выбранного ассортимента.
@@ -69,88 +69,69 @@ async def handle_assortment_brand_selection(callback_query: types.CallbackQuery)
     Формирует клавиатуру с товарами данного бренда.
     
     Аргументы:
-        callback_query (types.CallbackQuery): Callback-запрос с данными вида "brand_{assortment_id}_{brand_id}".
+        callback_query (types.CallbackQuery): Callback-запрос с данными вида "brand:{brand_id}".
     """
-    data = callback_query.data[len("brand_"):]
+    brand_id = int(callback_args(callback_query)[0])
     kb = InlineKeyboardMarkup(row_width=2)
-    # Извлекаем товары из таблицы с именем, соответствующим полученным данным
-    for item in cursor.execute(f'SELECT * FROM "{data}"').fetchall():
-        # item[0] – название товара, item[1] – идентификатор товара
-        kb.insert(InlineKeyboardButton(item[0], callback_data=f'product_{data}_{item[1]}'))
+    # Извлекаем товары (линейки) выбранного бренда
+    for node_id, name in await get_children(brand_id):
+        kb.insert(InlineKeyboardButton(name, callback_data=pack('product', node_id)))
     # Кнопка возврата к выбору ассортимента
-    kb.add(InlineKeyboardButton('<<Назад', callback_data=f'assort_{data.split("_")[0]}'))
-    # Получаем описание бренда или ассортимента для отображения
-    text = cursor.execute('SELECT tastes FROM "{}" WHERE id=?'.format(data.split("_")[0]), (data.split('_')[1],)).fetchone()[0]
-    await callback_query.message.edit_text(text)
-    await callback_query.message.edit_reply_markup(kb)
+    _, parent_id, _, text = await get_node(brand_id)
+    kb.add(InlineKeyboardButton('<<Назад', callback_data=pack('assort', parent_id)))
+    # Сюда возвращаются из карточки товара – сообщения с фото
+    await show_text(callback_query.message, text, reply_markup=kb)
     await callback_query.answer()
 
-@dp.callback_query_handler(Text(startswith='product_'))
+@route('product')
 async def handle_product_detail(callback_query: types.CallbackQuery):
     """
     Отображает подробности выбранного товара и варианты его вкусов.
     
-    Формирует клавиатуру с вариантами вкусов, отображает описание товара, фото и цену.
+    Формирует клавиатуру с вариантами вкусов и показывает карточку товара: фото, описание и цену в подписи.
     
     Аргументы:
-        callback_query (types.CallbackQuery): Callback-запрос с данными вида "product_{product_code}".
+        callback_query (types.CallbackQuery): Callback-запрос с данными вида "product:{product_id}".
     """
     kb = InlineKeyboardMarkup(row_width=2)
-    # Разбиваем callback_data для получения частей кода товара
-    parts = callback_query.data[len("product_"):].split('_')
-    # Полный код товара без отдельного идентификатора вкуса (например, "2_1_1")
-    full_product_code = '_'.join(parts)
-    main_taste = decrypt_code(full_product_code)  # Получаем основное название товара по коду
-
-    # Формируем клавиатуру вариантов вкусов, извлекая данные из таблицы с именем full_product_code
-    for item in cursor.execute('SELECT * FROM "{}"'.format(full_product_code)).fetchall():
-        # Формируем callback_data для конкретного вкуса, добавляя идентификатор вкуса
-        flavor_cb = f'{full_product_code}_{item[1]}'  # Пример: "2_1_1_2"
-        try:
-            # Проверяем, есть ли уже этот вариант товара в корзине пользователя
-            result = cursor.execute(
-                "SELECT count FROM {} WHERE cart = ?".format(f'"{callback_query.from_user.id}"'),
-                (flavor_cb,)
-            ).fetchone()
-            count_value = result[0] if result is not None else 0
-            if count_value:
-                # Если вариант уже в корзине, отображаем количество рядом с названием вкуса
-                kb.insert(InlineKeyboardButton(f'({count_value}){item[0]}', callback_data=f'addCart_{flavor_cb}'))
-            else:
-                kb.insert(InlineKeyboardButton(item[0], callback_data=f'addCart_{flavor_cb}'))
-        except Exception:
-            kb.insert(InlineKeyboardButton(item[0], callback_data=f'addCart_{flavor_cb}'))
+    product_id = int(callback_args(callback_query)[0])
+    # Цепочка ассортимент → бренд → линейка одним запросом
+    path = await resolve_path(product_id)
+    brand_id, brand_name = path[BRAND][0], path[BRAND][2]
+    product_name = path[PRODUCT][2]
+
+    # Корзина пользователя читается вместе с его скидками одним запросом
+    cart = await cart_counts(callback_query.from_user.id)
+
+    # Формируем клавиатуру вариантов вкусов
+    for flavor_id, flavor_name in await get_children(product_id):
+        count_value = cart.counts.get(str(flavor_id), 0)
+        if count_value:
+            # Если вариант уже в корзине, отображаем количество рядом с названием вкуса
+            kb.insert(InlineKeyboardButton(f'({count_value}){flavor_name}', callback_data=pack('addCart', flavor_id)))
+        else:
+            kb.insert(InlineKeyboardButton(flavor_name, callback_data=pack('addCart', flavor_id)))
 
     # Кнопка возврата к выбору бренда
-    category_code = "_".join(parts[:-1])  # Например, если full_product_code = "2_1_1", то category_code = "2_1"
-    kb.add(InlineKeyboardButton('<<Назад', callback_data=f'brand_{category_code}'))
+    kb.add(InlineKeyboardButton('<<Назад', callback_data=pack('brand', brand_id)))
 
     # Если корзина пользователя не пуста, добавляем кнопку "Открыть корзину"
-    cart_count = cursor.execute("SELECT count(*) FROM {} ".format(f'"{callback_query.from_user.id}"')).fetchone()
-    if cart_count and cart_count[0] != 0:
-        kb.insert(InlineKeyboardButton('Открыть корзину', callback_data='cart1'))
+    if cart.counts:
+        kb.insert(InlineKeyboardButton('Открыть корзину', callback_data=pack('cart', 1)))
 
-    # Получаем данные о товаре (фото, описание, цену) из таблицы photos
-    photo_data = cursor.execute('SELECT * FROM photos WHERE names==?', (full_product_code,)).fetchone()
+    # Получаем данные о товаре (фото, описание, цену) из кэша каталога
+    photo_data = await get_photo(product_id)
     if photo_data is None:
-        photo_data = ("", "без фото", "Описание не найдено", "0₽")
-    try:
-        price = int(photo_data[-1][:-1])
-    except Exception:
-        price = 0
-
-    # Получаем полное название товара (например, через decrypt_code)
-    product_name = decrypt_code(full_product_code)
-    if photo_data[1] != 'без фото':
-        text = f'[​]({photo_data[1]})*{main_taste} {product_name}*\n*Описание:*\n{photo_data[2]}\n*Цена:* {price}₽'
-    else:
-        text = f'*{main_taste} {product_name}*\n*Описание:*\n{photo_data[2]}\n*Цена:* {price}₽'
-
-    await callback_query.message.edit_text(text, parse_mode='Markdown')
-    await callback_query.message.edit_reply_markup(reply_markup=kb)
+        photo_data = (NO_PHOTO, "Описание не найдено", 0)
+    # Цена для пользователя с учётом его скидок
+    price = format_price(cart.profile.apply(photo_data[2] or 0))
+
+    # Фото отправляется по сохранённому file_id, без повторной загрузки по ссылке
+    await show_card(callback_query.message, product_id, photo_data[0],
+                    card_caption(f'{brand_name} {product_name}', photo_data[1], price), reply_markup=kb)
     await callback_query.answer()
 
-@dp.callback_query_handler(Text(startswith='addCart_'))
+@route('addCart')
 async def handle_add_to_cart(callback_query: types.CallbackQuery):
     """
     Добавляет выбранный вариант товара (вкуса) в корзину.
@@ -160,43 +141,31 @@ async def handle_add_to_cart(callback_query: types.CallbackQuery):
     После обновления корзины обновляет отображение деталей товара.
     
     Аргументы:
-        callback_query (types.CallbackQuery): Callback-запрос с данными вида "addCart_{flavor_code}".
+        callback_query (types.CallbackQuery): Callback-запрос с данными вида "addCart:{flavor_id}".
     """
-    # Извлекаем полный код варианта товара, например, "2_1_1_2"
-    flavor_code = callback_query.data[len("addCart_"):]
-    # Получаем базовый код товара без идентификатора вкуса, например, "2_1_1"
-    product_code = '_'.join(flavor_code.split('_')[:-1])
-    
-    product_data = cursor.execute('SELECT price FROM photos WHERE names=?', (product_code,)).fetchone()
+    flavor_id = int(callback_args(callback_query)[0])
+    flavor = await get_node(flavor_id)
+    if flavor is None:
+        await callback_query.answer('Ошибка: товар не найден ❌', show_alert=True)
+        return
+    # Линейка, к которой относится вкус: у неё хранятся фото, описание и цена
+    product_id = flavor[1]
+
+    product_data = await get_photo(product_id)
     if product_data is None:
         await callback_query.answer('Ошибка: товар не найден ❌', show_alert=True)
         return
-    price = product_data[0]
-
-    user_cart_table = f'"{callback_query.from_user.id}"'
-    # Создаём таблицу корзины для пользователя, если она не существует
-    cursor.execute(f'CREATE TABLE IF NOT EXISTS {user_cart_table} (cart TEXT, price TEXT, count INTEGER)')
-    db.commit()
-
-    product_count = cursor.execute(
-        f'SELECT count FROM {user_cart_table} WHERE cart=?', (flavor_code,)
-    ).fetchone()
-    if product_count is None:
-        # Вставляем новый товар в корзину
-        cursor.execute(
-            f'INSERT INTO {user_cart_table} (cart, price, count) VALUES (?, ?, ?)',
-            (flavor_code, price, 1)
-        )
-    else:
-        # Увеличиваем количество существующего товара
-        new_count = product_count[0] + 1
-        cursor.execute(
-            f'UPDATE {user_cart_table} SET count=? WHERE cart=?',
-            (new_count, flavor_code)
-        )
-    db.commit()
+    price = product_data[2]
+
+    # Вставляем новый товар в корзину или увеличиваем количество существующего
+    await execute(
+        'INSERT INTO cart_items (user_id, sku, price, count) VALUES (?, ?, ?, 1) '
+        'ON CONFLICT (user_id, sku) DO UPDATE SET count = count + 1',
+        (callback_query.from_user.id, str(flavor_id), price)
+    )
+    await commit()
 
     await callback_query.answer('Товар добавлен в корзину ✅', show_alert=True)
-    # Обновляем отображение товара: меняем callback_data на "product_" + product_code (без вкуса)
-    callback_query.data = "product_" + product_code
+    # Обновляем отображение товара: меняем callback_data на "product:<id линейки>"
+    callback_query.data = pack('product', product_id)
     await handle_product_detail(callback_query)
@@ -5,9 +5,11 @@ from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-from bot import dp, bot
-from db import cursor, db
+from bot import dp
+from callbacks import route, callback_args
 from config import ADMIN_IDS
+from db import commit, after_commit
+from broadcasts import create_campaign, start_campaign, cancel_campaign, progress_markup
 
 from handlers.start import start 
 
@@ -19,7 +21,7 @@ class FSMBroadcast(StatesGroup):
     broadcast_message = State() 
 
 # Хендлер для инициализации рассылки
-@dp.callback_query_handler(text='Рассылка')
+@route('Рассылка')
 async def handle_broadcast_initiate(callback_query: types.CallbackQuery):
     """
     Устанавливает состояние для рассылки и просит ввести сообщение, которое нужно разослать.
@@ -31,24 +33,33 @@ async def handle_broadcast_initiate(callback_query: types.CallbackQuery):
     await callback_query.message.edit_reply_markup(kb)
     await callback_query.answer()
 
-# Хендлер для получения текста рассылки и отправки его всем пользователям
+# Хендлер для получения текста рассылки и запуска её в фоне
 @dp.message_handler(state=FSMBroadcast.broadcast_message)
 async def handle_broadcast_message(message: types.Message, state: FSMContext):
     """
-    Отправляет введённое сообщение всем пользователям, полученным из таблицы id,
-    уведомляет админов о количестве отправленных сообщений и возвращает пользователя в главное меню.
+    Сохраняет рассылку и запускает её отправку в фоне (модуль broadcasts), не дожидаясь окончания.
+    Прогресс обновляется в отдельном сообщении у администратора, который запустил рассылку.
     """
-    sent_count = 0
-    for v in cursor.execute('SELECT * FROM id').fetchall():
-        try:
-            await bot.send_message(v[0], message.text)
-            sent_count += 1
-        except Exception:
-            continue
-    try:
-        for admin_id in ADMIN_IDS:
-            await bot.send_message(admin_id, f'Отправлено {sent_count} пользователям')
-    except Exception:
-        pass
+    progress = await message.answer('Рассылка подготавливается…')
+    campaign_id = await create_campaign(message.text, message.chat.id, progress.message_id)
+    await commit()
+    # Фоновая отправка читает рассылку из базы, поэтому стартует после фиксации апдейта
+    after_commit(lambda: start_campaign(campaign_id))
+    await progress.edit_reply_markup(progress_markup(campaign_id))
     await state.finish()
     await start(message)
+
+# Хендлер кнопки "Отменить рассылку" под сообщением с прогрессом
+@route('cancelCampaign')
+async def handle_broadcast_cancel(callback_query: types.CallbackQuery):
+    """
+    Останавливает идущую рассылку. Отправка прекращается после текущей порции,
+    итог появится в сообщении с прогрессом.
+    """
+    if callback_query.from_user.id not in ADMIN_IDS:
+        await callback_query.answer()
+        return
+    if await cancel_campaign(int(callback_args(callback_query)[0])):
+        await callback_query.answer('Рассылка будет остановлена')
+    else:
+        await callback_query.answer('Рассылка уже завершена')
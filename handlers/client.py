@@ -10,19 +10,39 @@
 """
 
 import random
+from typing import NamedTuple
+
 from aiogram import types
 from aiogram.dispatcher import FSMContext
-from aiogram.dispatcher.filters import Text
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 
-from bot import dp, bot
-from db import cursor, db
+from bot import dp
+from callbacks import route, pack, payload_ref, unpack, callback_args
+from db import fetchone, fetchall, execute, commit
+import counters
+import outbox
 from config import ADMIN_IDS
+from orders import SEPARATOR, format_order, get_history_page
+from reviews import format_review, fill_texts, get_reviews_page, get_pending_page, approve, reject, ban_authors
 from handlers.start import start
+from handlers.search import show_results
 
 btn_back = InlineKeyboardButton('Меню', callback_data='back')
 btn_back_in = InlineKeyboardButton('Назад в меню', callback_data='backin')
 
+# Максимальная длина текста сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+
+class ModerationBatch(NamedTuple):
+    """
+    Отзывы страницы очереди модерации и начало этой страницы. Одни данные на всю страницу: кнопка
+    отдельного отзыва несёт его индекс на странице ("modApprove:~<токен>:<индекс>"), кнопка всей страницы – только токен.
+    """
+    ids: list
+    after: int
+
+
 @dp.message_handler(text='Меню', state="*")
 async def handle_menu_message(message: types.Message, state: FSMContext):
     """
@@ -37,7 +57,7 @@ async def handle_menu_message(message: types.Message, state: FSMContext):
         await state.finish()
         await start(message)
 
-@dp.callback_query_handler(text='backin', state="*")
+@route('backin', state='*')
 async def back_in_menu(callback: types.CallbackQuery, state: FSMContext):
     """
     Завершает текущее состояние и возвращает в главное меню в inline-режиме.
@@ -46,7 +66,7 @@ async def back_in_menu(callback: types.CallbackQuery, state: FSMContext):
     await start(callback, inline=True)
     await callback.answer()
 
-@dp.callback_query_handler(text='back')
+@route('back')
 async def handle_back(callback: types.CallbackQuery):
     """
     Возвращает в главное меню в inline-режиме.
@@ -54,83 +74,119 @@ async def handle_back(callback: types.CallbackQuery):
     await start(callback, inline=True)
     await callback.answer()
 
-@dp.callback_query_handler(text='otz')
+@route('otz', 'otzOlder', 'otzNewer')
 async def handle_otz_callback(callback_query: types.CallbackQuery):
     """
-    Пересылает все отзывы из таблицы "otz" пользователю.
-    
-    Для каждого отзыва отправляет сначала имя автора, затем пересылает само сообщение.
-    """
-    for item in cursor.execute('SELECT * FROM otz').fetchall():
-        # item[2] - текст отзыва, item[0] и item[1] - идентификаторы для пересылки сообщения
-        await bot.send_message(callback_query.from_user.id, item[2] + ":")
-        await bot.forward_message(callback_query.from_user.id, item[0], item[1])
-    await start(callback_query, inline=True)
+    Показывает опубликованные отзывы страницами, от новых к старым.
+
+    callback_data: "otz" – первая страница, "otzOlder:<id>" – отзывы старше id, "otzNewer:<id>" – новее id.
+    Отзывы выводятся в одном сообщении; текст старых отзывов один раз восстанавливается пересылкой (fill_texts).
+    """
+    action, args = unpack(callback_query.data)
+    review_id = int(args[0]) if args else None
+    page, has_older, has_newer = await get_reviews_page(
+        before=review_id if action == 'otzOlder' else None,
+        after=review_id if action == 'otzNewer' else None
+    )
+    if not page:
+        await callback_query.answer('Отзывов пока нет')
+        return
+    page = await fill_texts('otz', page, callback_query.from_user.id)
+    text = SEPARATOR.join(format_review(product, text or '') for _, _, _, product, text in page)
+    if len(text) > MESSAGE_LIMIT:
+        text = text[:MESSAGE_LIMIT - 1] + '…'
+    kb = InlineKeyboardMarkup(row_width=2)
+    nav = []
+    if has_newer:
+        nav.append(InlineKeyboardButton('◀️ Новее', callback_data=pack('otzNewer', page[0][0])))
+    if has_older:
+        nav.append(InlineKeyboardButton('Старше ▶️', callback_data=pack('otzOlder', page[-1][0])))
+    if nav:
+        kb.row(*nav)
+    kb.add(btn_back_in)
+    await callback_query.message.edit_text(text)
+    await callback_query.message.edit_reply_markup(kb)
+    await callback_query.answer()
+
+async def _show_moderation(callback_query, after=0):
+    """Показывает страницу очереди модерации: отзывы списком и кнопки для каждого отзыва и для всей страницы."""
+    page, has_more = await get_pending_page(after)
+    if not page:
+        await callback_query.message.edit_text('Новых отзывов нет')
+        await callback_query.message.edit_reply_markup(InlineKeyboardMarkup().add(btn_back_in))
+        return
+    page = await fill_texts('feedbacks', page, callback_query.from_user.id)
+    texts = []
+    kb = InlineKeyboardMarkup(row_width=3)
+    # Одна строка callback_payloads на страницу, кнопки различаются номером отзыва
+    ref = await payload_ref(ModerationBatch([row[0] for row in page], after))
+    for index, (review_id, chat, message, product, text) in enumerate(page):
+        number = index + 1
+        texts.append(f'{number}. {format_review(product, text or "")}')
+        kb.row(
+            InlineKeyboardButton(f'{number} ✅', callback_data=pack('modApprove', ref, index)),
+            InlineKeyboardButton(f'{number} 🗑', callback_data=pack('modReject', ref, index)),
+            InlineKeyboardButton(f'{number} 🚫', callback_data=pack('modBan', ref, index))
+        )
+    kb.row(
+        InlineKeyboardButton('✅ Все', callback_data=pack('modApprove', ref)),
+        InlineKeyboardButton('🗑 Все', callback_data=pack('modReject', ref)),
+        InlineKeyboardButton('🚫 Всех', callback_data=pack('modBan', ref))
+    )
+    nav = []
+    if after:
+        nav.append(InlineKeyboardButton('⏮ В начало', callback_data='Отзывы'))
+    if has_more:
+        nav.append(InlineKeyboardButton('Дальше ▶️', callback_data=pack('modPage', page[-1][0])))
+    if nav:
+        kb.row(*nav)
+    kb.add(btn_back_in)
+    text = SEPARATOR.join(texts)
+    if len(text) > MESSAGE_LIMIT:
+        text = text[:MESSAGE_LIMIT - 1] + '…'
+    await callback_query.message.edit_text(text)
+    await callback_query.message.edit_reply_markup(kb)
 
-@dp.callback_query_handler(text='Отзывы')
+@route('Отзывы', 'modPage')
 async def handle_feedbacks_callback(callback_query: types.CallbackQuery):
     """
-    Отображает новые отзывы для модерации с кнопками "Запостить", "Удалить" и "Заблокировать".
-    
-    Если нет новых отзывов, выводится соответствующее сообщение.
-    """
-    try:
-        for item in cursor.execute('SELECT * FROM feedbacks').fetchall():
-            kb = InlineKeyboardMarkup(row_width=2)
-            await bot.forward_message(callback_query.from_user.id, item[0], item[1])
-            # Формируем кнопки для обработки отзыва
-            await bot.send_message(
-                callback_query.from_user.id,
-                '|\n' + item[2],
-                reply_markup=kb.add(
-                    InlineKeyboardButton('Запостить', callback_data=f'feedback_add|{item[0]}|{item[1]}|{item[2]}'),
-                    InlineKeyboardButton('Удалить', callback_data=f'feedback_del|{item[0]}|{item[1]}'),
-                    InlineKeyboardButton('Заблокировать', callback_data=f'feedback_ban{item[0]}')
-                )
-            )
-    except Exception:
-        await callback_query.answer('Нет новых отзывов.', show_alert=True)
-    await start(callback_query, inline=True)
-
-@dp.callback_query_handler(Text(startswith='feedback_add'))
-async def handle_feedback_add(callback_query: types.CallbackQuery):
-    """
-    Переносит отзыв из очереди ожидания в опубликованные отзывы и удаляет его из очереди.
-    
-    Разбивает callback_data по разделителю '|' для получения необходимых идентификаторов.
-    """
-    data = callback_query.data.split('|')
-    cursor.execute('INSERT INTO otz VALUES (?,?,?)', (int(data[1]), int(data[2]), data[3]))
-    cursor.execute('DELETE FROM feedbacks WHERE chat=? AND message=?', (int(data[1]), int(data[2])))
-    db.commit()
-    await callback_query.answer('Отзыв запостен', show_alert=True)
+    Отображает очередь отзывов на модерацию страницами по MODERATION_PAGE_SIZE.
 
-@dp.callback_query_handler(Text(startswith='feedback_del'))
-async def handle_feedback_delete(callback_query: types.CallbackQuery):
-    """
-    Удаляет отзыв из очереди ожидания.
-    
-    Использует идентификаторы, извлечённые из callback_data.
+    callback_data: "Отзывы" – начало очереди, "modPage:<id>" – отзывы после id.
     """
-    data = callback_query.data.split('|')
-    cursor.execute('DELETE FROM feedbacks WHERE chat=? AND message=?', (int(data[1]), int(data[2])))
-    db.commit()
-    await callback_query.answer('Отзыв удалён', show_alert=True)
+    args = callback_args(callback_query)
+    await _show_moderation(callback_query, int(args[0]) if args else 0)
+    await callback_query.answer()
 
-@dp.callback_query_handler(Text(startswith='feedback_ban'))
-async def handle_feedback_ban(callback_query: types.CallbackQuery):
-    """
-    Блокирует пользователя, основываясь на отзыве, и удаляет все его ожидающие отзывы.
-    
-    Из callback_data извлекается идентификатор пользователя.
-    """
-    user_id = callback_query.data[len("feedback_ban"):]
-    cursor.execute('UPDATE id SET ban = 1 WHERE users=?', (str(user_id),))
-    cursor.execute('DELETE FROM feedbacks WHERE chat=?', (int(user_id),))
-    db.commit()
-    await callback_query.answer('Пользователь заблокирован', show_alert=True)
+@route('modApprove', 'modReject', 'modBan', payload=ModerationBatch)
+async def handle_moderation(callback_query: types.CallbackQuery, payload: ModerationBatch):
+    """
+    Публикует, удаляет отзывы или блокирует их авторов – один отзыв (номер на странице в callback_data)
+    или всю страницу сразу – и показывает ту же страницу очереди заново.
+    """
+    action, args = unpack(callback_query.data)
+    ids = payload.ids
+    if len(args) > 1 and args[1].isdigit() and int(args[1]) < len(ids):
+        ids = [ids[int(args[1])]]
+    if action == 'modApprove':
+        count = await approve(ids)
+        counters.adjust(counters.OTZ, count)
+        message = f'Опубликовано отзывов: {count}'
+    elif action == 'modReject':
+        message = f'Удалено отзывов: {await reject(ids)}'
+    else:
+        message = f'Заблокировано пользователей: {await ban_authors(ids)}'
+    await commit()
+    await counters.refresh(counters.FEEDBACKS)
+    await _show_moderation(callback_query, payload.after)
+    await callback_query.answer(message)
+
+@route('feedback_add', 'feedback_del', 'feedback_ban')
+async def handle_stale_moderation(callback_query: types.CallbackQuery):
+    """Кнопки модерации отдельных сообщений, отправленные до появления очереди страницами."""
+    await callback_query.answer('Кнопка устарела, откройте новые отзывы заново', show_alert=True)
 
-@dp.callback_query_handler(text='sales')
+@route('sales')
 async def handle_sales_callback(callback_query: types.CallbackQuery):
     """
     Отображает текущие акции и бонусы, а также дополнительные опции для администраторов.
@@ -138,10 +194,10 @@ async def handle_sales_callback(callback_query: types.CallbackQuery):
     Если пользователь впервые, добавляется бонус "Приветственный бонус".
     """
     kb = InlineKeyboardMarkup(row_width=1)
-    if cursor.execute('SELECT first_client FROM id WHERE users=?', (str(callback_query.from_user.id),)).fetchone()[0] == 1:
+    if (await fetchone('SELECT first_client FROM id WHERE users=?', (callback_query.from_user.id,)))[0] == 1:
         kb.insert(InlineKeyboardButton('Приветственный бонус', callback_data='first_buy'))
-    for item in cursor.execute('SELECT * FROM sales').fetchall():
-        kb.insert(InlineKeyboardButton(item[0], callback_data=f'sale{item[2]}'))
+    for item in await fetchall('SELECT * FROM sales'):
+        kb.insert(InlineKeyboardButton(item[0], callback_data=pack('sale', item[2])))
     await callback_query.message.edit_text('Актуальные акции🎁')
     if callback_query.from_user.id in ADMIN_IDS:
         kb.add(
@@ -152,44 +208,68 @@ async def handle_sales_callback(callback_query: types.CallbackQuery):
     await callback_query.message.edit_reply_markup(kb)
     await callback_query.answer()
 
-@dp.callback_query_handler(Text(startswith='sale'))
+@route('sale')
 async def handle_sale_detail(callback_query: types.CallbackQuery):
     """
     Показывает подробное описание выбранной акции.
     
     Извлекает идентификатор акции из callback_data.
     """
-    sale_id = callback_query.data[4:]  # Извлекаем идентификатор, начиная с 5-го символа
-    desc = cursor.execute('SELECT desc FROM sales WHERE id=?', (sale_id,)).fetchone()[0]
+    sale_id = callback_args(callback_query)[0]
+    desc = (await fetchone('SELECT desc FROM sales WHERE id=?', (sale_id,)))[0]
     await callback_query.message.edit_text(desc)
     await callback_query.message.edit_reply_markup(InlineKeyboardMarkup(row_width=1).add(btn_back_in))
     await callback_query.answer()
 
-@dp.callback_query_handler(text="first_buy")
+@route('first_buy')
 async def handle_first_buy(callback_query: types.CallbackQuery):
     """
     Применяет скидку на первый заказ и обновляет статус пользователя.
     """
-    cursor.execute('UPDATE id SET first_pressed=1 WHERE users=?', (str(callback_query.from_user.id),))
-    cursor.execute('UPDATE id SET first_client=0 WHERE users=?', (str(callback_query.from_user.id),))
-    db.commit()
+    await execute('UPDATE id SET first_pressed=1 WHERE users=?', (callback_query.from_user.id,))
+    await execute('UPDATE id SET first_client=0 WHERE users=?', (callback_query.from_user.id,))
+    await commit()
     await callback_query.message.edit_text('Цена на первый заказ снижена на 10%.')
     await callback_query.message.edit_reply_markup(InlineKeyboardMarkup(row_width=1).add(btn_back_in))
     await callback_query.answer()
 
-@dp.callback_query_handler(text="history")
+@route('history', 'historyOlder', 'historyNewer')
 async def handle_history_callback(callback_query: types.CallbackQuery):
     """
-    Отображает историю покупок пользователя.
-    """
-    history = cursor.execute('SELECT history FROM id WHERE users=?', (str(callback_query.from_user.id),)).fetchone()[0]
-    await callback_query.message.edit_text(history)
-    await callback_query.message.edit_reply_markup(InlineKeyboardMarkup(row_width=1).add(btn_back_in))
+    Отображает историю покупок пользователя постранично, от новых заказов к старым.
+
+    callback_data: "history" – первая страница, "historyOlder:<id>" – заказы старше id,
+    "historyNewer:<id>" – заказы новее id.
+    """
+    action, args = unpack(callback_query.data)
+    order_id = args[0] if args else None
+    page, has_older, has_newer = await get_history_page(
+        callback_query.from_user.id,
+        before=int(order_id) if action == 'historyOlder' else None,
+        after=int(order_id) if action == 'historyNewer' else None
+    )
+    if not page:
+        await callback_query.answer('История покупок пуста')
+        return
+    text = SEPARATOR.join(format_order(created_at, total, items) for _, created_at, total, items in page)
+    if len(text) > MESSAGE_LIMIT:
+        text = text[:MESSAGE_LIMIT - 1] + '…'
+    kb = InlineKeyboardMarkup(row_width=2)
+    nav = []
+    if has_newer:
+        nav.append(InlineKeyboardButton('◀️ Новее', callback_data=pack('historyNewer', page[0][0])))
+    if has_older:
+        nav.append(InlineKeyboardButton('Старше ▶️', callback_data=pack('historyOlder', page[-1][0])))
+    if nav:
+        kb.row(*nav)
+    kb.add(btn_back_in)
+    await callback_query.message.edit_text(text)
+    await callback_query.message.edit_reply_markup(kb)
     await callback_query.answer()
 
 ### Обработка связи с менеджером и оптовых заказов
 
-@dp.callback_query_handler(Text('Связь с менеджером👨‍💻'))
+@route('Связь с менеджером👨‍💻')
 async def handle_contact_manager(callback_query: types.CallbackQuery):
     """
     Предоставляет пользователю варианты для связи с менеджером или оформления оптового заказа.
@@ -205,7 +285,7 @@ async def handle_contact_manager(callback_query: types.CallbackQuery):
     await callback_query.message.edit_reply_markup(markup)
     await callback_query.answer()
 
-@dp.callback_query_handler(Text('opt'))
+@route('opt')
 async def handle_bulk_order(callback_query: types.CallbackQuery):
     """
     Отображает информацию об условиях оптовых заказов и предоставляет вариант связи с менеджером.
@@ -226,7 +306,7 @@ async def handle_bulk_order(callback_query: types.CallbackQuery):
     await callback_query.message.edit_reply_markup(markup)
     await callback_query.answer()
 
-@dp.callback_query_handler(Text('trouble'))
+@route('trouble')
 async def handle_trouble_callback(callback_query: types.CallbackQuery):
     """
     Выводит правила возврата/обмена товара и предоставляет возможность связаться с менеджером.
@@ -241,7 +321,7 @@ async def handle_trouble_callback(callback_query: types.CallbackQuery):
     await callback_query.message.edit_reply_markup(markup)
     await callback_query.answer()
 
-@dp.callback_query_handler(Text(('Обратиться к менеджеру👨‍💻', 'Предложения сотрудничества🤝')))
+@route('Обратиться к менеджеру👨‍💻', 'Предложения сотрудничества🤝')
 async def handle_contact_or_proposal(callback_query: types.CallbackQuery):
     """
     Предоставляет ссылку для связи с менеджером для получения поддержки или обсуждения сотрудничества.
@@ -255,25 +335,25 @@ async def handle_contact_or_proposal(callback_query: types.CallbackQuery):
     )
     await callback_query.answer()
 
-@dp.callback_query_handler(Text(startswith='askManager '))
+@route('askManager')
 async def handle_manager_query(callback_query: types.CallbackQuery):
     """
     Если у пользователя анонимный аккаунт, предлагает отправить номер для связи с менеджером.
     """
-    user_id = callback_query.data[len("askManager "):]
-    await bot.send_message(user_id,
+    user_id = int(callback_args(callback_query)[0])
+    outbox.send_message(user_id,
                         'Менеджер не может с вами связаться, так как у вас анонимный аккаунт. Пожалуйста, отправьте номер, чтобы менеджер мог связаться с вами.',
                         reply_markup=InlineKeyboardMarkup().add(
-                            InlineKeyboardButton('Отправить номер', callback_data=f'sendContact {user_id}')
+                            InlineKeyboardButton('Отправить номер', callback_data=pack('sendContact', user_id))
                         ))
     await callback_query.answer()
 
-@dp.callback_query_handler(Text(startswith='sendContact '))
+@route('sendContact')
 async def handle_send_contact_prompt(callback_query: types.CallbackQuery):
     """
     Запрашивает у пользователя отправку контактной информации для связи с менеджером.
     """
-    await bot.send_message(callback_query.data[len("sendContact "):],
+    outbox.send_message(int(callback_args(callback_query)[0]),
                         'Нажмите кнопку ниже, чтобы отправить номер менеджеру.',
                         reply_markup=ReplyKeyboardMarkup(resize_keyboard=True).add(
                             KeyboardButton('Передать контакт', request_contact=True)
@@ -286,17 +366,19 @@ async def handle_contact_message(message: types.Message):
     Пересылает полученный контакт всем администраторам.
     """
     for admin in ADMIN_IDS:
-        await bot.forward_message(admin, message.chat.id, message.message_id)
+        outbox.forward_message(admin, message.chat.id, message.message_id, priority=outbox.ADMIN)
     await message.answer('Спасибо, ваш номер получен', reply_markup=ReplyKeyboardMarkup(resize_keyboard=True).add(btn_back))
 
 @dp.message_handler()
 async def handle_default_message(message: types.Message):
     """
-    Если сообщение не соответствует стандартным командам, возвращает пользователя в главное меню.
+    Если сообщение не соответствует стандартным командам, ищет его текст в каталоге (handlers.search),
+    а если ничего не найдено – возвращает пользователя в главное меню.
     В случае совпадения с определёнными ключевыми словами, отвечает случайным приколом.
     """
     if message.text.lower() not in ['скипа', 'лёха', 'леха']:
-        await start(message)
+        if not await show_results(message, message.text):
+            await start(message)
     else:
         responses = [
             "блядь, что не отнять", "пивная мразь", "сын фанки бара", "перетраханный сержант, недотраханный офицер",
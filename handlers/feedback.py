@@ -2,42 +2,68 @@
 
 from aiogram import types
 from aiogram.dispatcher import FSMContext
-from aiogram.dispatcher.filters import Text
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup
 from aiogram.dispatcher.filters.state import State, StatesGroup
 
 from bot import dp
-from db import cursor, db
+from callbacks import route, pack, callback_args
+from db import execute, commit
+from catalog import BRAND, get_node, resolve_names
+from orders import get_purchases_page
+import counters
 
 class FSMFeedback(StatesGroup):
     product = State()       
     feedback_text = State() 
 
-@dp.callback_query_handler(text="feedback", state=None)
-async def feedback_initiate(callback_query: types.CallbackQuery):
-    """
-    Обработка нажатия кнопки 'feedback'.
-    Формируется клавиатура с перечнем товаров, по которым можно оставить отзыв.
-    """
+async def _product_title(sku):
+    """Название купленного вкуса в виде "бренд линейка вкус"."""
+    return ' '.join((await resolve_names(int(sku)))[BRAND:])
+
+
+async def _show_purchases(callback_query, after=''):
+    """Показывает страницу купленных пользователем вкусов для выбора товара отзыва."""
     kb = InlineKeyboardMarkup(row_width=1)
-    # Пример: получение списка товаров пользователя из базы.
-    product_list = cursor.execute('SELECT product FROM id WHERE users=?', (str(callback_query.from_user.id),)).fetchone()[0]
-    for product in product_list.split(',')[:-1]:
-        kb.insert(InlineKeyboardButton(product, callback_data='fb_' + product))
+    skus, has_more = await get_purchases_page(callback_query.from_user.id, after)
+    for sku in skus:
+        # Вкусы, удалённые из каталога, в списке не показываются
+        if await get_node(int(sku)) is not None:
+            kb.insert(InlineKeyboardButton(await _product_title(sku), callback_data=pack('fb', sku)))
+    if has_more:
+        kb.add(InlineKeyboardButton('Ещё ▶️', callback_data=pack('fbPage', skus[-1])))
     kb.add(InlineKeyboardButton('Назад', callback_data='backin'))
     await callback_query.message.edit_text('Выберите товар для отзыва')
     await callback_query.message.edit_reply_markup(kb)
+
+
+@route('feedback')
+async def feedback_initiate(callback_query: types.CallbackQuery):
+    """
+    Обработка нажатия кнопки 'feedback'.
+    Формируется клавиатура с первой страницей купленных пользователем товаров (user_purchases).
+    """
+    await _show_purchases(callback_query)
     await FSMFeedback.product.set()
+    await callback_query.answer()
+
+@route('fbPage', state=FSMFeedback.product)
+async def feedback_page(callback_query: types.CallbackQuery):
+    """
+    Показывает следующую страницу купленных товаров: callback_data содержит последний sku предыдущей страницы.
+    """
+    await _show_purchases(callback_query, callback_args(callback_query)[0])
+    await callback_query.answer()
 
-@dp.callback_query_handler(state=FSMFeedback.product)
+@route('fb', state=FSMFeedback.product)
 async def feedback_product(callback_query: types.CallbackQuery, state: FSMContext):
     """
-    После выбора товара сохраняется выбранный товар,
+    После выбора товара сохраняется его название,
     затем пользователю предлагается ввести текст отзыва.
     """
+    product = await _product_title(callback_args(callback_query)[0])
     async with state.proxy() as data:
-        data['product'] = callback_query.data[len("fb_"):]  # Обрезаем префикс 'fb_'
-    await callback_query.message.edit_text('Можете написать свой отзыв на товар:\n' + callback_query.data[len("fb_"):])
+        data['product'] = product
+    await callback_query.message.edit_text('Можете написать свой отзыв на товар:\n' + product)
     kb = InlineKeyboardMarkup(row_width=2)
     kb.add(InlineKeyboardButton('Назад', callback_data='backin'))
     await callback_query.message.edit_reply_markup(kb)
@@ -50,8 +76,10 @@ async def feedback_text(message: types.Message, state: FSMContext):
     """
     async with state.proxy() as data:
         # Здесь сохраняем отзыв в таблицу feedbacks
-        cursor.execute('INSERT INTO feedbacks(chat, message, product) VALUES (?,?,?)',
-                        (message.chat.id, message.message_id, data['product']))
-    db.commit()
+        # Текст сохраняется, чтобы опубликованный отзыв показывался без пересылки
+        await execute('INSERT INTO feedbacks(chat, message, product, text) VALUES (?,?,?,?)',
+                        (message.chat.id, message.message_id, data['product'], message.text))
+    await commit()
+    counters.adjust(counters.FEEDBACKS, 1)
     await message.answer('Спасибо за отзыв!')
     await state.finish()
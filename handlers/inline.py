@@ -0,0 +1,55 @@
+# handlers/inline.py
+
+"""Inline-режим: "@бот <запрос>" в любом чате показывает линейки каталога с фото и ценой.
+
+Запрос обслуживается из памяти (catalog.find_products, префиксный индекс по названиям) без обращения
+к базе. Ответ общий для всех пользователей (цена без персональных скидок), поэтому Telegram кэширует
+его на INLINE_CACHE_TIME секунд; результаты отдаются страницами по INLINE_PAGE_SIZE через next_offset.
+Inline-режим включается у @BotFather командой /setinline.
+"""
+
+from aiogram import types
+
+from bot import dp
+from catalog import find_products, get_photo, get_file_id
+from config import INLINE_CACHE_TIME
+from media import NO_PHOTO, card_caption
+from pricing import format_price
+
+# Результатов на страницу (Telegram принимает не больше 50)
+INLINE_PAGE_SIZE = 20
+
+
+async def _result(product_id, title):
+    """Результат inline-запроса для линейки: фото (по file_id, если оно уже загружено) или текст без фото."""
+    photo = await get_photo(product_id) or (NO_PHOTO, '', 0)
+    url, desc, price = photo[0], photo[1] or '', format_price(photo[2] or 0)
+    caption = card_caption(title, desc, price)
+    file_id = await get_file_id(product_id, url)
+    if file_id is not None:
+        return types.InlineQueryResultCachedPhoto(
+            id=str(product_id), photo_file_id=file_id, title=title, description=price,
+            caption=caption, parse_mode='Markdown'
+        )
+    if url and url.startswith(('http://', 'https://')):
+        return types.InlineQueryResultPhoto(
+            id=str(product_id), photo_url=url, thumb_url=url, title=title, description=price,
+            caption=caption, parse_mode='Markdown'
+        )
+    return types.InlineQueryResultArticle(
+        id=str(product_id), title=title, description=price,
+        input_message_content=types.InputTextMessageContent(caption, parse_mode='Markdown')
+    )
+
+
+@dp.inline_handler()
+async def handle_inline_query(inline_query: types.InlineQuery):
+    """Отвечает на inline-запрос страницей найденных линеек; offset – номер первого результата страницы."""
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    found = await find_products(inline_query.query)
+    page = found[offset:offset + INLINE_PAGE_SIZE]
+    next_offset = str(offset + INLINE_PAGE_SIZE) if len(found) > offset + INLINE_PAGE_SIZE else ''
+    await inline_query.answer(
+        [await _result(product_id, title) for product_id, title in page],
+        cache_time=INLINE_CACHE_TIME, is_personal=False, next_offset=next_offset
+    )
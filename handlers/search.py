@@ -0,0 +1,40 @@
+# handlers/search.py
+
+"""Поиск по каталогу: команда /search и произвольный текст в чате (см. handle_default_message в client.py).
+
+Результат – одно сообщение с кнопками найденных линеек, ведущими сразу в карточку товара,
+без перехода по уровням ассортимент → бренд → линейка.
+"""
+
+from aiogram import types
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from bot import dp
+from callbacks import pack
+from catalog import search
+
+
+async def show_results(message: types.Message, text):
+    """Отвечает на message списком линеек, найденных по text. Возвращает False, если ничего не найдено."""
+    results = await search(text)
+    if not results:
+        return False
+    kb = InlineKeyboardMarkup(row_width=1)
+    for product_id, title in results:
+        kb.insert(InlineKeyboardButton(title, callback_data=pack('product', product_id)))
+    kb.add(InlineKeyboardButton('Меню', callback_data='back'))
+    await message.answer(f'Найдено по запросу «{text}»:', reply_markup=kb)
+    return True
+
+
+@dp.message_handler(commands=['search'])
+async def handle_search_command(message: types.Message):
+    """
+    Обрабатывает команду "/search <запрос>": ищет линейки по названиям ассортимента, бренда, линейки,
+    вкусов и по описанию.
+    """
+    text = message.get_args()
+    if not text:
+        await message.answer('Напишите, что найти, например: /search манго')
+    elif not await show_results(message, text):
+        await message.answer(f'По запросу «{text}» ничего не найдено')
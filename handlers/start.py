@@ -8,8 +8,12 @@
 
 from aiogram import types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from bot import dp, bot
-from db import cursor, db
+from bot import dp
+from callbacks import pack
+from db import fetchone, execute, commit
+from media import show_text
+import counters
+import outbox
 from config import ADMIN_IDS
 
 async def start(message, inline=False):
@@ -22,32 +26,40 @@ async def start(message, inline=False):
     
     Примечания:
         - Кнопки добавляются в зависимости от состояния пользователя (наличие корзины, истории, скидок).
+        - Данные пользователя читаются одним запросом, глобальные счётчики берутся из памяти (модуль counters).
     """
+    # Флаги пользователя и наличие корзины – одним запросом по первичному ключу
+    user_row = await fetchone(
+        'SELECT EXISTS (SELECT 1 FROM orders WHERE user_id = id.users), spend, ban, '
+        'EXISTS (SELECT 1 FROM cart_items WHERE user_id = id.users) FROM id WHERE users = ?',
+        (message.from_user.id,)
+    )
+    has_orders, spend, ban, has_cart = user_row if user_row is not None else (False, 0, 0, False)
+
     kb = InlineKeyboardMarkup(row_width=2)
     menu_btn = InlineKeyboardButton(text='Ассортимент🗂', callback_data='Ассортимент🗂')
     kb.add(menu_btn)
     
     # Если есть активные акции и пользователь не является администратором, добавляем кнопку "Акции"
-    if cursor.execute('SELECT count(*) FROM sales').fetchone()[0] != 0 and (message.from_user.id not in ADMIN_IDS):
+    if await counters.get(counters.SALES) != 0 and (message.from_user.id not in ADMIN_IDS):
         kb.add(InlineKeyboardButton(text='Акции🎁', callback_data='sales'))
         
     kb.add(InlineKeyboardButton(text='Связь с менеджером👨‍💻', callback_data='Связь с менеджером👨‍💻'))
     
     # Проверка наличия записей в таблице корзины для данного пользователя
-    if cursor.execute("SELECT count(*) FROM {} ".format(f'"{message.from_user.id}"')).fetchone()[0] != 0:
-        kb.add(InlineKeyboardButton('Открыть корзину', callback_data='cart1'))
+    if has_cart:
+        kb.add(InlineKeyboardButton('Открыть корзину', callback_data=pack('cart', 1)))
     
     # Если у пользователя есть история покупок, добавляем соответствующую кнопку
-    if cursor.execute('SELECT history FROM id WHERE users = ?', (str(message.from_user.id),)).fetchone()[0] != 'None':
+    if has_orders:
         kb.add(InlineKeyboardButton('История покупок 📋', callback_data='history'))
     
     # Если пользователь не новый и не заблокирован, разрешаем оставлять отзывы
-    if (cursor.execute('SELECT spend FROM id WHERE users = ?', (str(message.from_user.id),)).fetchone()[0] != 0 and
-        cursor.execute('SELECT ban FROM id WHERE users = ?', (str(message.from_user.id),)).fetchone()[0] != 1):
+    if spend != 0 and ban != 1:
         kb.add(InlineKeyboardButton('Оставить отзыв ✍️', callback_data='feedback'))
     
     # Если есть отзывы, добавляем кнопку для их просмотра
-    if cursor.execute('SELECT count(*) FROM otz').fetchone()[0] != 0:
+    if await counters.get(counters.OTZ) != 0:
         kb.add(InlineKeyboardButton('Наши отзывы ✅', callback_data='otz'))
     
     # Для администраторов добавляем дополнительные кнопки
@@ -58,13 +70,13 @@ async def start(message, inline=False):
             InlineKeyboardButton('Рассылка', callback_data='Рассылка'),
             InlineKeyboardButton(text='Акции🎁', callback_data='sales')
         )
-        if cursor.execute('SELECT count(*) FROM feedbacks').fetchone()[0] != 0:
+        if await counters.get(counters.FEEDBACKS) != 0:
             kb.insert(InlineKeyboardButton('Новые отзывы!', callback_data='Отзывы'))
     
     # Если режим inline – редактируем предыдущее сообщение, иначе – отправляем новое
     if inline:
-        await message.message.edit_text('Что вас интересует?')  # Редактирование текста сообщения
-        await message.message.edit_reply_markup(reply_markup=kb)
+        # Меню открывается и из карточки товара – сообщения с фото
+        await show_text(message.message, 'Что вас интересует?', reply_markup=kb)
         await message.answer()
     else:
         await message.answer('Что вас интересует?', reply_markup=kb)
@@ -73,32 +85,23 @@ async def start(message, inline=False):
 async def handle_start_command(message: types.Message):
     """
     Обрабатывает команду /start:
-        - Создаёт таблицы для хранения данных пользователя и его корзины, если они ещё не существуют.
         - Регистрирует нового пользователя в таблице, пересылает стартовое сообщение администратору и отправляет приветственное сообщение.
         - Обновляет поле start, если оно отсутствует.
     
     Аргументы:
         message (types.Message): Сообщение, полученное от пользователя.
     """
-    # Создание таблицы для хранения данных пользователя, если она отсутствует
-    cursor.execute('CREATE TABLE IF NOT EXISTS id (users TEXT, history TEXT DEFAULT NULL, first_client INTEGER DEFAULT 1, first_pressed INTEGER DEFAULT 0, spend INTEGER DEFAULT 0, start INTEGER DEFAULT NULL, product TEXT DEFAULT NULL, ban INTEGER DEFAULT 0)')
-    
-    # Создание таблицы для хранения корзины конкретного пользователя
-    cursor.execute('CREATE TABLE IF NOT EXISTS {} (cart TEXT, price TEXT, count INTEGER)'.format(f'"{message.from_user.id}"'))
-    db.commit()
-    
     # Если пользователь новый, добавляем его в таблицу id и уведомляем админа
-    if cursor.execute('SELECT count(*) FROM id WHERE users = ?', (str(message.from_user.id),)).fetchone()[0] == 0:
-        cursor.execute('INSERT INTO id (users, start, first_client) VALUES (?, ?, ?)', (str(message.from_user.id), message.message_id, 1))
-        db.commit()
+    if (await fetchone('SELECT count(*) FROM id WHERE users = ?', (message.from_user.id,)))[0] == 0:
+        await execute('INSERT INTO id (users, start, first_client) VALUES (?, ?, ?)', (message.from_user.id, message.message_id, 1))
         # Пересылаем сообщение администратору для уведомления
-        await bot.forward_message(1150081965, message.chat.id, message.message_id)
-        await bot.send_message(1150081965, '@' + (message.from_user.username or 'unknown'))
+        outbox.forward_message(1150081965, message.chat.id, message.message_id, priority=outbox.ADMIN)
+        outbox.send_message(1150081965, '@' + (message.from_user.username or 'unknown'), priority=outbox.ADMIN)
         await message.answer('Добро пожаловать в Smoko❤️')
     
     # Обновляем поле start, если оно ещё не установлено
-    if cursor.execute('SELECT start FROM id WHERE users = ?', (str(message.from_user.id),)).fetchone()[0] is None:
-        cursor.execute('UPDATE id SET start=? WHERE users=?', (message.message_id, str(message.from_user.id)))
-        db.commit()
-        
+    if (await fetchone('SELECT start FROM id WHERE users = ?', (message.from_user.id,)))[0] is None:
+        await execute('UPDATE id SET start=? WHERE users=?', (message.message_id, message.from_user.id))
+    await commit()
+
     await start(message)
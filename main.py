@@ -1,7 +1,38 @@
 # main.py
 
+import asyncio
+import logging
+
 from aiogram import executor
 from bot import dp
+from config import CHECKPOINT_INTERVAL, BOT_MODE, SKIP_UPDATES, WORKERS
+from db import init_db, checkpoint_loop
+from broadcasts import resume_campaigns
+import order_digest
+import outbox
+import handlers  # noqa: F401 – регистрирует обработчики в dp
+
+
+async def on_startup(dp):
+    if CHECKPOINT_INTERVAL:
+        asyncio.create_task(checkpoint_loop())
+    await resume_campaigns()
+
+
+async def on_shutdown(dp):
+    # Накопленная сводка заказов ставится в очередь, затем очередь отправляется до конца
+    order_digest.flush()
+    await outbox.flush()
+
 
 if __name__ == '__main__':
-    executor.start_polling(dp, skip_updates=True)
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    if WORKERS > 1:
+        from sharding import run
+        run(WORKERS, on_startup=on_startup, on_shutdown=on_shutdown)
+    elif BOT_MODE == 'webhook':
+        from webhook import start_webhook
+        start_webhook(dp, on_startup=on_startup, on_shutdown=on_shutdown)
+    else:
+        executor.start_polling(dp, skip_updates=SKIP_UPDATES, on_startup=on_startup, on_shutdown=on_shutdown)
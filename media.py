@@ -0,0 +1,75 @@
+# media.py
+
+"""Карточки товаров: фото с подписью вместо скрытой ссылки на картинку в тексте.
+
+Карточка линейки (assortment) и позиции корзины (cart) – сообщение-фото с описанием и ценой в подписи.
+Фото отправляется по file_id (catalog.get_file_id); если его ещё нет, Telegram один раз скачивает
+картинку по ссылке из photos, а file_id из ответа запоминается (catalog.save_file_id), и дальше
+внешний хостинг не участвует.
+
+Текстовое сообщение нельзя превратить в фото и наоборот, поэтому при переходе между карточкой и
+текстовым экраном сообщение заменяется: новое отправляется, старое удаляется (show_card, show_text).
+"""
+
+from aiogram import types
+from aiogram.utils.exceptions import BadRequest, MessageNotModified
+
+from catalog import get_file_id, save_file_id
+
+# Максимальная длина подписи к фото
+CAPTION_LIMIT = 1024
+# Значение photos.photos у линейки без фото
+NO_PHOTO = 'без фото'
+
+
+def card_caption(title, desc, price):
+    """Подпись карточки (Markdown); описание сокращается, чтобы подпись уместилась в CAPTION_LIMIT."""
+    head, tail = f'*{title}*\n*Описание:*\n', f'\n*Цена:* {price}'
+    room = CAPTION_LIMIT - len(head) - len(tail)
+    if len(desc) > room:
+        desc = desc[:room - 1] + '…'
+    return head + desc + tail
+
+
+async def show_text(message: types.Message, text, reply_markup=None, parse_mode=None):
+    """Показывает текстовый экран в сообщении message (заменяя его, если это карточка с фото)."""
+    if message.photo:
+        await message.bot.send_message(message.chat.id, text, parse_mode=parse_mode, reply_markup=reply_markup)
+        await message.delete()
+    else:
+        await message.edit_text(text, parse_mode=parse_mode, reply_markup=reply_markup)
+
+
+async def _put_photo(message, photo, caption, reply_markup):
+    if message.photo:
+        media = types.InputMediaPhoto(photo, caption=caption, parse_mode='Markdown')
+        return await message.edit_media(media, reply_markup=reply_markup)
+    sent = await message.bot.send_photo(message.chat.id, photo, caption=caption, parse_mode='Markdown',
+                                        reply_markup=reply_markup)
+    await message.delete()
+    return sent
+
+
+async def show_card(message: types.Message, product_id, url, caption, reply_markup=None):
+    """
+    Показывает карточку линейки product_id в сообщении message: фото url с подписью caption (Markdown).
+
+    Линейка без фото показывается текстом.
+    """
+    if not url or url == NO_PHOTO:
+        await show_text(message, caption, reply_markup, parse_mode='Markdown')
+        return
+    file_id = await get_file_id(product_id, url)
+    try:
+        sent = await _put_photo(message, file_id or url, caption, reply_markup)
+    except MessageNotModified:
+        return
+    except BadRequest:
+        if file_id is None:
+            raise
+        # Сохранённый file_id больше не принимается (например, у бота сменился токен)
+        await save_file_id(product_id, url, None)
+        file_id = None
+        sent = await _put_photo(message, url, caption, reply_markup)
+    if file_id is None and isinstance(sent, types.Message) and sent.photo:
+        await save_file_id(product_id, url, sent.photo[-1].file_id)
@@ -0,0 +1,68 @@
+# middlewares.py
+
+"""Middleware диспетчера.
+
+StaleCallbackMiddleware отвечает на нажатие кнопки, которое не обработал ни один обработчик.
+
+UnitOfWorkMiddleware оборачивает обработку каждого апдейта в единицу работы db:
+изменения апдейта фиксируются после обработчика (и перед каждым запросом к Bot API,
+см. db.end_write_section), а если обработчик завершился исключением – откатываются изменения
+после последней фиксации.
+"""
+
+from aiogram.dispatcher.handler import ctx_data, current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from db import begin_unit_of_work, current_unit_of_work, end_unit_of_work
+
+
+class UnitOfWorkMiddleware(BaseMiddleware):
+    """Одна транзакция на апдейт: открывается до обработчиков и закрывается после них."""
+
+    def setup(self, manager):
+        super().setup(manager)
+        # Об исключении обработчика middleware узнаёт через обработчик ошибок диспетчера
+        manager.dispatcher.register_errors_handler(self._mark_failed)
+
+    async def on_pre_process_update(self, update, data):
+        data['unit_of_work'] = begin_unit_of_work()
+
+    async def on_post_process_update(self, update, results, data):
+        await end_unit_of_work(*data.pop('unit_of_work'))
+
+    async def _mark_failed(self, update, exception):
+        uow = current_unit_of_work()
+        if uow is not None:
+            uow.failed = True
+
+
+# Ключ в данных обработки callback query: нажатие обработано
+CALLBACK_HANDLED = 'callback_handled'
+
+
+def mark_callback_handled():
+    """Отмечает, что текущее нажатие обработано (вызывает маршрутизатор кнопок, найдя обработчик)."""
+    ctx_data.get()[CALLBACK_HANDLED] = True
+
+
+class StaleCallbackMiddleware(BaseMiddleware):
+    """
+    Отвечает «Кнопка устарела» на нажатие, для которого не нашлось обработчика (например, кнопка
+    формата, которого нет в callbacks.LEGACY): без ответа у клиента до таймаута крутится индикатор загрузки.
+
+    router_handler – общий обработчик маршрутизатора кнопок: он пропускает нажатия без маршрута
+    и сам отмечает обработанные (mark_callback_handled). Остальные обработчики считаются обработавшими нажатие,
+    если прошли их фильтры.
+    """
+
+    def __init__(self, router_handler):
+        super().__init__()
+        self.router_handler = router_handler
+
+    async def on_process_callback_query(self, callback_query, data):
+        if current_handler.get() != self.router_handler:
+            data[CALLBACK_HANDLED] = True
+
+    async def on_post_process_callback_query(self, callback_query, results, data):
+        if not data.get(CALLBACK_HANDLED):
+            await callback_query.answer('Кнопка устарела')
@@ -0,0 +1,375 @@
+# migrations.py
+
+"""Версионные миграции схемы базы данных.
+
+Применённые шаги записываются в таблицу schema_version, поэтому каждый шаг выполняется один раз.
+Шаг – функция, принимающая соединение sqlite3; он выполняется в отдельной транзакции,
+а время его выполнения пишется в лог, чтобы миграцию большой боевой базы можно было контролировать.
+Новые шаги добавляются только в конец списка MIGRATIONS.
+"""
+
+import datetime
+import logging
+import re
+import sqlite3
+import time
+
+log = logging.getLogger(__name__)
+
+
+def create_base_tables(connection: sqlite3.Connection):
+    """Исходные таблицы бота (для существующих баз ничего не меняет)."""
+    connection.execute('CREATE TABLE IF NOT EXISTS photos (names TEXT, photos TEXT, desc TEXT, price TEXT)')
+    connection.execute('CREATE TABLE IF NOT EXISTS sales (positions TEXT, desc TEXT, id INTEGER PRIMARY KEY)')
+    connection.execute('CREATE TABLE IF NOT EXISTS feedbacks (chat INTEGER, message INTEGER, product TEXT)')
+    connection.execute('CREATE TABLE IF NOT EXISTS otz (chat INTEGER, message INTEGER, product TEXT)')
+    connection.execute('CREATE TABLE IF NOT EXISTS id (users TEXT, history TEXT DEFAULT NULL, first_client INTEGER DEFAULT 1, first_pressed INTEGER DEFAULT 0, spend INTEGER DEFAULT 0, start INTEGER DEFAULT NULL, product TEXT DEFAULT NULL, ban INTEGER DEFAULT 0)')
+
+
+def migrate_cart_tables(connection: sqlite3.Connection):
+    """
+    Переносит старые корзины из таблиц вида "<user_id>" (cart, price, count) в общую таблицу cart_items.
+
+    Таблицы каталога тоже называются числами, поэтому корзина определяется по наличию колонки cart.
+    После переноса таблица пользователя удаляется.
+    """
+    # Корзины всех пользователей: составной ключ позволяет читать корзину одним диапазоном по индексу
+    connection.execute('CREATE TABLE IF NOT EXISTS cart_items (user_id INTEGER NOT NULL, sku TEXT NOT NULL, price TEXT, count INTEGER NOT NULL DEFAULT 1, PRIMARY KEY (user_id, sku)) WITHOUT ROWID')
+    tables = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()]
+    for name in tables:
+        if not name.lstrip('-').isdigit():
+            continue
+        columns = [column[1] for column in connection.execute(f'PRAGMA table_info("{name}")').fetchall()]
+        if 'cart' not in columns:
+            continue
+        connection.execute(
+            f'INSERT INTO cart_items (user_id, sku, price, count) SELECT ?, cart, price, count FROM "{name}" WHERE cart IS NOT NULL '
+            'ON CONFLICT (user_id, sku) DO UPDATE SET count = count + excluded.count',
+            (int(name),)
+        )
+        connection.execute(f'DROP TABLE "{name}"')
+
+
+def migrate_catalog_tables(connection: sqlite3.Connection):
+    """
+    Переносит каталог из таблиц "Ассортимент🗂", "2", "2_1", "2_1_1" (tastes, id) в catalog_nodes.
+
+    Старые коды вида "2_1_1_2" заменяются глобальными id узлов в photos.names и cart_items.sku,
+    после чего старые таблицы удаляются. Если таблицы "Ассортимент🗂" нет, переносить нечего.
+    """
+    # Каталог: одно дерево ассортимент → бренд → линейка → вкус
+    connection.execute('CREATE TABLE IF NOT EXISTS catalog_nodes (id INTEGER PRIMARY KEY, parent_id INTEGER, level INTEGER NOT NULL, name TEXT NOT NULL, position INTEGER NOT NULL DEFAULT 0)')
+    connection.execute('CREATE INDEX IF NOT EXISTS catalog_nodes_parent ON catalog_nodes (parent_id, position)')
+    root = 'Ассортимент🗂'
+    if connection.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (root,)).fetchone() is None:
+        return
+    tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
+    new_ids = {}
+
+    def copy_level(table, parent_code, parent_id, level):
+        if table not in tables:
+            return
+        for name, old_id in connection.execute(f'SELECT tastes, id FROM "{table}" ORDER BY id').fetchall():
+            code = f'{parent_code}_{old_id}' if parent_code else str(old_id)
+            new_ids[code] = connection.execute(
+                'INSERT INTO catalog_nodes (parent_id, level, name, position) VALUES (?, ?, ?, ?)',
+                (parent_id, level, name, old_id)
+            ).lastrowid
+            if level < 3:
+                copy_level(code, code, new_ids[code], level + 1)
+
+    copy_level(root, '', None, 0)
+    for code, node_id in new_ids.items():
+        connection.execute('UPDATE photos SET names = ? WHERE names = ?', (str(node_id), code))
+        connection.execute('UPDATE cart_items SET sku = ? WHERE sku = ?', (str(node_id), code))
+    connection.execute(f'DROP TABLE "{root}"')
+    for table in tables:
+        if table.replace('_', '').isdigit():
+            connection.execute(f'DROP TABLE "{table}"')
+
+
+def add_keys_and_indexes(connection: sqlite3.Connection):
+    """
+    Добавляет первичные ключи и индексы:
+        - id.users становится INTEGER PRIMARY KEY (дубликаты пользователей отбрасываются);
+        - photos.names становится первичным ключом (остаётся последняя запись товара);
+        - индексы (chat, message) для feedbacks и otz;
+        - удаляется неиспользуемая таблица users.
+    """
+    connection.execute('CREATE TABLE id_new (users INTEGER PRIMARY KEY, history TEXT DEFAULT NULL, first_client INTEGER DEFAULT 1, first_pressed INTEGER DEFAULT 0, spend INTEGER DEFAULT 0, start INTEGER DEFAULT NULL, product TEXT DEFAULT NULL, ban INTEGER DEFAULT 0)')
+    connection.execute(
+        'INSERT OR IGNORE INTO id_new SELECT CAST(users AS INTEGER), history, first_client, first_pressed, spend, start, product, ban '
+        'FROM id WHERE users IS NOT NULL ORDER BY rowid'
+    )
+    connection.execute('DROP TABLE id')
+    connection.execute('ALTER TABLE id_new RENAME TO id')
+
+    connection.execute('CREATE TABLE photos_new (names TEXT PRIMARY KEY, photos TEXT, desc TEXT, price TEXT)')
+    connection.execute('INSERT OR IGNORE INTO photos_new SELECT names, photos, desc, price FROM photos WHERE names IS NOT NULL ORDER BY rowid DESC')
+    connection.execute('DROP TABLE photos')
+    connection.execute('ALTER TABLE photos_new RENAME TO photos')
+
+    connection.execute('CREATE INDEX IF NOT EXISTS feedbacks_chat_message ON feedbacks (chat, message)')
+    connection.execute('CREATE INDEX IF NOT EXISTS otz_chat_message ON otz (chat, message)')
+    connection.execute('DROP TABLE IF EXISTS users')
+
+
+def migrate_order_history(connection: sqlite3.Connection):
+    """
+    Создаёт таблицы orders и order_items и переносит в них текстовую историю id.history.
+
+    Заказы в истории разделены чертой, каждый имеет вид "дд-мм-гг:\n<позиция> - <n>шт.\n\n...На сумму: <x>₽".
+    Позиция сохраняется названием (name), sku заполняется, если название находится в каталоге.
+    После переноса id.history очищается.
+    """
+    connection.execute('CREATE TABLE IF NOT EXISTS orders (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, created_at INTEGER NOT NULL, total INTEGER NOT NULL)')
+    connection.execute('CREATE INDEX IF NOT EXISTS orders_user ON orders (user_id, id)')
+    # name – название позиции на момент заказа: история не зависит от последующих правок каталога
+    connection.execute('CREATE TABLE IF NOT EXISTS order_items (order_id INTEGER NOT NULL, sku TEXT, qty INTEGER NOT NULL, unit_price INTEGER, name TEXT NOT NULL)')
+    connection.execute('CREATE INDEX IF NOT EXISTS order_items_order ON order_items (order_id)')
+
+    # "бренд линейка вкус" -> id вкуса, так же как название собиралось при оформлении заказа
+    skus = {
+        f'{brand} {product} {flavor}': str(flavor_id)
+        for brand, product, flavor, flavor_id in connection.execute(
+            'SELECT b.name, p.name, f.name, f.id FROM catalog_nodes f '
+            'JOIN catalog_nodes p ON p.id = f.parent_id JOIN catalog_nodes b ON b.id = p.parent_id WHERE f.level = 3'
+        )
+    }
+    item_re = re.compile(r'^(.+) - (\d+)шт\.$')
+    total_re = re.compile(r'На сумму: (-?\d+)₽')
+    rows = connection.execute("SELECT users, history FROM id WHERE history IS NOT NULL AND history NOT IN ('', 'None')").fetchall()
+    for user_id, history in rows:
+        # Текст хранится от новых заказов к старым, а id заказов растут со временем
+        for entry in reversed(history.split('\n——————————————————-\n')):
+            date, _, body = entry.partition(':\n')
+            try:
+                created_at = int(datetime.datetime.strptime(date.strip(), '%d-%m-%y').timestamp())
+            except ValueError:
+                created_at = 0
+            total = total_re.search(body)
+            order_id = connection.execute(
+                'INSERT INTO orders (user_id, created_at, total) VALUES (?, ?, ?)',
+                (user_id, created_at, int(total.group(1)) if total else 0)
+            ).lastrowid
+            for line in body.splitlines():
+                match = item_re.match(line.strip())
+                if match:
+                    connection.execute(
+                        'INSERT INTO order_items (order_id, sku, qty, unit_price, name) VALUES (?, ?, ?, NULL, ?)',
+                        (order_id, skus.get(match.group(1)), int(match.group(2)), match.group(1))
+                    )
+    connection.execute('UPDATE id SET history = NULL')
+
+
+def create_user_purchases(connection: sqlite3.Connection):
+    """
+    Создаёт таблицу user_purchases – купленные пользователем вкусы без повторов – и заполняет её
+    из order_items и строки id.product, после чего id.product очищается.
+    """
+    connection.execute('CREATE TABLE IF NOT EXISTS user_purchases (user_id INTEGER NOT NULL, sku TEXT NOT NULL, first_bought INTEGER NOT NULL, last_bought INTEGER NOT NULL, times INTEGER NOT NULL DEFAULT 1, PRIMARY KEY (user_id, sku)) WITHOUT ROWID')
+    connection.execute(
+        'INSERT OR IGNORE INTO user_purchases (user_id, sku, first_bought, last_bought, times) '
+        'SELECT o.user_id, i.sku, min(o.created_at), max(o.created_at), count(DISTINCT o.id) '
+        'FROM order_items i JOIN orders o ON o.id = i.order_id WHERE i.sku IS NOT NULL GROUP BY o.user_id, i.sku'
+    )
+    # В id.product названия "бренд линейка вкус," – берём те, что ещё есть в каталоге
+    skus = {
+        f'{brand} {product} {flavor}': str(flavor_id)
+        for brand, product, flavor, flavor_id in connection.execute(
+            'SELECT b.name, p.name, f.name, f.id FROM catalog_nodes f '
+            'JOIN catalog_nodes p ON p.id = f.parent_id JOIN catalog_nodes b ON b.id = p.parent_id WHERE f.level = 3'
+        )
+    }
+    rows = connection.execute("SELECT users, product FROM id WHERE product IS NOT NULL AND product NOT IN ('', 'None')").fetchall()
+    for user_id, products in rows:
+        for name in set(products.split(',')[:-1]):
+            if name in skus:
+                connection.execute(
+                    'INSERT OR IGNORE INTO user_purchases (user_id, sku, first_bought, last_bought, times) VALUES (?, ?, 0, 0, ?)',
+                    (user_id, skus[name], products.split(',').count(name))
+                )
+    connection.execute('UPDATE id SET product = NULL')
+
+
+def store_prices_in_minor_units(connection: sqlite3.Connection):
+    """
+    Переводит цены в целые копейки: photos.price и cart_items.price из текста вида "100₽",
+    order_items.unit_price, orders.total и id.spend – из рублей. Нераспознанная цена становится NULL.
+    """
+    def to_minor(text):
+        match = re.search(r'(\d+)(?:[.,](\d{1,2}))?', str(text)) if text is not None else None
+        if match is None:
+            return None
+        return int(match.group(1)) * 100 + int((match.group(2) or '0').ljust(2, '0'))
+
+    connection.create_function('to_minor', 1, to_minor, deterministic=True)
+
+    connection.execute('CREATE TABLE photos_new (names TEXT PRIMARY KEY, photos TEXT, desc TEXT, price INTEGER)')
+    connection.execute('INSERT INTO photos_new SELECT names, photos, desc, to_minor(price) FROM photos')
+    connection.execute('DROP TABLE photos')
+    connection.execute('ALTER TABLE photos_new RENAME TO photos')
+
+    connection.execute('CREATE TABLE cart_items_new (user_id INTEGER NOT NULL, sku TEXT NOT NULL, price INTEGER, count INTEGER NOT NULL DEFAULT 1, PRIMARY KEY (user_id, sku)) WITHOUT ROWID')
+    connection.execute('INSERT INTO cart_items_new SELECT user_id, sku, to_minor(price), count FROM cart_items')
+    connection.execute('DROP TABLE cart_items')
+    connection.execute('ALTER TABLE cart_items_new RENAME TO cart_items')
+
+    connection.execute('UPDATE order_items SET unit_price = unit_price * 100 WHERE unit_price IS NOT NULL')
+    connection.execute('UPDATE orders SET total = total * 100')
+    connection.execute('UPDATE id SET spend = spend * 100')
+
+
+def create_campaigns(connection: sqlite3.Connection):
+    """
+    Создаёт таблицу рассылок campaigns и флаг id.blocked для пользователей, заблокировавших бота.
+
+    cursor – id последнего обработанного получателя: рассылка продолжается с него после перезапуска.
+    """
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS campaigns (id INTEGER PRIMARY KEY, text TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'running', "
+        'cursor INTEGER NOT NULL DEFAULT 0, total INTEGER NOT NULL DEFAULT 0, sent INTEGER NOT NULL DEFAULT 0, '
+        'failed INTEGER NOT NULL DEFAULT 0, blocked INTEGER NOT NULL DEFAULT 0, created_at INTEGER NOT NULL, '
+        'finished_at INTEGER, admin_chat INTEGER, progress_message INTEGER)'
+    )
+    connection.execute('ALTER TABLE id ADD COLUMN blocked INTEGER NOT NULL DEFAULT 0')
+
+
+def create_fsm_states(connection: sqlite3.Connection):
+    """
+    Создаёт таблицу состояний диалогов (FSM) fsm_states: состояние, данные и bucket в JSON.
+
+    updated_at – время последнего изменения: по нему удаляются брошенные диалоги.
+    """
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS fsm_states (chat TEXT NOT NULL, user TEXT NOT NULL, state TEXT, '
+        "data TEXT NOT NULL DEFAULT '{}', bucket TEXT NOT NULL DEFAULT '{}', updated_at INTEGER NOT NULL, "
+        'PRIMARY KEY (chat, user)) WITHOUT ROWID'
+    )
+    connection.execute('CREATE INDEX IF NOT EXISTS fsm_states_updated_at ON fsm_states (updated_at)')
+
+
+def create_callback_payloads(connection: sqlite3.Connection):
+    """
+    Создаёт таблицу callback_payloads: данные inline-кнопок (JSON), на которые ссылается короткий токен в callback_data.
+
+    expires_at – время, после которого кнопка считается устаревшей и строка удаляется.
+    """
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS callback_payloads (token TEXT PRIMARY KEY, payload TEXT NOT NULL, '
+        'expires_at INTEGER NOT NULL) WITHOUT ROWID'
+    )
+    connection.execute('CREATE INDEX IF NOT EXISTS callback_payloads_expires_at ON callback_payloads (expires_at)')
+
+
+def add_review_texts(connection: sqlite3.Connection):
+    """
+    Готовит отзывы к постраничному просмотру:
+        - otz получает ключ id (порядок публикации) для keyset-пагинации и колонку text;
+        - feedbacks получает колонку text – текст отзыва сохраняется при получении.
+
+    У отзывов, опубликованных раньше, текста нет (text IS NULL): такие отзывы по-прежнему пересылаются.
+    """
+    connection.execute('CREATE TABLE otz_new (id INTEGER PRIMARY KEY, chat INTEGER, message INTEGER, product TEXT, text TEXT)')
+    connection.execute('INSERT INTO otz_new (chat, message, product) SELECT chat, message, product FROM otz ORDER BY rowid')
+    connection.execute('DROP TABLE otz')
+    connection.execute('ALTER TABLE otz_new RENAME TO otz')
+    connection.execute('CREATE INDEX IF NOT EXISTS otz_chat_message ON otz (chat, message)')
+    connection.execute('ALTER TABLE feedbacks ADD COLUMN text TEXT')
+
+
+def add_feedback_queue_key(connection: sqlite3.Connection):
+    """
+    Добавляет очереди модерации feedbacks ключ id (порядок поступления): очередь читается страницами
+    по id, а кнопки модерации ссылаются на отзывы по id.
+    """
+    connection.execute('CREATE TABLE feedbacks_new (id INTEGER PRIMARY KEY, chat INTEGER, message INTEGER, product TEXT, text TEXT)')
+    connection.execute(
+        'INSERT INTO feedbacks_new (chat, message, product, text) SELECT chat, message, product, text FROM feedbacks ORDER BY rowid'
+    )
+    connection.execute('DROP TABLE feedbacks')
+    connection.execute('ALTER TABLE feedbacks_new RENAME TO feedbacks')
+    connection.execute('CREATE INDEX IF NOT EXISTS feedbacks_chat_message ON feedbacks (chat, message)')
+
+
+def create_photo_files(connection: sqlite3.Connection):
+    """
+    Создаёт таблицу photo_files: file_id фото линейки, загруженного в Telegram, и ссылка, с которой оно загружено.
+
+    file_id действителен, пока ссылка в photos не изменилась.
+    """
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS photo_files (product_id INTEGER PRIMARY KEY, url TEXT NOT NULL, file_id TEXT NOT NULL)'
+    )
+
+
+def create_catalog_search(connection: sqlite3.Connection):
+    """
+    Создаёт полнотекстовый индекс каталога catalog_search (FTS5): одна строка на линейку, rowid – id линейки,
+    колонки – названия ассортимента, бренда, линейки, вкусов (через пробел) и описание из photos.
+
+    Индекс заполняется по текущему каталогу, дальше его обновляют функции catalog.py при изменениях.
+    """
+    connection.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS catalog_search USING fts5(category, brand, line, flavors, desc, '
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    connection.execute(
+        'INSERT INTO catalog_search (rowid, category, brand, line, flavors, desc) '
+        'SELECT p.id, c.name, b.name, p.name, '
+        "(SELECT group_concat(f.name, ' ') FROM catalog_nodes f WHERE f.parent_id = p.id), "
+        '(SELECT desc FROM photos WHERE names = CAST(p.id AS TEXT)) '
+        'FROM catalog_nodes p JOIN catalog_nodes b ON b.id = p.parent_id JOIN catalog_nodes c ON c.id = b.parent_id '
+        'WHERE p.level = 2'
+    )
+
+
+# Упорядоченный список шагов: (версия, функция). Версии только растут.
+MIGRATIONS = [
+    (1, create_base_tables),
+    (2, migrate_cart_tables),
+    (3, migrate_catalog_tables),
+    (4, add_keys_and_indexes),
+    (5, migrate_order_history),
+    (6, create_user_purchases),
+    (7, store_prices_in_minor_units),
+    (8, create_campaigns),
+    (9, create_fsm_states),
+    (10, create_callback_payloads),
+    (11, add_review_texts),
+    (12, add_feedback_queue_key),
+    (13, create_photo_files),
+    (14, create_catalog_search),
+]
+
+
+def migrate(connection: sqlite3.Connection):
+    """
+    Применяет все ещё не выполненные шаги миграции по порядку.
+
+    Возвращает список (версия, название шага, длительность в секундах) для применённых шагов.
+    """
+    connection.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at INTEGER NOT NULL, duration REAL NOT NULL)')
+    connection.commit()
+    current = connection.execute('SELECT coalesce(max(version), 0) FROM schema_version').fetchone()[0]
+    timings = []
+    for version, step in MIGRATIONS:
+        if version <= current:
+            continue
+        started = time.perf_counter()
+        try:
+            connection.execute('BEGIN')
+            step(connection)
+            duration = time.perf_counter() - started
+            connection.execute(
+                'INSERT INTO schema_version (version, name, applied_at, duration) VALUES (?, ?, ?, ?)',
+                (version, step.__name__, int(time.time()), duration)
+            )
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            log.exception('Миграция %s (%s) не выполнена', version, step.__name__)
+            raise
+        log.info('Миграция %s (%s) применена за %.3f с', version, step.__name__, duration)
+        timings.append((version, step.__name__, duration))
+    return timings
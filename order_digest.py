@@ -0,0 +1,136 @@
+# order_digest.py
+
+"""Уведомления администраторов о новых заказах.
+
+Оформление заказа не ждёт отправки: notify_order вызывается после фиксации заказа (db.after_commit)
+и только ставит уведомление в очередь outbox с приоритетом ADMIN – адресатами являются ADMIN_IDS.
+Первый заказ после затишья уходит сразу отдельным сообщением (с пересылкой стартового сообщения покупателя).
+Заказы, пришедшие в течение ORDER_DIGEST_INTERVAL секунд после предыдущей отправки, копятся и уходят одной
+сводкой – по окончании интервала или как только их наберётся ORDER_DIGEST_SIZE. В сводке у каждого заказа
+своя кнопка «Спросить c дурака», поэтому число вызовов API не зависит от частоты заказов.
+
+При нескольких процессах (sharding.py) сводку ведёт воркер 0: остальные воркеры передают ему заказы
+(set_forwarder), и администраторы получают одну сводку, а не по одной от каждого воркера.
+"""
+
+import asyncio
+import time
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from config import ADMIN_IDS, ORDER_DIGEST_INTERVAL, ORDER_DIGEST_SIZE
+from pricing import format_price
+from callbacks import pack
+import outbox
+
+MESSAGE_LIMIT = 4096
+
+
+class _Order:
+    __slots__ = ('user_id', 'username', 'start_message', 'details', 'total')
+
+    def __init__(self, user_id, username, start_message, details, total):
+        self.user_id = user_id
+        self.username = username
+        self.start_message = start_message
+        self.details = details
+        self.total = total
+
+    @property
+    def title(self):
+        return f'@{self.username}' if self.username else f'id {self.user_id}'
+
+    def text(self):
+        return f'{self.title}:\n{self.details}На сумму: {format_price(self.total)}'
+
+    def button(self, label='Спросить c дурака'):
+        return InlineKeyboardButton(label, callback_data=pack('askManager', self.user_id))
+
+
+class OrderDigest:
+    """Накопитель уведомлений о заказах: отдельное сообщение в затишье, сводка под нагрузкой."""
+
+    def __init__(self):
+        self.loop = None
+
+    def _start(self):
+        self.loop = asyncio.get_running_loop()
+        self.pending = []
+        self.next_flush = 0.0   # время (monotonic), раньше которого заказы копятся
+        self.timer = None
+
+    def add(self, order):
+        if self.loop is not asyncio.get_running_loop():
+            self._start()
+        now = time.monotonic()
+        if not self.pending and now >= self.next_flush:
+            self._send([order])
+            self.next_flush = now + ORDER_DIGEST_INTERVAL
+            return
+        self.pending.append(order)
+        if len(self.pending) >= ORDER_DIGEST_SIZE:
+            self.flush()
+        elif self.timer is None:
+            self.timer = self.loop.call_later(max(0.0, self.next_flush - now), self.flush)
+
+    def flush(self):
+        """Отправляет накопленные заказы одной сводкой."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.loop is None or not self.pending:
+            return
+        orders, self.pending = self.pending, []
+        self._send(orders)
+        self.next_flush = time.monotonic() + ORDER_DIGEST_INTERVAL
+
+    def _send(self, orders):
+        if len(orders) == 1:
+            order = orders[0]
+            for admin_id in ADMIN_IDS:
+                if order.start_message is not None:
+                    outbox.forward_message(admin_id, order.user_id, order.start_message, priority=outbox.ADMIN)
+                outbox.send_message(admin_id, ('|\n' if order.start_message is not None else '') + order.text(),
+                                    reply_markup=InlineKeyboardMarkup().add(order.button()), priority=outbox.ADMIN)
+            return
+        for text, kb in _digest_messages(orders):
+            for admin_id in ADMIN_IDS:
+                outbox.send_message(admin_id, text, reply_markup=kb, priority=outbox.ADMIN)
+
+
+def _digest_messages(orders):
+    """Разбивает сводку на сообщения не длиннее MESSAGE_LIMIT; кнопки заказов – под своим сообщением."""
+    messages = []
+    text, kb = f'Новые заказы: {len(orders)}\n\n', InlineKeyboardMarkup()
+    for order in orders:
+        block = order.text() + '\n\n'
+        if kb.inline_keyboard and len(text) + len(block) > MESSAGE_LIMIT:
+            messages.append((text, kb))
+            text, kb = '', InlineKeyboardMarkup()
+        text += block
+        kb.add(order.button(f'Спросить c дурака {order.title}'))
+    messages.append((text[:MESSAGE_LIMIT], kb))
+    return messages
+
+
+_digest = OrderDigest()
+_forwarder = None
+
+
+def set_forwarder(func):
+    """Задаёт передачу заказов процессу, который ведёт сводку: func(аргументы notify_order)."""
+    global _forwarder
+    _forwarder = func
+
+
+def notify_order(user_id, username, start_message, details, total):
+    """Ставит уведомление администраторов о заказе в очередь (сразу или в ближайшую сводку)."""
+    if _forwarder is not None:
+        _forwarder((user_id, username, start_message, details, total))
+        return
+    _digest.add(_Order(user_id, username, start_message, details, total))
+
+
+def flush():
+    """Немедленно отправляет накопленную сводку (например, при остановке бота)."""
+    _digest.flush()
@@ -0,0 +1,99 @@
+# orders.py
+
+"""Заказы пользователей.
+
+Заказ – строка orders (user_id, created_at, total) и его позиции в order_items (sku, qty, unit_price, name),
+суммы хранятся в копейках.
+Оформление заказа вставляет строки фиксированного размера и не зависит от длины истории клиента.
+Купленные вкусы без повторов ведутся в user_purchases (для выбора товара в отзыве).
+История читается страницами по индексу orders_user с keyset-пагинацией по id заказа.
+"""
+
+import datetime
+import time
+
+from db import fetchall, execute, executemany
+from pricing import format_price
+
+HISTORY_PAGE_SIZE = 5
+PURCHASES_PAGE_SIZE = 8
+SEPARATOR = '\n——————————————————-\n'
+
+
+async def create_order(user_id, total, items):
+    """
+    Сохраняет заказ, отмечает купленные вкусы в user_purchases и возвращает id заказа.
+
+    items – список (sku, qty, unit_price, name).
+    """
+    created_at = int(time.time())
+    order_id = await execute(
+        'INSERT INTO orders (user_id, created_at, total) VALUES (?, ?, ?)',
+        (user_id, created_at, total)
+    )
+    await executemany(
+        'INSERT INTO order_items (order_id, sku, qty, unit_price, name) VALUES (?, ?, ?, ?, ?)',
+        [(order_id,) + tuple(item) for item in items]
+    )
+    await executemany(
+        'INSERT INTO user_purchases (user_id, sku, first_bought, last_bought, times) VALUES (?, ?, ?, ?, 1) '
+        'ON CONFLICT (user_id, sku) DO UPDATE SET last_bought = excluded.last_bought, times = times + 1',
+        [(user_id, sku, created_at, created_at) for sku in {item[0] for item in items}]
+    )
+    return order_id
+
+
+async def get_history_page(user_id, before=None, after=None, limit=HISTORY_PAGE_SIZE):
+    """
+    Возвращает страницу заказов пользователя от новых к старым: (orders, has_older, has_newer).
+
+    before – id заказа, старше которого читается страница (следующая страница);
+    after – id заказа, новее которого читается страница (предыдущая страница).
+    orders – список (id, created_at, total, [(name, qty), ...]).
+    """
+    if after is not None:
+        rows = await fetchall(
+            'SELECT id, created_at, total FROM orders WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?',
+            (user_id, after, limit + 1)
+        )
+        has_newer = len(rows) > limit
+        rows = rows[:limit][::-1]
+        has_older = True
+    else:
+        rows = await fetchall(
+            'SELECT id, created_at, total FROM orders WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?',
+            (user_id, before if before is not None else 2 ** 63 - 1, limit + 1)
+        )
+        has_older = len(rows) > limit
+        rows = rows[:limit]
+        has_newer = before is not None
+    if not rows:
+        return [], False, False
+    items = {}
+    placeholders = ','.join('?' * len(rows))
+    for order_id, name, qty in await fetchall(
+        f'SELECT order_id, name, qty FROM order_items WHERE order_id IN ({placeholders}) ORDER BY rowid',
+        [row[0] for row in rows]
+    ):
+        items.setdefault(order_id, []).append((name, qty))
+    return [(order_id, created_at, total, items.get(order_id, [])) for order_id, created_at, total in rows], has_older, has_newer
+
+
+def format_order(created_at, total, items):
+    """Текст заказа в том же виде, в каком он раньше хранился в id.history."""
+    date = datetime.datetime.fromtimestamp(created_at).strftime('%d-%m-%y') if created_at else '??-??-??'
+    details = ''.join(f'{name} - {qty}шт.\n\n' for name, qty in items)
+    return f'{date}:\n{details}На сумму: {format_price(total)}'
+
+
+async def get_purchases_page(user_id, after='', limit=PURCHASES_PAGE_SIZE):
+    """
+    Возвращает страницу купленных вкусов пользователя по возрастанию sku: (skus, has_more).
+
+    after – последний sku предыдущей страницы.
+    """
+    rows = await fetchall(
+        'SELECT sku FROM user_purchases WHERE user_id = ? AND sku > ? ORDER BY sku LIMIT ?',
+        (user_id, after, limit + 1)
+    )
+    return [row[0] for row in rows[:limit]], len(rows) > limit
@@ -0,0 +1,216 @@
+# outbox.py
+
+"""Очередь исходящих вызовов Telegram Bot API.
+
+Обработчики не ждут отправки уведомлений, пересылок и рассылок: вызов ставится в очередь
+(send_message, forward_message, enqueue), а отправляют его фоновые исполнители. Прямой ответ
+на действие пользователя (callback_query.answer, message.answer, edit_*) по-прежнему вызывается
+в обработчике и в лимиты очереди не входит. Очередь учитывает:
+    - приоритет: INTERACTIVE (ответы пользователю) > ADMIN (уведомления администраторам) > BULK (рассылки);
+    - лимиты Telegram: общее ведро токенов OUTBOX_RATE сообщений в секунду и ведро на каждый чат;
+    - порядок: сообщения одному чату уходят по одному и в порядке постановки;
+    - повторы: RetryAfter ставит на паузу чат и общее ведро (лимит превышен для всего бота),
+      сетевые ошибки повторяются с экспоненциальной задержкой.
+Каждый вызов возвращает asyncio.Future с результатом метода бота – его можно дождаться, если результат нужен.
+Счётчики очереди и задержки отправки доступны через stats().
+"""
+
+import asyncio
+import collections
+import itertools
+import logging
+import time
+
+from aiogram.utils.exceptions import RetryAfter, NetworkError
+
+from bot import bot
+from config import OUTBOX_RATE, OUTBOX_CHAT_RATE, OUTBOX_CHAT_BURST, OUTBOX_WORKERS
+from ratelimit import TokenBucket
+
+log = logging.getLogger(__name__)
+
+INTERACTIVE, ADMIN, BULK = range(3)
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', ADMIN: 'admin', BULK: 'bulk'}
+
+# Повторы при сетевых ошибках: задержка RETRY_DELAY, 2 * RETRY_DELAY, 4 * RETRY_DELAY... секунд
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 1
+
+
+class _Job:
+    __slots__ = ('priority', 'seq', 'chat_id', 'method', 'args', 'kwargs', 'future', 'enqueued', 'attempts')
+
+    def __init__(self, priority, seq, chat_id, method, args, kwargs, future):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.enqueued = time.monotonic()
+        self.attempts = 0
+
+
+class Outbox:
+    """Очередь с приоритетами: в очереди готовых стоят чаты, у каждого чата – своя очередь вызовов."""
+
+    def __init__(self, rate=OUTBOX_RATE):
+        self.loop = None
+        self.rate = rate
+
+    def _start(self):
+        self.loop = asyncio.get_running_loop()
+        self.seq = itertools.count()
+        self.ready = asyncio.PriorityQueue()
+        self.chats = {}      # chat_id -> deque[_Job]
+        self.busy = set()    # чаты, вызов которых сейчас выполняется или ждёт паузы
+        self.buckets = {}    # chat_id -> TokenBucket
+        self.bucket = TokenBucket(self.rate)
+        self.depth = collections.Counter()
+        self.counters = collections.Counter()
+        self.latencies = collections.deque(maxlen=1000)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(OUTBOX_WORKERS)]
+
+    def set_rate(self, rate):
+        """Меняет общий лимит (сообщений в секунду), в том числе для уже запущенной очереди."""
+        self.rate = rate
+        if self.loop is not None:
+            self.bucket = TokenBucket(rate)
+
+    def enqueue(self, chat_id, method, *args, priority=INTERACTIVE, **kwargs):
+        """Ставит вызов bot.<method>(*args, **kwargs), адресованный чату chat_id, в очередь и возвращает Future."""
+        if self.loop is not asyncio.get_running_loop():
+            self._start()
+        future = self.loop.create_future()
+        # Результат может никто не ждать: ошибки пишутся в лог здесь, а не предупреждением asyncio
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        job = _Job(priority, next(self.seq), chat_id, method, args, kwargs, future)
+        self.chats.setdefault(chat_id, collections.deque()).append(job)
+        self.depth[priority] += 1
+        self.counters['enqueued'] += 1
+        if chat_id not in self.busy and len(self.chats[chat_id]) == 1:
+            self._schedule(chat_id)
+        return future
+
+    def _schedule(self, chat_id, delay=0):
+        """Ставит чат в очередь готовых по приоритету его первого вызова (через delay секунд)."""
+        self.busy.add(chat_id)
+        if delay > 0:
+            self.loop.call_later(delay, self._schedule, chat_id)
+            return
+        job = self.chats[chat_id][0]
+        self.ready.put_nowait((job.priority, job.seq, chat_id))
+
+    def _bucket(self, chat_id):
+        bucket = self.buckets.get(chat_id)
+        if bucket is None:
+            if len(self.buckets) > 10000:
+                # Отбрасываем вёдра простаивающих чатов: они всё равно полные
+                for idle in [c for c in self.buckets if c not in self.chats]:
+                    del self.buckets[idle]
+            bucket = self.buckets[chat_id] = TokenBucket(OUTBOX_CHAT_RATE, OUTBOX_CHAT_BURST)
+        return bucket
+
+    async def _worker(self):
+        while True:
+            _, _, chat_id = await self.ready.get()
+            bucket = self._bucket(chat_id)
+            wait = bucket.delay()
+            if wait > 0:
+                # Лимит чата исчерпан: исполнитель берёт следующий чат, а этот вернётся в очередь позже
+                self._schedule(chat_id, wait)
+                continue
+            await self.bucket.acquire()
+            bucket.take()
+            await self._send(chat_id, bucket)
+
+    async def _send(self, chat_id, bucket):
+        job = self.chats[chat_id][0]
+        job.attempts += 1
+        try:
+            result = await getattr(bot, job.method)(*job.args, **job.kwargs)
+        except RetryAfter as e:
+            self.counters['retry_after'] += 1
+            bucket.pause(e.timeout)
+            self.bucket.pause(e.timeout)
+            self._schedule(chat_id, e.timeout)
+            return
+        except NetworkError as e:
+            if job.attempts < MAX_ATTEMPTS:
+                self.counters['retries'] += 1
+                self._schedule(chat_id, RETRY_DELAY * 2 ** (job.attempts - 1))
+                return
+            self._finish(chat_id, job, exception=e)
+        except Exception as e:
+            self._finish(chat_id, job, exception=e)
+        else:
+            self._finish(chat_id, job, result=result)
+        if self.chats.get(chat_id):
+            self._schedule(chat_id)
+        else:
+            self.chats.pop(chat_id, None)
+            self.busy.discard(chat_id)
+
+    def _finish(self, chat_id, job, result=None, exception=None):
+        self.chats[chat_id].popleft()
+        self.depth[job.priority] -= 1
+        if exception is not None:
+            self.counters['failed'] += 1
+            log.warning('Вызов %s для чата %s не выполнен: %s', job.method, chat_id, exception)
+            if not job.future.done():
+                job.future.set_exception(exception)
+        else:
+            self.counters['sent'] += 1
+            self.latencies.append(time.monotonic() - job.enqueued)
+            if not job.future.done():
+                job.future.set_result(result)
+
+    def stats(self):
+        """Глубина очереди по приоритетам, счётчики и задержка от постановки до отправки (секунды)."""
+        if self.loop is None:
+            return {'depth': {}, 'enqueued': 0, 'sent': 0, 'failed': 0}
+        latencies = sorted(self.latencies)
+        result = {'depth': {PRIORITY_NAMES[p]: n for p, n in self.depth.items()}}
+        result.update({name: self.counters[name] for name in ('enqueued', 'sent', 'failed', 'retries', 'retry_after')})
+        if latencies:
+            result['latency_avg'] = sum(latencies) / len(latencies)
+            result['latency_p95'] = latencies[int(len(latencies) * 0.95) - 1 if len(latencies) > 1 else 0]
+            result['latency_max'] = latencies[-1]
+        return result
+
+    async def flush(self):
+        """Ждёт, пока очередь опустеет (для тестов и завершения работы)."""
+        while self.loop is not None and self.chats:
+            await asyncio.sleep(0.01)
+
+
+_outbox = Outbox()
+
+
+def enqueue(chat_id, method, *args, priority=INTERACTIVE, **kwargs):
+    """Ставит произвольный вызов bot.<method> в очередь. chat_id – чат, к лимиту которого относится вызов."""
+    return _outbox.enqueue(chat_id, method, *args, priority=priority, **kwargs)
+
+
+def send_message(chat_id, text, priority=INTERACTIVE, **kwargs):
+    """Ставит bot.send_message в очередь и возвращает Future с отправленным сообщением."""
+    return _outbox.enqueue(chat_id, 'send_message', chat_id, text, priority=priority, **kwargs)
+
+
+def forward_message(chat_id, from_chat_id, message_id, priority=INTERACTIVE):
+    """Ставит bot.forward_message в очередь и возвращает Future с пересланным сообщением."""
+    return _outbox.enqueue(chat_id, 'forward_message', chat_id, from_chat_id, message_id, priority=priority)
+
+
+def set_rate(rate):
+    """Задаёт общий лимит очереди: при нескольких воркерах (sharding.py) каждому достаётся доля OUTBOX_RATE."""
+    _outbox.set_rate(rate)
+
+
+def stats():
+    return _outbox.stats()
+
+
+async def flush():
+    await _outbox.flush()
@@ -0,0 +1,66 @@
+# payloads.py
+
+"""Данные inline-кнопок, хранимые на стороне бота.
+
+В callback_data помещается не больше 64 байт, и всё, что в неё положено, видит клиент. Кнопке
+с большими или чужими данными (кнопки модерации отзывов несут id чата и сообщения автора) достаточно
+короткого токена: данные хранятся в таблице callback_payloads и в памяти – LRU из PAYLOAD_CACHE_SIZE
+последних токенов, – а в базу запрос идёт только при промахе (после перезапуска или вытеснения).
+Данные живут PAYLOAD_TTL секунд, просроченные строки периодически удаляются.
+
+Данные – кортеж значений NamedTuple; тип указывается при регистрации обработчика (callbacks.route),
+и обработчик получает готовый объект, а не строку для разбора.
+"""
+
+import collections
+import json
+import secrets
+import time
+
+from config import PAYLOAD_CACHE_SIZE, PAYLOAD_TTL
+from db import fetchone, execute
+
+# Как часто удалять из базы просроченные данные (секунды)
+SWEEP_INTERVAL = 600
+
+_cache = collections.OrderedDict()  # токен -> (значения, expires_at)
+_swept = time.time()
+
+
+def _remember(token, values, expires_at):
+    _cache[token] = (values, expires_at)
+    _cache.move_to_end(token)
+    while len(_cache) > PAYLOAD_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+async def store(payload):
+    """Сохраняет данные кнопки и возвращает токен для callback_data."""
+    global _swept
+    token = secrets.token_urlsafe(6)
+    values = list(payload)
+    expires_at = int(time.time()) + PAYLOAD_TTL
+    await execute('INSERT INTO callback_payloads (token, payload, expires_at) VALUES (?, ?, ?)',
+                  (token, json.dumps(values, ensure_ascii=False), expires_at))
+    _remember(token, values, expires_at)
+    if time.time() - _swept >= SWEEP_INTERVAL:
+        _swept = time.time()
+        await execute('DELETE FROM callback_payloads WHERE expires_at < ?', (int(time.time()),))
+    return token
+
+
+async def load(token, kind):
+    """Данные по токену в виде kind (NamedTuple); None, если токен неизвестен или просрочен."""
+    entry = _cache.get(token)
+    if entry is None:
+        row = await fetchone('SELECT payload, expires_at FROM callback_payloads WHERE token = ?', (token,))
+        if row is None:
+            return None
+        entry = (json.loads(row[0]), row[1])
+        _remember(token, *entry)
+    else:
+        _cache.move_to_end(token)
+    values, expires_at = entry
+    if expires_at < time.time():
+        return None
+    return kind(*values)
@@ -0,0 +1,97 @@
+# pricing.py
+
+"""Расчёт цен и скидок.
+
+Цены хранятся целым числом копеек (photos.price, cart_items.price, order_items.unit_price, orders.total, id.spend)
+и переводятся в текст только при выводе. Скидки пользователя (10% на первый заказ, 5% при сумме покупок
+от 5000₽) загружаются один раз вместе с корзиной, после чего цены позиций и итог считаются за один проход.
+"""
+
+import re
+from collections import namedtuple
+
+from db import fetchall
+
+FIRST_ORDER_DISCOUNT = 10      # %, после нажатия "Приветственный бонус"
+LOYALTY_DISCOUNT = 5           # %, для постоянных покупателей
+LOYALTY_THRESHOLD = 5000_00    # копеек потрачено
+
+_PRICE_RE = re.compile(r'(\d+)(?:[.,](\d{1,2}))?')
+
+CartLine = namedtuple('CartLine', 'sku unit_price count total')
+PricedCart = namedtuple('PricedCart', 'lines total profile')
+CartCounts = namedtuple('CartCounts', 'counts profile')
+
+
+def parse_price(text):
+    """Переводит цену из ввода администратора ("150", "150₽", "149,90") в копейки. Возвращает None, если цены нет."""
+    match = _PRICE_RE.search(str(text))
+    if match is None:
+        return None
+    rubles, kopecks = match.groups()
+    return int(rubles) * 100 + int((kopecks or '0').ljust(2, '0'))
+
+
+def format_price(minor):
+    """Цена в копейках в виде "150₽" или "149.90₽"."""
+    minor = minor or 0
+    if minor % 100 == 0:
+        return f'{minor // 100}₽'
+    return f'{minor // 100}.{minor % 100:02d}₽'
+
+
+class DiscountProfile(namedtuple('DiscountProfile', 'first_order loyal')):
+    """Скидки пользователя. apply применяет их к цене в копейках в том же порядке, что и раньше."""
+
+    @classmethod
+    def from_row(cls, first_pressed, spend):
+        return cls(first_pressed == 1, (spend or 0) >= LOYALTY_THRESHOLD)
+
+    def apply(self, amount):
+        if self.first_order:
+            amount = amount * (100 - FIRST_ORDER_DISCOUNT) // 100
+        if self.loyal:
+            amount = amount * (100 - LOYALTY_DISCOUNT) // 100
+        return amount
+
+
+NO_DISCOUNT = DiscountProfile(False, False)
+
+
+async def cart_counts(user_id):
+    """
+    Читает количества позиций корзины вместе со скидками пользователя одним запросом (для карточки товара).
+
+    Возвращает CartCounts: counts – {sku: количество}, profile – скидки.
+    """
+    # Однострочная выборка-якорь даёт строку со скидками и при пустой корзине
+    rows = await fetchall(
+        'SELECT u.first_pressed, u.spend, c.sku, c.count FROM (SELECT ? AS user_id) q '
+        'LEFT JOIN id u ON u.users = q.user_id LEFT JOIN cart_items c ON c.user_id = q.user_id',
+        (user_id,)
+    )
+    profile = DiscountProfile.from_row(rows[0][0], rows[0][1])
+    return CartCounts({sku: count for _, _, sku, count in rows if sku is not None}, profile)
+
+
+async def price_cart(user_id):
+    """
+    Читает корзину вместе со скидками пользователя одним запросом и считает позиции и итог за один проход.
+
+    Возвращает PricedCart: lines – CartLine по возрастанию sku с ценой за штуку после скидок, total – итог, profile – скидки.
+    """
+    rows = await fetchall(
+        'SELECT c.sku, c.price, c.count, u.first_pressed, u.spend FROM cart_items c '
+        'LEFT JOIN id u ON u.users = c.user_id WHERE c.user_id = ? ORDER BY c.sku',
+        (user_id,)
+    )
+    if not rows:
+        return PricedCart([], 0, NO_DISCOUNT)
+    profile = DiscountProfile.from_row(rows[0][3], rows[0][4])
+    lines = []
+    total = 0
+    for sku, price, count, _, _ in rows:
+        unit_price = profile.apply(price or 0)
+        lines.append(CartLine(sku, unit_price, count, unit_price * count))
+        total += unit_price * count
+    return PricedCart(lines, total, profile)
@@ -0,0 +1,55 @@
+# ratelimit.py
+
+"""Ограничение частоты обращений к Telegram Bot API."""
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Ведро токенов: в среднем rate операций в секунду, всплеск до capacity.
+
+    pause(seconds) останавливает выдачу токенов всем ожидающим – так обрабатывается RetryAfter,
+    который Telegram возвращает при превышении лимита.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds):
+        """Не выдавать токены ближайшие seconds секунд."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+    def delay(self):
+        """Через сколько секунд освободится токен (0 – можно прямо сейчас)."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        """Забирает токен; вызывать только после delay() == 0."""
+        self.tokens -= 1
+
+    async def acquire(self):
+        """Ждёт и забирает токен."""
+        while True:
+            wait = self.delay()
+            if wait == 0:
+                self.take()
+                return
+            await asyncio.sleep(wait)
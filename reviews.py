@@ -0,0 +1,144 @@
+# reviews.py
+
+"""Отзывы: очередь модерации (feedbacks) и опубликованные отзывы (otz).
+
+Текст отзыва сохраняется при получении (feedbacks.text) и переносится в otz при публикации, поэтому
+отзывы показываются страницами в одном сообщении, а не пересылкой каждого. Страницы читаются
+keyset-пагинацией по id (порядок публикации), от новых к старым.
+
+Очередь модерации тоже читается страницами по id (от старых к новым), а одобрение, удаление и блокировка
+применяются сразу к списку id одним набором запросов в транзакции апдейта – стоимость модерации
+зависит от размера страницы, а не от длины очереди.
+
+У отзывов, полученных до сохранения текста, text IS NULL, а сам текст есть только в Telegram.
+При первом показе такой отзыв один раз пересылается, текст пересланного сообщения записывается в базу
+(fill_texts), а пересланное сообщение удаляется – дальше отзыв показывается только из базы.
+"""
+
+import asyncio
+
+from aiogram import types
+from aiogram.utils.exceptions import BadRequest
+
+from db import fetchall, execute, executemany, end_write_section
+import outbox
+
+REVIEWS_PAGE_SIZE = 5
+MODERATION_PAGE_SIZE = 5
+
+
+async def get_reviews_page(before=None, after=None, limit=REVIEWS_PAGE_SIZE):
+    """
+    Возвращает страницу отзывов от новых к старым: (reviews, has_older, has_newer).
+
+    before – id отзыва, старше которого читается страница (следующая страница);
+    after – id отзыва, новее которого читается страница (предыдущая страница).
+    reviews – список (id, chat, message, product, text); text – None у отзывов, опубликованных до сохранения текста
+    (см. fill_texts).
+    """
+    if after is not None:
+        rows = await fetchall(
+            'SELECT id, chat, message, product, text FROM otz WHERE id > ? ORDER BY id LIMIT ?',
+            (after, limit + 1)
+        )
+        has_newer = len(rows) > limit
+        rows = rows[:limit][::-1]
+        has_older = True
+    else:
+        rows = await fetchall(
+            'SELECT id, chat, message, product, text FROM otz WHERE id < ? ORDER BY id DESC LIMIT ?',
+            (before if before is not None else 2 ** 63 - 1, limit + 1)
+        )
+        has_older = len(rows) > limit
+        rows = rows[:limit]
+        has_newer = before is not None
+    if not rows:
+        return [], False, False
+    return rows, has_older, has_newer
+
+
+async def fill_texts(table, rows, chat_id):
+    """
+    Заполняет text у строк (id, chat, message, product, text) из table (otz или feedbacks), где он None:
+    отзыв пересылается в чат chat_id, текст или подпись пересланного сообщения сохраняется в table,
+    пересланное сообщение удаляется. Возвращает rows с заполненным text.
+
+    Если исходное сообщение удалено автором, сохраняется пустой текст, чтобы не пересылать его снова.
+    """
+    missing = [row for row in rows if row[4] is None]
+    if not missing:
+        return rows
+    # Изменения апдейта (например, модерация перед показом страницы) фиксируются до ожидания пересылок,
+    # чтобы блокировка записи не держалась во время обращений к Telegram
+    await end_write_section()
+    results = await asyncio.gather(
+        *(outbox.forward_message(chat_id, chat, message) for _, chat, message, _, _ in missing),
+        return_exceptions=True
+    )
+    texts = {}
+    for row, sent in zip(missing, results):
+        if isinstance(sent, types.Message):
+            texts[row[0]] = sent.text or sent.caption or ''
+            outbox.enqueue(chat_id, 'delete_message', chat_id, sent.message_id)
+        elif isinstance(sent, BadRequest):
+            texts[row[0]] = ''
+        # Сетевая ошибка: текст остаётся пустым до следующего показа
+    if texts:
+        await executemany(f'UPDATE {table} SET text = ? WHERE id = ?', [(text, id_) for id_, text in texts.items()])
+    return [row if row[4] is not None else row[:4] + (texts.get(row[0]),) for row in rows]
+
+
+def format_review(product, text):
+    """Текст отзыва на странице: товар и текст автора (без разметки – текст пишет пользователь)."""
+    return f'{product}:\n{text}'
+
+
+async def get_pending_page(after=0, limit=MODERATION_PAGE_SIZE):
+    """
+    Возвращает страницу очереди модерации: (reviews, has_more).
+
+    after – id отзыва, после которого читается страница; reviews – список (id, chat, message, product, text).
+    """
+    rows = await fetchall(
+        'SELECT id, chat, message, product, text FROM feedbacks WHERE id > ? ORDER BY id LIMIT ?',
+        (after, limit + 1)
+    )
+    return rows[:limit], len(rows) > limit
+
+
+def _in(ids):
+    return ','.join('?' * len(ids))
+
+
+async def _pending(ids):
+    """id из ids, ещё остающиеся в очереди (кнопку могли нажать повторно)."""
+    return [row[0] for row in await fetchall(f'SELECT id FROM feedbacks WHERE id IN ({_in(ids)})', ids)]
+
+
+async def approve(ids):
+    """Публикует отзывы из очереди и возвращает число опубликованных."""
+    ids = await _pending(ids)
+    if ids:
+        await execute(
+            f'INSERT INTO otz (chat, message, product, text) SELECT chat, message, product, text FROM feedbacks '
+            f'WHERE id IN ({_in(ids)}) ORDER BY id', ids
+        )
+        await execute(f'DELETE FROM feedbacks WHERE id IN ({_in(ids)})', ids)
+    return len(ids)
+
+
+async def reject(ids):
+    """Удаляет отзывы из очереди и возвращает число удалённых."""
+    ids = await _pending(ids)
+    if ids:
+        await execute(f'DELETE FROM feedbacks WHERE id IN ({_in(ids)})', ids)
+    return len(ids)
+
+
+async def ban_authors(ids):
+    """Блокирует авторов отзывов, удаляет все их отзывы из очереди и возвращает число заблокированных."""
+    chats = [row[0] for row in await fetchall(f'SELECT DISTINCT chat FROM feedbacks WHERE id IN ({_in(ids)})', ids)]
+    if chats:
+        await execute(f'UPDATE id SET ban = 1 WHERE users IN ({_in(chats)})', chats)
+        await execute(f'DELETE FROM feedbacks WHERE chat IN ({_in(chats)})', chats)
+    return len(chats)
@@ -0,0 +1,222 @@
+# sharding.py
+
+"""Запуск бота в нескольких процессах с распределением апдейтов по id пользователя.
+
+Главный процесс только принимает апдейты – одним long polling или webhook – и, не разбирая их,
+передаёт воркеру номер id пользователя % WORKERS. Поэтому все апдейты одного пользователя
+обрабатывает один процесс, и там они выполняются строго по очереди (корзина, FSM-диалоги), а апдейты
+разных пользователей – параллельно на всех ядрах.
+
+Воркеры пишут в общую базу (WAL, транзакции ждут друг друга до BUSY_TIMEOUT и не держат блокировку
+во время запросов к Telegram) и держат свои кэши каталога и счётчиков. Об изменении кэша воркер сообщает главному процессу (cache_bus.publish), и тот
+рассылает сообщение остальным воркерам в той же очереди, что и апдейты. Общий лимит исходящих
+сообщений делится между воркерами, фоновые задачи при старте (checkpoint, продолжение рассылок)
+выполняет только воркер 0. Сводку заказов для администраторов (order_digest) тоже ведёт воркер 0:
+остальные передают ему заказы через главный процесс, поэтому сводка одна на всех воркеров.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import signal
+import threading
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot import api
+from aiohttp import web
+
+from config import BOT_MODE, SKIP_UPDATES, WEBHOOK_PATH, WEBAPP_HOST, WEBAPP_PORT, OUTBOX_RATE
+
+log = logging.getLogger(__name__)
+
+POLL_TIMEOUT = 20
+
+
+def user_of(update):
+    """id пользователя (или чата), к которому относится апдейт; 0, если его нет."""
+    for body in update.values():
+        if isinstance(body, dict):
+            owner = body.get('from') or body.get('user') or body.get('chat')
+            if owner is not None:
+                return owner['id']
+    return 0
+
+
+def shard_of(update, workers):
+    """Номер воркера для апдейта."""
+    return user_of(update) % workers
+
+
+class _UserQueues:
+    """Апдейты одного пользователя выполняются по очереди, разных пользователей – параллельно."""
+
+    def __init__(self, dispatcher):
+        self.dispatcher = dispatcher
+        self.tails = {}  # user_id -> задача последнего апдейта пользователя
+
+    def submit(self, update):
+        user_id = user_of(update)
+        task = asyncio.create_task(self._process(self.tails.get(user_id), update))
+        self.tails[user_id] = task
+        task.add_done_callback(lambda t: self.tails.get(user_id) is t and self.tails.pop(user_id))
+
+    async def _process(self, previous, update):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            # process_updates, а не process_update: иначе не срабатывают middleware (единица работы апдейта)
+            await self.dispatcher.process_updates([types.Update(**update)])
+        except Exception:
+            log.exception('Ошибка обработки апдейта %s', update.get('update_id'))
+
+    async def join(self):
+        while self.tails:
+            await asyncio.wait(list(self.tails.values()))
+
+
+async def serve(index, workers, inbox, bus, on_startup=None, on_shutdown=None):
+    """
+    Цикл воркера: читает из inbox апдейты, сообщения об инвалидации и (воркер 0) заказы для сводки,
+    None – остановка.
+
+    on_startup выполняет только воркер 0, on_shutdown – каждый воркер после обработки последнего апдейта.
+    """
+    import handlers  # noqa: F401 – регистрирует обработчики в dp
+    import cache_bus
+    import order_digest
+    import outbox
+    from bot import bot, dp
+
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+    outbox.set_rate(OUTBOX_RATE / workers)
+    cache_bus.set_publisher(lambda name: bus.put((index, 'invalidate', name)))
+    if index != 0:
+        order_digest.set_forwarder(lambda order: bus.put((index, 'order', order)))
+    if index == 0 and on_startup is not None:
+        await on_startup(dp)
+
+    loop = asyncio.get_running_loop()
+    queues = _UserQueues(dp)
+    while True:
+        item = await loop.run_in_executor(None, inbox.get)
+        if item is None:
+            break
+        kind, payload = item
+        if kind == 'invalidate':
+            cache_bus.receive(payload)
+        elif kind == 'order':
+            order_digest.notify_order(*payload)
+        else:
+            queues.submit(payload)
+    await queues.join()
+    if on_shutdown is not None:
+        await on_shutdown(dp)
+    await outbox.flush()
+    await dp.storage.close()
+
+
+def _worker_main(index, workers, inbox, bus, on_startup, on_shutdown):
+    logging.basicConfig(level=logging.INFO)
+    # Останавливает воркер главный процесс (None в очереди), Ctrl+C обрабатывает только он
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(serve(index, workers, inbox, bus, on_startup, on_shutdown))
+
+
+def _relay(bus, inboxes):
+    """
+    Пересылает сообщения воркеров (в отдельном потоке): инвалидацию кэшей – остальным воркерам,
+    заказы для сводки – воркеру 0. None останавливает воркер 0 и пересылку.
+    """
+    while True:
+        item = bus.get()
+        if item is None:
+            inboxes[0].put(None)
+            return
+        origin, kind, payload = item
+        if kind == 'order':
+            inboxes[0].put((kind, payload))
+            continue
+        for index, inbox in enumerate(inboxes):
+            if index != origin:
+                inbox.put((kind, payload))
+
+
+async def _poll(bot, route):
+    """Один long polling на все воркеры: апдейты передаются дальше без разбора."""
+    offset = -1 if SKIP_UPDATES else None
+    await bot.delete_webhook()
+    while True:
+        try:
+            updates = await bot.request(api.Methods.GET_UPDATES, {'offset': offset, 'timeout': POLL_TIMEOUT})
+        except Exception:
+            log.exception('Ошибка получения апдейтов')
+            await asyncio.sleep(1)
+            continue
+        if offset == -1:
+            # Пропуск накопившихся апдейтов: подтверждаем последний и начинаем со следующего
+            offset = updates[-1]['update_id'] + 1 if updates else None
+            continue
+        for update in updates:
+            offset = update['update_id'] + 1
+            route(update)
+
+
+def _webhook_app(route):
+    from webhook import check_secret
+
+    async def ingress(request):
+        check_secret(request)
+        route(await request.json())
+        return web.Response(text='ok')
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, ingress)
+    return app
+
+
+def run(workers, on_startup=None, on_shutdown=None):
+    """Запускает workers процессов-воркеров и принимает апдейты в текущем процессе."""
+    from bot import bot, dp
+    from webhook import set_webhook
+
+    context = multiprocessing.get_context('spawn')
+    inboxes = [context.Queue() for _ in range(workers)]
+    bus = context.Queue()
+    processes = [
+        context.Process(target=_worker_main, args=(index, workers, inbox, bus, on_startup, on_shutdown), name=f'worker-{index}')
+        for index, inbox in enumerate(inboxes)
+    ]
+    for process in processes:
+        process.start()
+
+    def route(update):
+        inboxes[shard_of(update, workers)].put(('update', update))
+
+    async def ingress():
+        try:
+            if BOT_MODE == 'webhook':
+                await set_webhook(dp)
+                runner = web.AppRunner(_webhook_app(route))
+                await runner.setup()
+                await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+                await asyncio.Event().wait()
+            else:
+                await _poll(bot, route)
+        finally:
+            await (await bot.get_session()).close()
+
+    threading.Thread(target=_relay, args=(bus, inboxes), name='cache-bus', daemon=True).start()
+    log.info('Запущено воркеров: %s', workers)
+    try:
+        asyncio.run(ingress())
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        # Сначала останавливаются воркеры 1..N, затем через _relay (после их последних заказов) – воркер 0
+        for inbox in inboxes[1:]:
+            inbox.put(None)
+        for process in processes[1:]:
+            process.join()
+        bus.put(None)
+        processes[0].join()
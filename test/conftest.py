@@ -2,13 +2,45 @@
 
 import os
 import sys
+import tempfile
 
+import pytest
 
 # Добавляем корень проекта в PYTHONPATH
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+# Тестовое окружение: фиктивный токен и отдельная временная база
+os.environ.setdefault('BOT_TOKEN', '123456789:TEST_TOKEN_for_pytest_only')
+os.environ.setdefault('ADMIN_IDS', '1')
+os.environ.setdefault('DB_NAME', os.path.join(tempfile.mkdtemp(), 'test.db'))
+
 from bot import bot
 from aiogram import Bot
+from db import init_db
 
 # Устанавливаем текущий бот
 Bot.set_current(bot)
+
+# Приводим схему тестовой базы к актуальной версии
+init_db()
+
+
+async def fake_request(method, data=None, files=None, **kwargs):
+    """Подменяет обращение к Telegram Bot API: методы отправки возвращают сообщение, остальные — True."""
+    if method in ('sendMessage', 'forwardMessage', 'sendPhoto'):
+        chat_id = int((data or {}).get('chat_id', 0))
+        return {'message_id': 1, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}}
+    return True
+
+
+def pytest_collection_modifyitems(items):
+    """Все асинхронные тесты идут в одном event loop: блокировка записи db живёт всё время процесса, как в боте."""
+    for item in items:
+        if item.get_closest_marker('asyncio') is not None:
+            item.add_marker(pytest.mark.asyncio(loop_scope='session'), append=False)
+
+
+@pytest.fixture(autouse=True)
+def no_telegram_api(monkeypatch):
+    """Тесты не ходят в сеть."""
+    monkeypatch.setattr(bot, 'request', fake_request)
@@ -0,0 +1,91 @@
+# tests/test_broadcast.py
+
+import pytest
+from aiogram.utils.exceptions import BotBlocked, RetryAfter
+
+import broadcasts
+from bot import bot
+from conftest import fake_request
+from db import connection
+
+
+@pytest.mark.asyncio
+async def test_campaign_resumes_and_handles_errors(monkeypatch):
+    """
+    Проверяем, что рассылка:
+        - продолжается с сохранённого курсора и не отправляет повторно уже обработанным получателям;
+        - повторяет отправку после RetryAfter;
+        - помечает пользователей, заблокировавших бота, и считает результаты.
+    """
+    users = list(range(900001, 900008))
+    connection.execute('DELETE FROM id WHERE users BETWEEN 900000 AND 900999')
+    connection.executemany('INSERT INTO id (users) VALUES (?)', [(user_id,) for user_id in users])
+    connection.commit()
+    monkeypatch.setattr(broadcasts, 'BROADCAST_CHUNK', 2)
+
+    campaign_id = await broadcasts.create_campaign('Акция!')
+    # Первые два получателя уже обработаны до "перезапуска"
+    connection.execute('UPDATE campaigns SET cursor = ?, sent = 2 WHERE id = ?', (users[1], campaign_id))
+    connection.commit()
+
+    sent = []
+    flooded = []
+
+    async def telegram(method, data=None, files=None, **kwargs):
+        chat_id = int(data['chat_id'])
+        if chat_id == users[3]:
+            raise BotBlocked('Forbidden: bot was blocked by the user')
+        if chat_id == users[4] and not flooded:
+            flooded.append(chat_id)
+            raise RetryAfter(0)
+        sent.append(chat_id)
+        return await fake_request(method, data, files, **kwargs)
+
+    monkeypatch.setattr(bot, 'request', telegram)
+    await broadcasts.run_campaign(campaign_id)
+
+    assert sorted(sent) == [users[2]] + users[4:], "Получатели до курсора не должны получать сообщение повторно"
+    assert connection.execute('SELECT status, sent, failed, blocked, cursor FROM campaigns WHERE id = ?',
+                              (campaign_id,)).fetchone() == ('done', 2 + len(sent), 0, 1, users[-1])
+    assert connection.execute('SELECT blocked FROM id WHERE users = ?', (users[3],)).fetchone() == (1,)
+
+
+@pytest.mark.asyncio
+async def test_campaign_is_cancelled_from_progress_button(monkeypatch):
+    """
+    Проверяем, что сообщение с прогрессом рассылки несёт кнопку «Отменить рассылку»,
+    нажатие администратора останавливает рассылку, а повторное нажатие сообщает, что она уже завершена.
+    """
+    from aiogram.types import CallbackQuery
+    from handlers.broadcast import handle_broadcast_cancel
+
+    answers = []
+    edits = []
+
+    async def telegram(method, data=None, files=None, **kwargs):
+        if method == 'answerCallbackQuery':
+            answers.append(data.get('text'))
+        if method == 'editMessageText':
+            edits.append(data)
+        return await fake_request(method, data, files, **kwargs)
+
+    monkeypatch.setattr(bot, 'request', telegram)
+    campaign_id = await broadcasts.create_campaign('Отменяемая рассылка', admin_chat=1, progress_message=5)
+    await broadcasts._report((await broadcasts._load(campaign_id))[:8])
+    assert f'cancelCampaign:{campaign_id}' in edits[-1]['reply_markup']
+
+    def press(user_id):
+        return CallbackQuery(**{
+            'id': 'cancel_cb', 'chat_instance': '1', 'data': f'cancelCampaign:{campaign_id}',
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Admin'},
+        })
+
+    await handle_broadcast_cancel(press(12345))
+    assert (await broadcasts._load(campaign_id))[1] == 'running', "Отменить рассылку может только администратор"
+    await handle_broadcast_cancel(press(1))
+    await handle_broadcast_cancel(press(1))
+    assert answers[-2:] == ['Рассылка будет остановлена', 'Рассылка уже завершена']
+
+    await broadcasts.run_campaign(campaign_id)
+    assert 'reply_markup' not in edits[-1], "У остановленной рассылки кнопки отмены нет"
+    assert 'остановлена' in edits[-1]['text']
@@ -0,0 +1,113 @@
+# tests/test_callbacks.py
+
+import time
+
+import pytest
+from aiogram import types
+
+import handlers  # noqa: F401 – регистрирует обработчики
+import payloads
+from bot import bot, dp
+from callbacks import CallbackRouter, router, pack, pack_payload, unpack
+from conftest import fake_request
+from db import connection
+from handlers.client import ModerationBatch
+
+
+def test_pack_unpack():
+    """Проверяем формат callback_data: действие и аргументы через разделитель."""
+    assert pack('cart', 1) == 'cart:1'
+    assert unpack('addCart:103') == ('addCart', ['103'])
+    assert unpack('orderConfirm') == ('orderConfirm', [])
+
+
+def test_duplicate_action_is_rejected():
+    """Проверяем, что одно действие нельзя зарегистрировать дважды."""
+    local = CallbackRouter()
+    local.route('cart')(lambda callback_query: None)
+    with pytest.raises(ValueError):
+        local.route('cart')(lambda callback_query: None)
+
+
+def test_legacy_callback_data_is_translated():
+    """Проверяем, что кнопки старого формата попадают в нужный обработчик без путаницы префиксов."""
+    cases = {
+        'cart1': ('cart', 'cart:1'),
+        'sales': ('sales', 'sales'),
+        'sale5': ('sale', 'sale:5'),
+        'askManager 5': ('askManager', 'askManager:5'),
+        'feedback_add|7|12|Манго: отлично | рекомендую': ('feedback_add', 'feedback_add:7:12'),
+        'brand_42': ('brand', 'brand:42'),
+    }
+    for data, (action, translated) in cases.items():
+        route, new_data = router.resolve(data)
+        assert route is router.routes[action], data
+        assert new_data == translated
+    # Только точные старые форматы: остальное с теми же префиксами уходит дальше (SkipHandler)
+    for data in ('unknown', 'saleX', 'cartoon', 'inc5x', 'decline', 'fb_x', 'feedback_add|7', 'brand_3_5'):
+        assert router.resolve(data)[0] is None, data
+
+
+def callback_update(data, user_id=1):
+    return types.Update(**{
+        'update_id': 1,
+        'callback_query': {
+            'id': 'payload_cb', 'chat_instance': '1', 'data': data,
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Admin'},
+            'message': {'message_id': 1, 'date': 0, 'chat': {'id': user_id, 'type': 'private'}},
+        },
+    })
+
+
+@pytest.mark.asyncio
+async def test_button_payload_is_stored_server_side(monkeypatch):
+    """
+    Проверяем, что кнопка модерации несёт только короткий токен, данные читаются из базы
+    после вытеснения из памяти, а просроченная кнопка не выполняет действие.
+    """
+    answers = []
+
+    async def capture(method, data=None, files=None, **kwargs):
+        if method == 'answerCallbackQuery':
+            answers.append(data.get('text'))
+        return await fake_request(method, data, files, **kwargs)
+
+    monkeypatch.setattr(bot, 'request', capture)
+    connection.executemany('INSERT INTO feedbacks (chat, message, product) VALUES (?, ?, ?)',
+                           [(777001, 11, 'Товар'), (777001, 12, 'Товар')])
+    connection.commit()
+    first, second = [row[0] for row in connection.execute('SELECT id FROM feedbacks WHERE chat = 777001 ORDER BY id')]
+
+    data = await pack_payload('modReject', ModerationBatch([first], 0))
+    assert data.startswith('modReject:~') and len(data.encode()) < 64
+    payloads._cache.clear()
+    await dp.process_update(callback_update(data))
+    rows = connection.execute('SELECT message FROM feedbacks WHERE chat = 777001').fetchall()
+    assert rows == [(12,)]
+    assert answers == ['Удалено отзывов: 1']
+
+    stale = await pack_payload('modReject', ModerationBatch([second], 0))
+    token = stale.split(':~')[1]
+    payloads._cache.clear()
+    connection.execute('UPDATE callback_payloads SET expires_at = ? WHERE token = ?', (int(time.time()) - 1, token))
+    connection.commit()
+    await dp.process_update(callback_update(stale))
+    assert connection.execute('SELECT count(*) FROM feedbacks WHERE chat = 777001').fetchone()[0] == 1
+    assert answers[-1] == 'Кнопка устарела'
+    connection.execute('DELETE FROM feedbacks WHERE chat = 777001')
+    connection.commit()
+
+
+@pytest.mark.asyncio
+async def test_unrouted_button_is_answered(monkeypatch):
+    """Проверяем, что на кнопку без маршрута (старый формат не из LEGACY) бот отвечает, а не молчит."""
+    answers = []
+
+    async def capture(method, data=None, files=None, **kwargs):
+        if method == 'answerCallbackQuery':
+            answers.append(data.get('text'))
+        return await fake_request(method, data, files, **kwargs)
+
+    monkeypatch.setattr(bot, 'request', capture)
+    await dp.process_update(callback_update('1_1_1'))
+    assert answers == ['Кнопка устарела']
@@ -1,9 +1,14 @@
 # tests/test_cart.py
 
+import asyncio
+
 import pytest
 from aiogram.types import CallbackQuery, Message, Chat
+from handlers import cart
 from handlers.assortment import handle_add_to_cart
-from db import cursor, db
+from db import connection, set_trace_callback
+from catalog import delete_subtree, invalidate
+from migrations import migrate_cart_tables
 
 @pytest.mark.asyncio
 async def test_add_new_item_to_cart():
@@ -12,15 +17,19 @@ async def test_add_new_item_to_cart():
     запись появляется в таблице корзины с count=1.
     """
     user_id = 123456
-    cursor.execute(f'CREATE TABLE IF NOT EXISTS "{user_id}" (cart TEXT, price TEXT, count INTEGER)')
-    db.commit()
 
-    # Добавляем запись в photos
-    cursor.execute(
+    # Добавляем ветку каталога и запись в photos для линейки
+    connection.executemany(
+        'INSERT OR IGNORE INTO catalog_nodes (id, parent_id, level, name, position) VALUES (?, ?, ?, ?, ?)',
+        [(100, None, 0, "Category", 1), (101, 100, 1, "Brand", 1),
+         (102, 101, 2, "Line", 1), (103, 102, 3, "Flavor", 1)]
+    )
+    connection.execute(
         'INSERT OR IGNORE INTO photos (names, photos, desc, price) VALUES (?, ?, ?, ?)',
-        ("2_1_1", "без фото", "Test product", "100₽")
+        ("102", "без фото", "Test product", 10000)
     )
-    db.commit()
+    connection.commit()
+    invalidate()
 
     # Создаем фиктивный запрос
     dummy_callback_data = {
@@ -32,20 +41,20 @@ async def test_add_new_item_to_cart():
             "chat": {"id": user_id, "type": "private"},
             "from": {"id": user_id, "is_bot": False, "first_name": "TestUser"}
         },
-        "data": "addCart_2_1_1_2"
+        "data": "addCart:103"
     }
     callback_query = CallbackQuery(**dummy_callback_data)
     
     await handle_add_to_cart(callback_query)
 
     # Проверяем, что товар добавлен в корзину
-    item = cursor.execute(
-        f'SELECT cart, price, count FROM "{user_id}" WHERE cart=?',
-        ("2_1_1_2",)
+    item = connection.execute(
+        'SELECT sku, price, count FROM cart_items WHERE user_id=? AND sku=?',
+        (user_id, "103")
     ).fetchone()
     assert item is not None, "Товар не добавился в корзину"
-    assert item[0] == "2_1_1_2", "Некорректный код товара в корзине"
-    assert item[1] == "100₽", "Некорректная цена товара"
+    assert item[0] == "103", "Некорректный код товара в корзине"
+    assert item[1] == 10000, "Некорректная цена товара (в копейках)"
     assert item[2] == 1, "Количество должно быть 1 при первом добавлении"
 
 @pytest.mark.asyncio
@@ -64,15 +73,86 @@ async def test_add_existing_item_to_cart():
             "chat": {"id": user_id, "type": "private"},
             "from": {"id": user_id, "is_bot": False, "first_name": "TestUser"}
         },
-        "data": "addCart_2_1_1_2"
+        "data": "addCart:103"
     }
     callback_query = CallbackQuery(**dummy_callback_data)
     
     await handle_add_to_cart(callback_query)
 
-    item = cursor.execute(
-        f'SELECT cart, price, count FROM "{user_id}" WHERE cart=?',
-        ("2_1_1_2",)
+    item = connection.execute(
+        'SELECT sku, price, count FROM cart_items WHERE user_id=? AND sku=?',
+        (user_id, "103")
     ).fetchone()
     assert item is not None, "Товар должен существовать"
     assert item[2] == 2, f"Ожидали count=2, а получили {item[2]}"
+
+
+def test_migrate_per_user_cart_tables():
+    """
+    Проверяем, что старые таблицы корзин вида "<user_id>" переносятся в cart_items и удаляются,
+    а таблицы каталога с числовыми именами не затрагиваются.
+    """
+    user_id = 345678
+    connection.execute(f'CREATE TABLE "{user_id}" (cart TEXT, price TEXT, count INTEGER)')
+    connection.execute(f'INSERT INTO "{user_id}" VALUES (?, ?, ?)', ("3_1_1_1", "250₽", 2))
+    connection.execute('CREATE TABLE IF NOT EXISTS "3" (tastes TEXT, id INTEGER PRIMARY KEY)')
+    connection.commit()
+
+    migrate_cart_tables(connection)
+    connection.commit()
+
+    item = connection.execute(
+        'SELECT price, count FROM cart_items WHERE user_id=? AND sku=?', (user_id, "3_1_1_1")
+    ).fetchone()
+    assert item == ("250₽", 2), "Корзина не перенесена в cart_items"
+    tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert str(user_id) not in tables, "Старая таблица корзины не удалена"
+    assert "3" in tables, "Таблица каталога не должна удаляться"
+
+
+@pytest.mark.asyncio
+async def test_cart_validation_skipped_while_catalog_unchanged(monkeypatch):
+    """
+    Проверяем, что корзина проверяется на удалённые товары одним запросом,
+    повторное открытие без изменений каталога её не проверяет, а удаление вкуса из каталога – проверяет.
+    """
+    user_id = 234999
+    connection.executemany(
+        'INSERT OR IGNORE INTO catalog_nodes (id, parent_id, level, name, position) VALUES (?, ?, ?, ?, ?)',
+        [(700, None, 0, "Category", 1), (701, 700, 1, "Brand", 1), (702, 701, 2, "Line", 1)]
+        + [(710 + n, 702, 3, f"Flavor {n}", n) for n in range(30)]
+    )
+    connection.executemany('INSERT INTO cart_items (user_id, sku, price, count) VALUES (?, ?, ?, 1)',
+                           [(user_id, str(710 + n), 10000) for n in range(30)] + [(user_id, "1_1_1_1", 10000)])
+    connection.commit()
+    invalidate()
+    monkeypatch.setattr(cart, 'update_cart_display', lambda callback_query: asyncio.sleep(0))
+    callback_query = CallbackQuery(**{
+        "id": "cart_cb", "chat_instance": "1", "data": "cart:1",
+        "from": {"id": user_id, "is_bot": False, "first_name": "TestUser"},
+        "message": {"message_id": 1, "date": 0, "chat": {"id": user_id, "type": "private"}}
+    })
+
+    def cart_queries():
+        return [sql for sql in queries if 'cart_items' in sql]
+
+    queries = []
+    set_trace_callback(queries.append)
+    try:
+        await cart.handle_cart_display(callback_query)
+        assert len(cart_queries()) == 2, "Одно чтение корзины и одно удаление устаревших позиций"
+        queries.clear()
+        await cart.handle_cart_display(callback_query)
+        assert cart_queries() == [], "Каталог не менялся – корзина не проверяется"
+    finally:
+        set_trace_callback(None)
+    assert connection.execute('SELECT count(*) FROM cart_items WHERE user_id = ?', (user_id,)).fetchone()[0] == 30
+
+    await delete_subtree(715)
+    connection.commit()
+    await cart.handle_cart_display(callback_query)
+    assert connection.execute('SELECT count(*) FROM cart_items WHERE user_id = ?', (user_id,)).fetchone()[0] == 29
+
+    await delete_subtree(700)
+    connection.execute('DELETE FROM cart_items WHERE user_id = ?', (user_id,))
+    connection.commit()
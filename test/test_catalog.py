@@ -0,0 +1,113 @@
+# tests/test_catalog.py
+
+import pytest
+from catalog import (BRAND, CATEGORY, FLAVOR, PRODUCT, add_node, delete_subtree, get_children,
+                     get_photo, invalidate, resolve_names, save_photo, search, stats)
+from db import connection, set_trace_callback
+from migrations import migrate_catalog_tables
+
+
+@pytest.mark.asyncio
+async def test_migrate_legacy_catalog_tables():
+    """
+    Проверяем, что каталог из таблиц "Ассортимент🗂", "1", "1_1", "1_1_1" переносится в catalog_nodes,
+    а коды в photos и корзине заменяются id узлов.
+    """
+    connection.execute('CREATE TABLE "Ассортимент🗂" (tastes TEXT, id INTEGER PRIMARY KEY)')
+    connection.execute('INSERT INTO "Ассортимент🗂" VALUES (?, ?)', ("Жидкости", 1))
+    connection.execute('CREATE TABLE "1" (tastes TEXT, id INTEGER PRIMARY KEY)')
+    connection.execute('INSERT INTO "1" VALUES (?, ?)', ("Brand X", 1))
+    connection.execute('CREATE TABLE "1_1" (tastes TEXT, id INTEGER PRIMARY KEY)')
+    connection.execute('INSERT INTO "1_1" VALUES (?, ?)', ("Line Y", 1))
+    connection.execute('CREATE TABLE "1_1_1" (tastes TEXT, id INTEGER PRIMARY KEY)')
+    connection.executemany('INSERT INTO "1_1_1" VALUES (?, ?)', [("Mango", 1), ("Kiwi", 2)])
+    connection.execute('INSERT INTO photos VALUES (?, ?, ?, ?)', ("1_1_1", "без фото", "desc", "300₽"))
+    connection.execute('INSERT INTO cart_items (user_id, sku, price, count) VALUES (?, ?, ?, ?)', (456789, "1_1_1_2", "300₽", 1))
+    connection.commit()
+
+    migrate_catalog_tables(connection)
+    connection.commit()
+    invalidate()
+
+    sku = connection.execute('SELECT sku FROM cart_items WHERE user_id=?', (456789,)).fetchone()[0]
+    assert await resolve_names(int(sku)) == ["Жидкости", "Brand X", "Line Y", "Kiwi"]
+
+    line_id = connection.execute('SELECT parent_id FROM catalog_nodes WHERE id=?', (int(sku),)).fetchone()[0]
+    assert [name for _, name in await get_children(line_id)] == ["Mango", "Kiwi"]
+    assert connection.execute('SELECT price FROM photos WHERE names=?', (str(line_id),)).fetchone() == ("300₽",)
+
+    tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert not tables & {"Ассортимент🗂", "1", "1_1", "1_1_1"}, "Старые таблицы каталога не удалены"
+
+
+@pytest.mark.asyncio
+async def test_catalog_cache_serves_navigation_without_queries():
+    """
+    Проверяем, что после загрузки кэша навигация по каталогу не обращается к базе,
+    а изменения через функции модуля catalog сразу видны в кэше.
+    """
+    invalidate()
+    category_id = await add_node(None, CATEGORY, "Cache category")
+    brand_id = await add_node(category_id, BRAND, "Cache brand")
+    product_id = await add_node(brand_id, PRODUCT, "Cache line")
+    flavor_id = await add_node(product_id, FLAVOR, "Cache flavor")
+    await save_photo(product_id, "без фото", "desc", 15000)
+    connection.commit()
+
+    queries = []
+    set_trace_callback(queries.append)
+    try:
+        hits_before = stats()['hits']
+        assert await get_children(brand_id) == [(product_id, "Cache line")]
+        assert await resolve_names(flavor_id) == ["Cache category", "Cache brand", "Cache line", "Cache flavor"]
+        assert await get_photo(product_id) == ("без фото", "desc", 15000)
+    finally:
+        set_trace_callback(None)
+    assert queries == [], "Навигация по загруженному кэшу не должна делать запросов"
+    assert stats()['hits'] == hits_before + 3
+
+    await delete_subtree(product_id)
+    connection.commit()
+    assert await get_children(brand_id) == []
+    assert await get_photo(product_id) is None
+    assert connection.execute('SELECT count(*) FROM catalog_nodes WHERE id IN (?, ?)', (product_id, flavor_id)).fetchone()[0] == 0
+    await delete_subtree(product_id)  # повторное удаление (кнопка нажата дважды) ничего не делает
+
+
+@pytest.mark.asyncio
+async def test_search_index_follows_catalog_changes():
+    """
+    Проверяем, что поиск находит линейку одним запросом по префиксам названий и описанию,
+    а индекс обновляется при добавлении и удалении узлов каталога.
+    """
+    invalidate()
+    category_id = await add_node(None, CATEGORY, "Жидкости поиск")
+    brand_id = await add_node(category_id, BRAND, "Husky")
+    product_id = await add_node(brand_id, PRODUCT, "Double Ice")
+    mango_id = await add_node(product_id, FLAVOR, "Манго")
+    await save_photo(product_id, "без фото", "Ледяная линейка с холодком", 45000)
+    other_id = await add_node(brand_id, PRODUCT, "Premium")
+    connection.commit()
+    await get_children(None)
+
+    queries = []
+    set_trace_callback(queries.append)
+    try:
+        assert await search("хаски") == []
+        assert await search("husk манго") == [(product_id, "Husky Double Ice")]
+    finally:
+        set_trace_callback(None)
+    # Внутренние запросы FTS5 к своим таблицам (catalog_search_*) не считаются
+    queries = [sql for sql in queries if 'catalog_search_' not in sql and 'PRAGMA' not in sql]
+    assert len(queries) == 2, "Поиск должен выполняться одним запросом"
+    assert (product_id, "Husky Double Ice") in await search("холод")
+    assert {found for found, _ in await search("husky")} == {product_id, other_id}
+
+    await delete_subtree(mango_id)
+    connection.commit()
+    assert await search("манго") == []
+    assert await search("double") == [(product_id, "Husky Double Ice")]
+
+    await delete_subtree(category_id)
+    connection.commit()
+    assert await search("husky") == []
@@ -0,0 +1,38 @@
+# tests/test_db.py
+
+import asyncio
+
+import pytest
+
+from db import connection, execute, fetchone, unit_of_work
+
+
+@pytest.mark.asyncio
+async def test_reads_are_served_during_write_transaction():
+    """
+    Проверяем, что база работает в режиме WAL и читатели из пула отвечают, пока писатель
+    держит открытую транзакцию, видя только зафиксированные данные, а сама единица работы
+    видит свои изменения.
+    """
+    assert connection.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+    await execute('INSERT INTO sales (positions, desc) VALUES (?, ?)', ("WAL sale", "committed"))
+
+    written = asyncio.Event()
+    release = asyncio.Event()
+
+    async def checkout():
+        async with unit_of_work():
+            await execute('UPDATE sales SET desc = ? WHERE positions = ?', ("pending", "WAL sale"))
+            assert await fetchone('SELECT desc FROM sales WHERE positions = ?', ("WAL sale",)) == ("pending",)
+            written.set()
+            await release.wait()
+
+    writer = asyncio.create_task(checkout())
+    await written.wait()
+    row = await asyncio.wait_for(fetchone('SELECT desc FROM sales WHERE positions = ?', ("WAL sale",)), 1)
+    assert row == ("committed",), "Читатель должен видеть только зафиксированные данные"
+    release.set()
+    await writer
+
+    assert await fetchone('SELECT desc FROM sales WHERE positions = ?', ("WAL sale",)) == ("pending",)
+    await execute('DELETE FROM sales WHERE positions = ?', ("WAL sale",))
@@ -0,0 +1,50 @@
+# tests/test_fsm_storage.py
+
+import time
+
+import pytest
+
+import fsm_storage
+from db import connection
+from fsm_storage import SQLiteStorage
+
+
+@pytest.mark.asyncio
+async def test_states_survive_restart_and_expire(monkeypatch):
+    """
+    Проверяем, что хранилище состояний:
+        - пишет изменения в базу отложенно, одним flush;
+        - после "перезапуска" (новый экземпляр) продолжает начатый диалог;
+        - держит в памяти не больше cache_size состояний;
+        - удаляет брошенные диалоги по TTL.
+    """
+    connection.execute('DELETE FROM fsm_states')
+    connection.commit()
+    storage = SQLiteStorage(cache_size=2)
+
+    await storage.set_state(chat=700, user=700, state='FSMAdmin:brand')
+    await storage.update_data(chat=700, user=700, data={'category': 'Жидкости'})
+    for user_id in (701, 702, 703):
+        await storage.get_state(chat=user_id, user=user_id)
+    assert connection.execute('SELECT count(*) FROM fsm_states').fetchone() == (0,), "Запись должна быть отложенной"
+    assert ('700', '700') in storage.cache, "Незаписанное состояние нельзя вытеснять"
+
+    await storage.close()
+    assert connection.execute('SELECT state, data FROM fsm_states').fetchall() == [('FSMAdmin:brand', '{"category": "Жидкости"}')]
+    assert len(storage.cache) == 2
+
+    restarted = SQLiteStorage()
+    assert await restarted.get_state(chat=700, user=700) == 'FSMAdmin:brand'
+    assert await restarted.get_data(chat=700, user=700) == {'category': 'Жидкости'}
+    await restarted.finish(chat=700, user=700)
+    await restarted.close()
+    assert connection.execute('SELECT count(*) FROM fsm_states').fetchone() == (0,), "Завершённый диалог удаляется"
+
+    # Брошенный диалог
+    connection.execute("INSERT INTO fsm_states (chat, user, state, updated_at) VALUES ('704', '704', 'FSMSale:name', ?)",
+                       (int(time.time()) - fsm_storage.FSM_TTL - 1,))
+    connection.commit()
+    expired = SQLiteStorage()
+    assert await expired.get_state(chat=704, user=704) is None
+    await expired.close()
+    assert connection.execute('SELECT count(*) FROM fsm_states').fetchone() == (0,)
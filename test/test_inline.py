@@ -0,0 +1,79 @@
+# tests/test_inline.py
+
+import logging
+import time
+
+import pytest
+from aiogram import types
+
+import catalog
+from bot import bot
+from conftest import fake_request
+from db import connection, set_trace_callback
+from handlers.inline import INLINE_PAGE_SIZE, handle_inline_query
+
+log = logging.getLogger(__name__)
+
+BRANDS = 30
+LINES = 100  # линеек на бренд
+
+
+def inline_query(query, offset=''):
+    return types.InlineQuery(**{
+        'id': 'iq1', 'from': {'id': 678001, 'is_bot': False, 'first_name': 'InlineUser'},
+        'query': query, 'offset': offset,
+    })
+
+
+@pytest.mark.asyncio
+async def test_inline_query_served_from_memory(monkeypatch):
+    """
+    Проверяем, что inline-запрос по каталогу из тысяч линеек обслуживается из памяти без запросов к базе,
+    отвечает страницами через next_offset и разрешает Telegram кэшировать ответ.
+    """
+    base = 500000
+    nodes = [(base, None, 0, 'Инлайн ассортимент', 1)]
+    for b in range(BRANDS):
+        brand_id = base + 1 + b * (LINES + 1)
+        nodes.append((brand_id, base, 1, f'Бренд{b}', b))
+        nodes.extend((brand_id + 1 + n, brand_id, 2, f'Линейка {n}', n) for n in range(LINES))
+    nodes.append((base + 99999, base + 2, 3, 'Ёжевика', 1))
+    connection.executemany('INSERT INTO catalog_nodes (id, parent_id, level, name, position) VALUES (?, ?, ?, ?, ?)', nodes)
+    connection.execute('INSERT INTO photos (names, photos, desc, price) VALUES (?, ?, ?, ?)',
+                       (str(base + 2), 'https://example.com/p.jpg', 'Описание', 50000))
+    connection.commit()
+    catalog.invalidate()
+    answers = []
+
+    async def capture(method, data=None, files=None, **kwargs):
+        if method == 'answerInlineQuery':
+            answers.append(data)
+        return await fake_request(method, data, files, **kwargs)
+
+    monkeypatch.setattr(bot, 'request', capture)
+    try:
+        await handle_inline_query(inline_query('бренд1'))  # загрузка кэша и построение индекса
+        first = answers[-1]
+        assert first['cache_time'] > 0 and first['next_offset'] == str(INLINE_PAGE_SIZE)
+
+        queries = []
+        set_trace_callback(queries.append)
+        started = time.perf_counter()
+        try:
+            await handle_inline_query(inline_query('бренд1 линейка', offset=str(INLINE_PAGE_SIZE)))
+        finally:
+            set_trace_callback(None)
+        elapsed = time.perf_counter() - started
+        log.info('Inline-запрос по %s линейкам: %.2f мс', BRANDS * LINES, elapsed * 1000)
+        assert queries == [], "Inline-запрос не должен обращаться к базе"
+
+        found = await catalog.find_products('ежев')
+        assert found == [(base + 2, 'Бренд0 Линейка 0')], "Поиск по вкусу, ё приравнивается к е"
+        await handle_inline_query(inline_query('ежевика'))
+        assert '"photo_url": "https://example.com/p.jpg"' in answers[-1]['results']
+        assert answers[-1]['next_offset'] == ''
+    finally:
+        connection.execute('DELETE FROM photos WHERE names = ?', (str(base + 2),))
+        connection.execute('DELETE FROM catalog_nodes WHERE id >= ?', (base,))
+        connection.commit()
+        catalog.invalidate()
@@ -0,0 +1,72 @@
+# tests/test_media.py
+
+import pytest
+from aiogram.types import CallbackQuery
+
+import catalog
+from bot import bot
+from conftest import fake_request
+from db import connection
+from handlers.assortment import handle_product_detail
+
+
+def callback(product_id, photo=False, user_id=567001):
+    message = {"message_id": 1, "date": 0, "chat": {"id": user_id, "type": "private"}}
+    if photo:
+        message["photo"] = [{"file_id": "old", "file_unique_id": "old", "width": 1, "height": 1}]
+    else:
+        message["text"] = "Бренд"
+    return CallbackQuery(**{
+        "id": "media_cb",
+        "from": {"id": user_id, "is_bot": False, "first_name": "MediaUser"},
+        "message": message,
+        "chat_instance": "1",
+        "data": f"product:{product_id}"
+    })
+
+
+@pytest.mark.asyncio
+async def test_product_photo_is_uploaded_once(monkeypatch):
+    """
+    Проверяем, что карточка товара отправляется фото по ссылке один раз, дальше – по сохранённому file_id,
+    а замена фото в админке сбрасывает file_id.
+    """
+    connection.executemany(
+        'INSERT OR IGNORE INTO catalog_nodes (id, parent_id, level, name, position) VALUES (?, ?, ?, ?, ?)',
+        [(300, None, 0, "Категория", 1), (301, 300, 1, "Бренд", 1), (302, 301, 2, "Линейка", 1), (303, 302, 3, "Вкус", 1)]
+    )
+    connection.execute('INSERT OR REPLACE INTO photos (names, photos, desc, price) VALUES (?, ?, ?, ?)',
+                       ("302", "https://example.com/1.jpg", "Описание", 10000))
+    connection.commit()
+    catalog.invalidate()
+    sent = []
+
+    async def telegram(method, data=None, files=None, **kwargs):
+        sent.append((method, data))
+        if method in ('sendPhoto', 'editMessageMedia'):
+            return {'message_id': 2, 'date': 0, 'chat': {'id': 567001, 'type': 'private'},
+                    'photo': [{'file_id': 'small', 'file_unique_id': 's', 'width': 90, 'height': 90},
+                              {'file_id': 'uploaded', 'file_unique_id': 'u', 'width': 800, 'height': 800}]}
+        return await fake_request(method, data, files, **kwargs)
+
+    monkeypatch.setattr(bot, 'request', telegram)
+
+    await handle_product_detail(callback(302))
+    methods = [method for method, _ in sent]
+    assert methods == ['sendPhoto', 'deleteMessage', 'answerCallbackQuery']
+    assert sent[0][1]['photo'] == 'https://example.com/1.jpg'
+    assert 'Описание' in sent[0][1]['caption']
+    assert await catalog.get_file_id(302, 'https://example.com/1.jpg') == 'uploaded'
+
+    sent.clear()
+    catalog.invalidate()  # file_id читается и из базы
+    await handle_product_detail(callback(302, photo=True))
+    assert sent[0][0] == 'editMessageMedia'
+    assert sent[0][1]['media'].media == 'uploaded'
+
+    await catalog.save_photo(302, photo='https://example.com/2.jpg')
+    assert await catalog.get_file_id(302, 'https://example.com/2.jpg') is None
+    assert connection.execute('SELECT count(*) FROM photo_files WHERE product_id = 302').fetchone()[0] == 0
+
+    await catalog.delete_subtree(300)
+    connection.commit()
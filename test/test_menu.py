@@ -0,0 +1,57 @@
+# tests/test_menu.py
+
+import pytest
+from aiogram.types import Message
+
+import counters
+from bot import bot
+from conftest import fake_request
+from db import connection, set_trace_callback
+from handlers.start import start
+
+
+@pytest.mark.asyncio
+async def test_main_menu_single_query(monkeypatch):
+    """
+    Проверяем, что главное меню строится одним запросом к базе,
+    а счётчики акций и отзывов берутся из памяти и обновляются обработчиками.
+    """
+    user_id = 345678
+    connection.execute('INSERT OR IGNORE INTO id (users, history, spend) VALUES (?, ?, ?)', (user_id, "None", 0))
+    connection.execute('INSERT OR REPLACE INTO cart_items (user_id, sku, price, count) VALUES (?, ?, ?, ?)', (user_id, "1", 10000, 1))
+    connection.commit()
+    counters.invalidate()
+    await counters.get(counters.SALES)
+    await counters.get(counters.OTZ)
+
+    sent = []
+
+    async def capture(method, data=None, files=None, **kwargs):
+        sent.append(data)
+        return await fake_request(method, data, files, **kwargs)
+
+    monkeypatch.setattr(bot, 'request', capture)
+    message = Message(**{
+        "message_id": 1,
+        "date": 1633036800,
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "MenuUser"},
+        "text": "/start"
+    })
+
+    queries = []
+    set_trace_callback(queries.append)
+    try:
+        await start(message)
+    finally:
+        set_trace_callback(None)
+    assert len(queries) == 1, f"Меню должно строиться одним запросом, выполнено: {queries}"
+    assert 'cart:1' in sent[-1]['reply_markup'], "Нет кнопки корзины"
+    assert 'sales' not in sent[-1]['reply_markup']
+
+    # Акция, созданная через счётчик, сразу видна в меню без пересчёта
+    connection.execute('INSERT INTO sales (positions, desc) VALUES (?, ?)', ("Sale", "desc"))
+    connection.commit()
+    counters.adjust(counters.SALES, 1)
+    await start(message)
+    assert 'sales' in sent[-1]['reply_markup'], "Кнопка акций не появилась"
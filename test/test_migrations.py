@@ -0,0 +1,39 @@
+# tests/test_migrations.py
+
+import sqlite3
+
+from migrations import MIGRATIONS, migrate
+
+
+def test_migrate_legacy_database_once():
+    """
+    Проверяем, что миграции приводят старую базу к актуальной схеме,
+    записывают версии в schema_version и не выполняются повторно.
+    """
+    connection = sqlite3.connect(':memory:')
+    connection.execute('CREATE TABLE id (users TEXT, history TEXT DEFAULT NULL, first_client INTEGER DEFAULT 1, first_pressed INTEGER DEFAULT 0, spend INTEGER DEFAULT 0, start INTEGER DEFAULT NULL, product TEXT DEFAULT NULL, ban INTEGER DEFAULT 0)')
+    connection.executemany('INSERT INTO id (users, spend) VALUES (?, ?)', [("111", 500), ("111", 0), ("222", 0)])
+    connection.execute(
+        'UPDATE id SET history = ? WHERE users = ? AND spend = ?',
+        ("02-03-24:\nBrand Line Mango - 2шт.\n\nНа сумму: 500₽\n——————————————————-\n01-02-24:\nBrand Line Kiwi - 1шт.\n\nНа сумму: 250₽", "111", 500)
+    )
+    connection.execute('CREATE TABLE photos (names TEXT, photos TEXT, desc TEXT, price TEXT)')
+    connection.executemany('INSERT INTO photos VALUES (?, ?, ?, ?)', [("5", "old", "d", "1₽"), ("5", "new", "d", "2₽")])
+    connection.execute('CREATE TABLE users (user_id INTEGER)')
+    connection.commit()
+
+    timings = migrate(connection)
+
+    assert [version for version, _, _ in timings] == [version for version, _ in MIGRATIONS]
+    assert connection.execute('SELECT users, spend FROM id ORDER BY users').fetchall() == [(111, 50000), (222, 0)]
+    assert connection.execute("SELECT pk FROM pragma_table_info('id') WHERE name = 'users'").fetchone() == (1,)
+    assert connection.execute('SELECT photos, price FROM photos').fetchall() == [("new", 200)]
+    assert connection.execute("SELECT name FROM sqlite_master WHERE name = 'users'").fetchone() is None
+    assert connection.execute("SELECT name FROM sqlite_master WHERE name = 'feedbacks_chat_message'").fetchone() is not None
+
+    orders = connection.execute('SELECT id, user_id, total FROM orders ORDER BY id').fetchall()
+    assert [(user_id, total) for _, user_id, total in orders] == [(111, 25000), (111, 50000)], "История перенесена неверно"
+    assert connection.execute('SELECT name, qty FROM order_items WHERE order_id = ?', (orders[1][0],)).fetchall() == [("Brand Line Mango", 2)]
+    assert connection.execute('SELECT count(*) FROM id WHERE history IS NOT NULL').fetchone() == (0,)
+
+    assert migrate(connection) == [], "Повторный запуск не должен применять миграции"
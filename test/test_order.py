@@ -3,42 +3,43 @@
 import pytest
 from aiogram.types import CallbackQuery, Message, Chat
 from handlers.cart import handle_order_confirmation
-from db import cursor, db
+from db import connection
+from catalog import invalidate
+from orders import HISTORY_PAGE_SIZE, PURCHASES_PAGE_SIZE, create_order, get_history_page, get_purchases_page
 
-# Создаем необходимые таблицы для дешифровки кода
-cursor.execute('CREATE TABLE IF NOT EXISTS "2" (tastes TEXT, id INTEGER PRIMARY KEY)')
-cursor.execute('INSERT OR IGNORE INTO "2" (tastes, id) VALUES (?, ?)', ("MainTaste", 1))
-cursor.execute('CREATE TABLE IF NOT EXISTS "2_1" (tastes TEXT, id INTEGER PRIMARY KEY)')
-cursor.execute('INSERT OR IGNORE INTO "2_1" (tastes, id) VALUES (?, ?)', ("SecondaryTaste", 1))
-cursor.execute('CREATE TABLE IF NOT EXISTS "2_1_1" (tastes TEXT, id INTEGER PRIMARY KEY)')
-cursor.execute('INSERT OR IGNORE INTO "2_1_1" (tastes, id) VALUES (?, ?)', ("FullTaste", 2))
-db.commit()
+# Создаем ветку каталога: ассортимент → бренд → линейка → вкус
+connection.executemany(
+    'INSERT OR IGNORE INTO catalog_nodes (id, parent_id, level, name, position) VALUES (?, ?, ?, ?, ?)',
+    [(200, None, 0, "Category", 1), (201, 200, 1, "MainTaste", 1),
+     (202, 201, 2, "SecondaryTaste", 1), (203, 202, 3, "FullTaste", 1)]
+)
+connection.commit()
+invalidate()
 
 
 @pytest.mark.asyncio
 async def test_order_confirmation():
     """
     Проверяем, что при оформлении заказа:
-        - Корзина очищается и таблица пересоздаётся.
-        - Поля history и spend обновляются.
+        - Корзина очищается.
+        - Заказ сохраняется в orders/order_items, spend обновляется.
+        - Повторное нажатие с пустой корзиной заказ не создаёт.
     """
     user_id = 234567
 
     # Создаем запись в таблице id если нет
-    cursor.execute(
+    connection.execute(
         'INSERT OR IGNORE INTO id (users, history, spend) VALUES (?, ?, ?)',
         (str(user_id), "None", 0)
     )
-    db.commit()
-
-    # Создаем таблицу корзины и добавляем в неё товар
-    cursor.execute(f'CREATE TABLE IF NOT EXISTS "{user_id}" (cart TEXT, price TEXT, count INTEGER)')
-    db.commit()
-    cursor.execute(
-        f'INSERT INTO "{user_id}" (cart, price, count) VALUES (?, ?, ?)',
-        ("2_1_1_2", "100₽", 3)
+    connection.commit()
+
+    # Добавляем товар в корзину
+    connection.execute(
+        'INSERT INTO cart_items (user_id, sku, price, count) VALUES (?, ?, ?, ?)',
+        (user_id, "203", 10000, 3)
     )
-    db.commit()
+    connection.commit()
 
     dummy_callback_data = {
         "id": "test_order_cb",
@@ -55,23 +56,62 @@ async def test_order_confirmation():
 
     await handle_order_confirmation(callback_query)
 
-    # Проверяем, что таблица корзины пересоздана
-    result = cursor.execute(
-        "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
-        (str(user_id),)
-    ).fetchone()
-    assert result is not None, "Таблица корзины не пересоздана"
-
     # Проверяем, что корзина очищена
-    item = cursor.execute(f'SELECT * FROM "{user_id}"').fetchone()
+    item = connection.execute('SELECT * FROM cart_items WHERE user_id=?', (user_id,)).fetchone()
     assert item is None, "Корзина не очищена после заказа"
 
     # Проверяем, что spend обновился
-    spend = cursor.execute('SELECT spend FROM id WHERE users=?', (str(user_id),)).fetchone()[0]
-    assert spend == 300, f"Неверное значение spend, ожидалось 300, получили {spend}"
-
-    # Проверяем, что history обновилось
-    history = cursor.execute('SELECT history FROM id WHERE users=?', (str(user_id),)).fetchone()[0]
-    assert history != "None", "Поле history не обновилось"
-    assert "2_1_1_2" in history, "В history не добавился код товара"
-    assert "На сумму: 300₽" in history, "В history нет итоговой суммы"
+    spend = connection.execute('SELECT spend FROM id WHERE users=?', (str(user_id),)).fetchone()[0]
+    assert spend == 30000, f"Неверное значение spend, ожидалось 30000 копеек, получили {spend}"
+
+    # Проверяем, что заказ сохранён в orders и order_items
+    order = connection.execute('SELECT id, total FROM orders WHERE user_id=? ORDER BY id DESC', (user_id,)).fetchone()
+    assert order is not None, "Заказ не сохранён"
+    assert order[1] == 30000, "Неверная сумма заказа"
+    items = connection.execute('SELECT sku, qty, unit_price, name FROM order_items WHERE order_id=?', (order[0],)).fetchall()
+    assert items == [("203", 3, 10000, "MainTaste SecondaryTaste FullTaste")], "Неверные позиции заказа"
+    assert connection.execute('SELECT sku, times FROM user_purchases WHERE user_id=?', (user_id,)).fetchall() == [("203", 1)]
+
+    # Повторное нажатие после оформления не создаёт пустой заказ
+    await handle_order_confirmation(callback_query)
+    assert connection.execute('SELECT count(*) FROM orders WHERE user_id=?', (user_id,)).fetchone()[0] == 1
+
+
+@pytest.mark.asyncio
+async def test_history_pages():
+    """
+    Проверяем, что история покупок выводится страницами от новых заказов к старым
+    и листается в обе стороны.
+    """
+    user_id = 234568
+    for n in range(HISTORY_PAGE_SIZE + 2):
+        await create_order(user_id, 100 * (n + 1), [("203", 1, 100 * (n + 1), f"Item {n}")])
+
+    page, has_older, has_newer = await get_history_page(user_id)
+    assert [items[0][0] for _, _, _, items in page] == [f"Item {n}" for n in range(HISTORY_PAGE_SIZE + 1, 1, -1)]
+    assert has_older and not has_newer
+
+    older, has_older, has_newer = await get_history_page(user_id, before=page[-1][0])
+    assert [total for _, _, total, _ in older] == [200, 100]
+    assert not has_older and has_newer
+
+    newer, _, has_newer = await get_history_page(user_id, after=older[0][0])
+    assert newer == page and not has_newer
+
+
+@pytest.mark.asyncio
+async def test_purchases_are_distinct_and_paginated():
+    """
+    Проверяем, что повторная покупка вкуса не создаёт дубликатов в user_purchases,
+    а список для выбора товара отзыва читается страницами.
+    """
+    user_id = 234569
+    skus = [str(1000 + n) for n in range(PURCHASES_PAGE_SIZE + 1)]
+    for _ in range(2):
+        await create_order(user_id, 100, [(sku, 1, 100, sku) for sku in skus])
+
+    assert connection.execute('SELECT count(*), min(times) FROM user_purchases WHERE user_id=?', (user_id,)).fetchone() == (len(skus), 2)
+    page, has_more = await get_purchases_page(user_id)
+    assert page == skus[:PURCHASES_PAGE_SIZE] and has_more
+    page, has_more = await get_purchases_page(user_id, page[-1])
+    assert page == skus[PURCHASES_PAGE_SIZE:] and not has_more
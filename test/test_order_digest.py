@@ -0,0 +1,67 @@
+# tests/test_order_digest.py
+
+import pytest
+
+import order_digest
+import outbox
+from bot import bot
+from conftest import fake_request
+
+
+@pytest.mark.asyncio
+async def test_orders_are_coalesced_into_digest(monkeypatch):
+    """
+    Проверяем, что уведомления о заказах:
+        - уходят только администраторам;
+        - первый заказ после затишья отправляется сразу, с пересылкой стартового сообщения;
+        - заказы под нагрузкой собираются в одну сводку с кнопкой для каждого заказа.
+    """
+    monkeypatch.setattr(order_digest, 'ADMIN_IDS', {1, 2})
+    monkeypatch.setattr(order_digest, 'ORDER_DIGEST_SIZE', 3)
+    monkeypatch.setattr(order_digest, '_digest', order_digest.OrderDigest())
+    calls = []
+
+    async def telegram(method, data=None, files=None, **kwargs):
+        calls.append((method, int(data['chat_id']), data.get('text'), data.get('reply_markup')))
+        return await fake_request(method, data, files, **kwargs)
+
+    monkeypatch.setattr(bot, 'request', telegram)
+
+    order_digest.notify_order(501, 'first', 7, 'Бренд Линейка Вкус - 1шт.\n\n', 10000)
+    for user_id in (502, 503, 504):
+        order_digest.notify_order(user_id, None, None, 'Бренд Линейка Вкус - 2шт.\n\n', 20000)
+    await outbox.flush()
+
+    assert {chat_id for _, chat_id, _, _ in calls} == {1, 2}, "Уведомления должны получать только администраторы"
+    admin_calls = [call for call in calls if call[1] == 1]
+    assert [method for method, _, _, _ in admin_calls] == ['forwardMessage', 'sendMessage', 'sendMessage']
+    assert '@first' in admin_calls[1][2]
+    digest_text, digest_markup = admin_calls[2][2], admin_calls[2][3]
+    assert digest_text.startswith('Новые заказы: 3')
+    assert all(f'id {user_id}' in digest_text for user_id in (502, 503, 504))
+    for user_id in (502, 503, 504):
+        assert f'askManager:{user_id}' in digest_markup, "У каждого заказа в сводке должна быть своя кнопка"
+
+
+@pytest.mark.asyncio
+async def test_pending_digest_is_sent_on_shutdown(monkeypatch):
+    """Проверяем, что при остановке бота накопленная сводка заказов отправляется, а не теряется."""
+    import main
+    from bot import dp
+
+    monkeypatch.setattr(order_digest, 'ADMIN_IDS', {1})
+    monkeypatch.setattr(order_digest, '_digest', order_digest.OrderDigest())
+    texts = []
+
+    async def telegram(method, data=None, files=None, **kwargs):
+        texts.append(data.get('text'))
+        return await fake_request(method, data, files, **kwargs)
+
+    monkeypatch.setattr(bot, 'request', telegram)
+    for user_id in (601, 602, 603):
+        order_digest.notify_order(user_id, None, None, 'Бренд Линейка Вкус - 1шт.\n\n', 10000)
+    await outbox.flush()
+    assert len(texts) == 1, "Заказы после первого копятся до конца интервала"
+
+    await main.on_shutdown(dp)
+    assert len(texts) == 2 and texts[1].startswith('Новые заказы: 2')
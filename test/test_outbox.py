@@ -0,0 +1,77 @@
+# tests/test_outbox.py
+
+import asyncio
+
+import pytest
+from aiogram.utils.exceptions import NetworkError, RetryAfter
+
+import outbox
+from bot import bot
+from conftest import fake_request
+
+
+@pytest.mark.asyncio
+async def test_outbox_priorities_order_and_retries(monkeypatch):
+    """
+    Проверяем, что очередь исходящих сообщений:
+        - отправляет ответы пользователям раньше рассылки;
+        - сохраняет порядок сообщений одному чату;
+        - повторяет вызов после сетевой ошибки и считает метрики.
+    """
+    monkeypatch.setattr(outbox, 'OUTBOX_WORKERS', 1)
+    monkeypatch.setattr(outbox, 'MAX_ATTEMPTS', 2)
+    # Ожидания после сетевой ошибки и по лимиту чата в тесте не нужны
+    monkeypatch.setattr(outbox, 'RETRY_DELAY', 0)
+    monkeypatch.setattr(outbox, 'OUTBOX_CHAT_BURST', 10)
+    queue = outbox.Outbox()
+    sent = []
+    failures = []
+
+    async def telegram(method, data=None, files=None, **kwargs):
+        if data['text'] == 'flaky' and not failures:
+            failures.append(data['chat_id'])
+            raise NetworkError('connection reset')
+        sent.append((int(data['chat_id']), data['text']))
+        return await fake_request(method, data, files, **kwargs)
+
+    monkeypatch.setattr(bot, 'request', telegram)
+
+    for chat_id in (10, 11):
+        queue.enqueue(chat_id, 'send_message', chat_id, 'bulk', priority=outbox.BULK)
+    first = queue.enqueue(20, 'send_message', 20, 'first')
+    queue.enqueue(20, 'send_message', 20, 'flaky')
+    queue.enqueue(20, 'send_message', 20, 'third')
+    await queue.flush()
+
+    assert sent[0] == (20, 'first'), "Ответ пользователю должен уйти раньше рассылки"
+    assert [text for chat_id, text in sent if chat_id == 20] == ['first', 'flaky', 'third']
+    assert {chat_id for chat_id, text in sent if text == 'bulk'} == {10, 11}
+    assert (await first).chat.id == 20
+    stats = queue.stats()
+    assert (stats['sent'], stats['failed'], stats['retries']) == (5, 0, 1)
+    assert stats['depth'] == {'interactive': 0, 'bulk': 0}
+
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_all_chats(monkeypatch):
+    """Проверяем, что RetryAfter от Telegram останавливает отправку не только в этот чат, но и во все остальные."""
+    monkeypatch.setattr(outbox, 'OUTBOX_WORKERS', 2)
+    queue = outbox.Outbox()
+    sent = []
+
+    async def telegram(method, data=None, files=None, **kwargs):
+        if data['text'] == 'limit' and not sent:
+            sent.append(None)
+            raise RetryAfter(1)
+        sent.append(int(data['chat_id']))
+        return await fake_request(method, data, files, **kwargs)
+
+    monkeypatch.setattr(bot, 'request', telegram)
+    queue.enqueue(30, 'send_message', 30, 'limit')
+    await asyncio.sleep(0.05)
+    queue.enqueue(31, 'send_message', 31, 'other')
+    await asyncio.sleep(0.2)
+    assert sent == [None], "Пока действует RetryAfter, другим чатам тоже не отправляется"
+    await queue.flush()
+    assert sorted(sent[1:]) == [30, 31]
+    assert queue.stats()['retry_after'] == 1
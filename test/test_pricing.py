@@ -0,0 +1,65 @@
+# tests/test_pricing.py
+
+import pytest
+
+from db import connection, set_trace_callback
+from pricing import NO_DISCOUNT, cart_counts, format_price, parse_price, price_cart
+
+
+def test_parse_and_format_price():
+    """Проверяем перевод цены из ввода администратора в копейки и обратно."""
+    assert parse_price("150₽") == 15000
+    assert parse_price("149,9") == 14990
+    assert parse_price("без изменений") is None
+    assert format_price(15000) == "150₽"
+    assert format_price(14990) == "149.90₽"
+
+
+@pytest.mark.asyncio
+async def test_price_cart_applies_discounts_in_one_query():
+    """
+    Проверяем, что корзина и скидки пользователя читаются одним запросом,
+    а скидки применяются к каждой позиции и итогу один раз.
+    """
+    user_id = 789012
+    connection.execute('INSERT OR REPLACE INTO id (users, first_pressed, spend) VALUES (?, ?, ?)', (user_id, 1, 6000_00))
+    connection.executemany('INSERT OR REPLACE INTO cart_items (user_id, sku, price, count) VALUES (?, ?, ?, ?)',
+                           [(user_id, "1", 100_00, 2), (user_id, "2", 250_00, 1)])
+    connection.commit()
+
+    queries = []
+    set_trace_callback(queries.append)
+    try:
+        cart = await price_cart(user_id)
+    finally:
+        set_trace_callback(None)
+
+    assert len(queries) == 1
+    # 100₽ → 90₽ (первый заказ) → 85.50₽ (постоянный покупатель)
+    assert [(line.sku, line.unit_price, line.total) for line in cart.lines] == [("1", 85_50, 171_00), ("2", 213_75, 213_75)]
+    assert cart.total == 384_75
+
+
+@pytest.mark.asyncio
+async def test_cart_counts_reads_profile_in_the_same_query():
+    """Проверяем, что карточка товара получает количества в корзине и скидки одним запросом, в том числе без корзины."""
+    user_id = 789013
+    connection.execute('INSERT OR REPLACE INTO id (users, first_pressed, spend) VALUES (?, ?, ?)', (user_id, 1, 0))
+    connection.commit()
+
+    queries = []
+    set_trace_callback(queries.append)
+    try:
+        empty = await cart_counts(user_id)
+        connection.execute('INSERT OR REPLACE INTO cart_items (user_id, sku, price, count) VALUES (?, ?, ?, ?)',
+                           (user_id, "5", 100_00, 3))
+        connection.commit()
+        queries.clear()
+        cart = await cart_counts(user_id)
+    finally:
+        set_trace_callback(None)
+
+    assert len(queries) == 1
+    assert empty.counts == {} and empty.profile.first_order
+    assert cart.counts == {"5": 3} and cart.profile.apply(100_00) == 90_00
+    assert (await cart_counts(789014)).profile == NO_DISCOUNT
@@ -0,0 +1,132 @@
+# tests/test_reviews.py
+
+import json
+
+import pytest
+from aiogram.types import CallbackQuery
+
+import outbox
+import reviews
+from bot import bot
+from conftest import fake_request
+from db import connection
+from handlers.client import ModerationBatch, handle_feedbacks_callback, handle_moderation, handle_otz_callback
+from reviews import get_reviews_page
+
+
+def callback(data, user_id=456001):
+    return CallbackQuery(**{
+        "id": "otz_cb",
+        "from": {"id": user_id, "is_bot": False, "first_name": "ReviewUser"},
+        "message": {"message_id": 1, "date": 0, "chat": {"id": user_id, "type": "private"}},
+        "chat_instance": "1",
+        "data": data
+    })
+
+
+@pytest.mark.asyncio
+async def test_reviews_are_shown_page_by_page(monkeypatch):
+    """
+    Проверяем, что отзывы показываются страницами в одном сообщении без пересылок,
+    а кнопки листают страницы по id.
+    """
+    connection.execute('DELETE FROM otz')
+    connection.executemany(
+        'INSERT INTO otz (chat, message, product, text) VALUES (?, ?, ?, ?)',
+        [(900 + n, n, f'Товар {n}', f'Отзыв {n}') for n in range(1, 13)]
+    )
+    connection.commit()
+
+    page, has_older, has_newer = await get_reviews_page()
+    assert [row[4] for row in page] == [f'Отзыв {n}' for n in range(12, 7, -1)]
+    assert has_older and not has_newer
+    older, _, _ = await get_reviews_page(before=page[-1][0])
+    newer, _, has_newer = await get_reviews_page(after=older[0][0])
+    assert newer == page and not has_newer
+
+    sent = []
+
+    async def capture(method, data=None, files=None, **kwargs):
+        sent.append((method, data))
+        if method == 'forwardMessage':
+            return {'message_id': 50, 'date': 0, 'chat': {'id': 456001, 'type': 'private'}, 'caption': 'Старый текст'}
+        return await fake_request(method, data, files, **kwargs)
+
+    monkeypatch.setattr(bot, 'request', capture)
+
+    await handle_otz_callback(callback('otz'))
+    edits = [data for method, data in sent if method == 'editMessageText']
+    assert len(edits) == 1 and 'Товар 12:\nОтзыв 12' in edits[0]['text']
+    assert all(method != 'forwardMessage' for method, _ in sent), "Отзывы с сохранённым текстом не пересылаются"
+    markup = [data['reply_markup'] for method, data in sent if method == 'editMessageReplyMarkup'][-1]
+    assert f'otzOlder:{page[-1][0]}' in markup
+    assert 'otzNewer' not in markup
+
+    # Текст отзыва, опубликованного до сохранения текста, восстанавливается одной пересылкой
+    connection.execute('INSERT INTO otz (chat, message, product) VALUES (?, ?, ?)', (999, 77, 'Старый'))
+    connection.commit()
+    for attempt in range(2):
+        sent.clear()
+        await handle_otz_callback(callback('otz'))
+        await outbox.flush()
+        edits = [data for method, data in sent if method == 'editMessageText']
+        assert 'Старый:\nСтарый текст' in edits[0]['text']
+        if attempt == 0:
+            assert [method for method, _ in sent if method in ('forwardMessage', 'deleteMessage')] == \
+                ['forwardMessage', 'deleteMessage']
+    assert all(method != 'forwardMessage' for method, _ in sent), "Повторный показ – только из базы"
+    assert connection.execute('SELECT text FROM otz WHERE message = 77').fetchone() == ('Старый текст',)
+
+    connection.execute('DELETE FROM otz')
+    connection.commit()
+
+
+@pytest.mark.asyncio
+async def test_moderation_page_bulk_actions(monkeypatch):
+    """
+    Проверяем, что очередь модерации выводится одной страницей без пересылок,
+    а одобрение всей страницы и блокировка автора применяются к списку id сразу.
+    """
+    connection.execute('DELETE FROM feedbacks')
+    connection.execute('DELETE FROM otz')
+    connection.executemany(
+        'INSERT INTO feedbacks (chat, message, product, text) VALUES (?, ?, ?, ?)',
+        [(800 + n % 3, n, f'Товар {n}', f'Отзыв {n}') for n in range(1, 13)]
+    )
+    connection.execute('INSERT OR IGNORE INTO id (users, history, spend) VALUES (?, ?, ?)', (802, 'None', 0))
+    connection.commit()
+    sent = []
+
+    async def capture(method, data=None, files=None, **kwargs):
+        sent.append((method, data))
+        return await fake_request(method, data, files, **kwargs)
+
+    monkeypatch.setattr(bot, 'request', capture)
+    stored = connection.execute('SELECT count(*) FROM callback_payloads').fetchone()[0]
+    await handle_feedbacks_callback(callback('Отзывы', user_id=1))
+    assert [method for method, _ in sent] == ['editMessageText', 'editMessageReplyMarkup', 'answerCallbackQuery']
+    assert sent[0][1]['text'].count('Отзыв ') == reviews.MODERATION_PAGE_SIZE
+    assert connection.execute('SELECT count(*) FROM callback_payloads').fetchone()[0] == stored + 1, \
+        "Данные кнопок сохраняются одной строкой на страницу"
+    token = json.loads(sent[1][1]['reply_markup'])['inline_keyboard'][0][1]['callback_data'].split(':')[1]
+
+    # Кнопка одного отзыва: индекс на странице в callback_data
+    first_page = [row[0] for row in connection.execute('SELECT id FROM feedbacks ORDER BY id LIMIT 5')]
+    await handle_moderation(callback(f'modReject:{token}:1'), ModerationBatch(first_page, 0))
+    assert connection.execute('SELECT count(*) FROM feedbacks WHERE id = ?', (first_page[1],)).fetchone()[0] == 0
+    connection.execute('INSERT INTO feedbacks (id, chat, message, product, text) VALUES (?, ?, ?, ?, ?)',
+                       (first_page[1], 802, 2, 'Товар 2', 'Отзыв 2'))
+    connection.commit()
+
+    ids = [row[0] for row in connection.execute('SELECT id FROM feedbacks ORDER BY id LIMIT 5')]
+    await handle_moderation(callback('modApprove'), ModerationBatch(ids, 0))
+    assert [row[0] for row in connection.execute('SELECT text FROM otz ORDER BY id')] == [f'Отзыв {n}' for n in range(1, 6)]
+    assert await reviews.approve(ids) == 0, "Повторное нажатие ничего не публикует"
+
+    await handle_moderation(callback('modBan'), ModerationBatch([ids[-1] + 1], 0))  # отзыв 6, автор 800
+    assert connection.execute('SELECT count(*) FROM feedbacks WHERE chat = 800').fetchone()[0] == 0
+    assert connection.execute('SELECT count(*) FROM feedbacks').fetchone()[0] == 4
+
+    connection.execute('DELETE FROM feedbacks')
+    connection.execute('DELETE FROM otz')
+    connection.commit()
@@ -0,0 +1,160 @@
+# tests/test_sharding.py
+
+import queue
+
+import pytest
+
+import cache_bus
+import catalog
+import order_digest
+import outbox
+import sharding
+from bot import bot, dp
+from conftest import fake_request
+from db import execute, unit_of_work, connection
+
+
+def callback_update(update_id, user_id):
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': f'cb{update_id}', 'chat_instance': '1', 'data': 'rubles',
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'TestUser'},
+            'message': {'message_id': 1, 'date': 0, 'chat': {'id': user_id, 'type': 'private'}},
+        },
+    }
+
+
+def test_updates_of_one_user_go_to_one_worker():
+    """Проверяем, что апдейты одного пользователя (сообщения и нажатия кнопок) попадают в один воркер."""
+    message = {'update_id': 1, 'message': {'message_id': 1, 'date': 0, 'from': {'id': 1001}, 'chat': {'id': 1001}}}
+    assert sharding.shard_of(message, 4) == sharding.shard_of(callback_update(2, 1001), 4) == 1001 % 4
+    assert sharding.shard_of({'update_id': 3}, 4) == 0
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidation_is_published_after_commit(monkeypatch):
+    """
+    Проверяем, что изменение каталога публикуется другим процессам только после фиксации,
+    откат ничего не публикует, а полученное сообщение сбрасывает кэш.
+    """
+    published = []
+    monkeypatch.setattr(cache_bus, '_publisher', published.append)
+
+    with pytest.raises(RuntimeError):
+        async with unit_of_work():
+            await catalog.add_node(None, catalog.CATEGORY, 'Отменённый ассортимент')
+            raise RuntimeError
+    assert published == []
+
+    async with unit_of_work():
+        node_id = await catalog.add_node(None, catalog.CATEGORY, 'Новый ассортимент')
+        assert published == [], "До фиксации другие процессы не должны видеть изменение"
+    assert published == [cache_bus.CATALOG]
+
+    await catalog.get_node(node_id)
+    cache_bus.receive(cache_bus.CATALOG)
+    assert not catalog._cache.loaded
+    connection.execute('DELETE FROM catalog_nodes WHERE id = ?', (node_id,))
+    connection.commit()
+    catalog.invalidate()
+
+
+@pytest.mark.asyncio
+async def test_worker_processes_user_updates_in_order(monkeypatch):
+    """Проверяем, что воркер выполняет апдейты одного пользователя по порядку и применяет инвалидацию."""
+    monkeypatch.setattr(cache_bus, '_publisher', None)
+    monkeypatch.setattr(outbox, '_outbox', outbox.Outbox())
+    answered = []
+
+    async def telegram(method, data=None, files=None, **kwargs):
+        if method == 'answerCallbackQuery':
+            answered.append(data['callback_query_id'])
+        return await fake_request(method, data, files, **kwargs)
+
+    monkeypatch.setattr(bot, 'request', telegram)
+    inbox, bus = queue.Queue(), queue.Queue()
+    for update_id in range(1, 6):
+        inbox.put(('update', callback_update(update_id, 2002)))
+    await catalog.get_children(None)
+    inbox.put(('invalidate', cache_bus.CATALOG))
+    inbox.put(None)
+
+    await sharding.serve(0, 2, inbox, bus)
+
+    assert answered == [f'cb{update_id}' for update_id in range(1, 6)]
+    assert not catalog._cache.loaded, "Сообщение об инвалидации должно сбросить кэш каталога"
+    assert outbox._outbox.rate == sharding.OUTBOX_RATE / 2
+
+
+@pytest.mark.asyncio
+async def test_worker_rolls_back_failed_update(monkeypatch):
+    """Проверяем, что апдейт, обработанный воркером, выполняется в единице работы и откатывается при исключении."""
+    monkeypatch.setattr(cache_bus, '_publisher', None)
+    monkeypatch.setattr(outbox, '_outbox', outbox.Outbox())
+    user_id = 2004
+
+    async def handler(callback_query):
+        await execute('INSERT INTO cart_items (user_id, sku, price, count) VALUES (?, ?, ?, ?)',
+                      (user_id, callback_query.data, 10000, 1))
+        if callback_query.data == 'shardFail':
+            raise RuntimeError('обработчик упал')
+
+    dp.register_callback_query_handler(handler, text=['shardOk', 'shardFail'])
+    inbox, bus = queue.Queue(), queue.Queue()
+    for update_id, data in ((11, 'shardOk'), (12, 'shardFail')):
+        update = callback_update(update_id, user_id)
+        update['callback_query']['data'] = data
+        inbox.put(('update', update))
+    inbox.put(None)
+    try:
+        await sharding.serve(0, 2, inbox, bus)
+    finally:
+        dp.callback_query_handlers.unregister(handler)
+
+    skus = [row[0] for row in connection.execute('SELECT sku FROM cart_items WHERE user_id = ?', (user_id,))]
+    assert skus == ['shardOk'], "Изменения упавшего апдейта должны откатиться"
+    connection.execute('DELETE FROM cart_items WHERE user_id = ?', (user_id,))
+    connection.commit()
+
+
+@pytest.mark.asyncio
+async def test_order_digest_is_kept_by_worker_zero(monkeypatch):
+    """
+    Проверяем, что заказы со всех воркеров попадают в сводку воркера 0 (одна сводка на всех),
+    а главный процесс пересылает инвалидацию остальным воркерам и останавливает воркер 0 последним.
+    """
+    monkeypatch.setattr(cache_bus, '_publisher', None)
+    monkeypatch.setattr(order_digest, '_forwarder', None)
+    monkeypatch.setattr(order_digest, '_digest', order_digest.OrderDigest())
+    monkeypatch.setattr(order_digest, 'ADMIN_IDS', {1})
+    monkeypatch.setattr(outbox, '_outbox', outbox.Outbox())
+    texts = []
+
+    async def telegram(method, data=None, files=None, **kwargs):
+        texts.append(data.get('text'))
+        return await fake_request(method, data, files, **kwargs)
+
+    monkeypatch.setattr(bot, 'request', telegram)
+    order = (3003, 'buyer', None, 'Бренд Линейка Вкус - 1шт.\n\n', 10000)
+
+    # Воркер 1 не ведёт свою сводку, а передаёт заказ через главный процесс
+    inbox, bus = queue.Queue(), queue.Queue()
+    inbox.put(None)
+    await sharding.serve(1, 2, inbox, bus)
+    order_digest.notify_order(*order)
+    assert texts == [] and bus.get_nowait() == (1, 'order', order)
+    monkeypatch.setattr(order_digest, '_forwarder', None)
+
+    inboxes = [queue.Queue(), queue.Queue()]
+    for item in ((1, 'order', order), (0, 'invalidate', cache_bus.CATALOG), None):
+        bus.put(item)
+    sharding._relay(bus, inboxes)
+    assert [inboxes[0].get_nowait() for _ in range(2)] == [('order', order), None]
+    assert inboxes[1].get_nowait() == ('invalidate', cache_bus.CATALOG) and inboxes[1].empty()
+
+    inbox = queue.Queue()
+    inbox.put(('order', order))
+    inbox.put(None)
+    await sharding.serve(0, 2, inbox, queue.Queue())
+    assert len(texts) == 1 and '@buyer' in texts[0]
@@ -0,0 +1,105 @@
+# tests/test_unit_of_work.py
+
+import asyncio
+
+import pytest
+from aiogram import types
+
+import db
+from bot import dp
+from db import connection, execute, unit_of_work
+
+
+@pytest.mark.asyncio
+async def test_failed_update_is_rolled_back():
+    """
+    Проверяем, что изменения апдейта, обработчик которого упал с исключением, откатываются,
+    а изменения успешного апдейта фиксируются.
+    """
+    user_id = 567890
+
+    async def handler(callback_query: types.CallbackQuery):
+        await execute('INSERT INTO cart_items (user_id, sku, price, count) VALUES (?, ?, ?, ?)',
+                      (user_id, callback_query.data, 10000, 1))
+        if callback_query.data == 'uowFail':
+            raise RuntimeError('обработчик упал')
+
+    dp.register_callback_query_handler(handler, text=['uowOk', 'uowFail'])
+    try:
+        for data in ('uowOk', 'uowFail'):
+            update = types.Update(**{
+                "update_id": 1,
+                "callback_query": {
+                    "id": "uow_cb",
+                    "from": {"id": user_id, "is_bot": False, "first_name": "UowUser"},
+                    "chat_instance": "1",
+                    "data": data
+                }
+            })
+            if data == 'uowFail':
+                with pytest.raises(RuntimeError):
+                    await dp.updates_handler.notify(update)
+            else:
+                await dp.updates_handler.notify(update)
+    finally:
+        dp.callback_query_handlers.unregister(handler)
+
+    assert not connection.in_transaction, "Транзакция апдейта осталась открытой"
+    skus = [row[0] for row in connection.execute('SELECT sku FROM cart_items WHERE user_id = ?', (user_id,))]
+    assert skus == ['uowOk']
+
+
+@pytest.mark.asyncio
+async def test_group_commit_batches_concurrent_updates(monkeypatch):
+    """
+    Проверяем, что единицы работы, завершившиеся в пределах окна GROUP_COMMIT_DELAY,
+    фиксируются одним commit.
+    """
+    monkeypatch.setattr(db, 'GROUP_COMMIT_DELAY', 20)
+
+    async def update(n):
+        async with unit_of_work():
+            await execute('INSERT INTO cart_items (user_id, sku, price, count) VALUES (?, ?, ?, ?)',
+                          (678901, str(n), 10000, 1))
+
+    statements = []
+    connection.set_trace_callback(statements.append)
+    try:
+        await asyncio.gather(*(update(n) for n in range(5)))
+    finally:
+        connection.set_trace_callback(None)
+
+    assert statements.count('COMMIT') == 1, statements
+    assert connection.execute('SELECT count(*) FROM cart_items WHERE user_id = 678901').fetchone()[0] == 5
+
+
+@pytest.mark.asyncio
+async def test_write_lock_is_released_during_bot_api_request(monkeypatch):
+    """
+    Проверяем, что запрос к Bot API из обработчика сначала фиксирует изменения апдейта и освобождает
+    блокировку записи: другой апдейт пишет, пока Telegram не ответил.
+    """
+    from aiogram.bot import api
+    from bot import bot
+
+    user_id = 567891
+    seen = []
+
+    async def make_request(session, server, token, method, data=None, files=None, **kwargs):
+        seen.append((db._write_lock().locked(), connection.in_transaction))
+        async with unit_of_work():
+            await execute('INSERT INTO cart_items (user_id, sku, price, count) VALUES (?, ?, ?, ?)',
+                          (user_id, 'other', 10000, 1))
+        return True
+
+    monkeypatch.delattr(bot, 'request')  # вместо заглушки conftest – настоящий bot.request
+    monkeypatch.setattr(api, 'make_request', make_request)
+    async with unit_of_work():
+        await execute('INSERT INTO cart_items (user_id, sku, price, count) VALUES (?, ?, ?, ?)',
+                      (user_id, 'own', 10000, 1))
+        await bot.answer_callback_query('uow_cb')
+        await execute('UPDATE cart_items SET count = 2 WHERE user_id = ? AND sku = ?', (user_id, 'own'))
+
+    assert seen == [(False, False)]
+    rows = connection.execute('SELECT sku, count FROM cart_items WHERE user_id = ? ORDER BY sku', (user_id,)).fetchall()
+    assert rows == [('other', 1), ('own', 2)]
@@ -0,0 +1,138 @@
+# tests/test_webhook.py
+
+import asyncio
+import logging
+import time
+
+import pytest
+from aiohttp.test_utils import TestServer, TestClient
+
+import handlers  # noqa: F401 – регистрирует обработчики в dp
+import webhook
+from bot import bot, dp
+from conftest import fake_request
+
+log = logging.getLogger(__name__)
+
+UPDATES = 5
+
+
+def callback_update(update_id, user_id=654321):
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': f'cb{update_id}',
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'TestUser'},
+            'chat_instance': '1',
+            'data': 'rubles',
+            'message': {
+                'message_id': 1, 'date': 0,
+                'chat': {'id': user_id, 'type': 'private'},
+            },
+        },
+    }
+
+
+async def webhook_latencies(monkeypatch):
+    """Отправляет апдейты на webhook по HTTP; задержка – до получения ответа на callback query."""
+    api_calls = []
+
+    async def telegram(method, data=None, files=None, **kwargs):
+        api_calls.append(method)
+        return await fake_request(method, data, files, **kwargs)
+
+    monkeypatch.setattr(bot, 'request', telegram)
+    monkeypatch.setattr(webhook, 'WEBHOOK_SECRET', 'secret')
+    latencies = []
+    async with TestClient(TestServer(webhook.make_app(dp))) as client:
+        response = await client.post(webhook.WEBHOOK_PATH, json=callback_update(1))
+        assert response.status == 401, "Запрос без секретного токена должен отклоняться"
+        for update_id in range(2, UPDATES + 2):
+            started = time.monotonic()
+            response = await client.post(webhook.WEBHOOK_PATH, json=callback_update(update_id),
+                                         headers={webhook.SECRET_HEADER: 'secret'})
+            body = await response.json()
+            latencies.append(time.monotonic() - started)
+            assert body['method'] == 'answerCallbackQuery'
+            assert body['callback_query_id'] == f'cb{update_id}'
+            assert body['text'] == 'Общая сумма за количество'
+    assert 'answerCallbackQuery' not in api_calls, "Ответ на callback query должен уходить в теле ответа webhook"
+    return latencies
+
+
+async def polling_latencies(monkeypatch):
+    """Те же апдейты через long polling; задержка – до вызова answerCallbackQuery."""
+    incoming = asyncio.Queue()
+    answered = {}
+
+    async def telegram(method, data=None, files=None, **kwargs):
+        if method == 'getUpdates':
+            try:
+                return [await asyncio.wait_for(incoming.get(), 1)]
+            except asyncio.TimeoutError:
+                return []
+        if method == 'answerCallbackQuery':
+            answered[data['callback_query_id']].set_result(time.monotonic())
+        return await fake_request(method, data, files, **kwargs)
+
+    monkeypatch.setattr(bot, 'request', telegram)
+    polling = asyncio.create_task(dp.start_polling())
+    latencies = []
+    try:
+        for update_id in range(100, 100 + UPDATES):
+            answered[f'cb{update_id}'] = asyncio.get_running_loop().create_future()
+            started = time.monotonic()
+            incoming.put_nowait(callback_update(update_id))
+            latencies.append(await asyncio.wait_for(answered[f'cb{update_id}'], 5) - started)
+    finally:
+        dp.stop_polling()
+        await polling
+    return latencies
+
+
+@pytest.mark.asyncio
+async def test_webhook_answers_inline(monkeypatch):
+    """
+    Проверяем, что webhook:
+        - отклоняет запросы без секретного токена;
+        - отвечает на callback query в теле ответа, без отдельного вызова API.
+    Задержки webhook и long polling только пишутся в лог: сравнение времени на общей машине нестабильно.
+    """
+    webhook_times = await webhook_latencies(monkeypatch)
+    polling_times = await polling_latencies(monkeypatch)
+    webhook_avg = sum(webhook_times) / len(webhook_times)
+    polling_avg = sum(polling_times) / len(polling_times)
+    log.info('Средняя задержка: webhook %.1f мс, polling %.1f мс', webhook_avg * 1000, polling_avg * 1000)
+
+
+@pytest.mark.asyncio
+async def test_second_answer_does_not_replace_webhook_reply(monkeypatch):
+    """
+    Проверяем, что если обработчик отвечает на callback query дважды (например, показывает алерт и вызывает
+    другой обработчик, который тоже отвечает), в теле ответа webhook остаётся первый ответ, а второй
+    не уходит через API раньше него.
+    """
+    api_calls = []
+
+    async def telegram(method, data=None, files=None, **kwargs):
+        api_calls.append(method)
+        return await fake_request(method, data, files, **kwargs)
+
+    async def handler(callback_query):
+        await callback_query.answer('Товар добавлен в корзину ✅', show_alert=True)
+        await callback_query.answer()
+
+    monkeypatch.setattr(bot, 'request', telegram)
+    monkeypatch.setattr(webhook, 'WEBHOOK_SECRET', '')
+    dp.register_callback_query_handler(handler, text='answerTwice')
+    update = callback_update(200)
+    update['callback_query']['data'] = 'answerTwice'
+    try:
+        async with TestClient(TestServer(webhook.make_app(dp))) as client:
+            body = await (await client.post(webhook.WEBHOOK_PATH, json=update)).json()
+    finally:
+        dp.callback_query_handlers.unregister(handler)
+
+    assert body['method'] == 'answerCallbackQuery'
+    assert body['text'] == 'Товар добавлен в корзину ✅' and body['show_alert']
+    assert 'answerCallbackQuery' not in api_calls
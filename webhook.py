@@ -0,0 +1,113 @@
+# webhook.py
+
+"""Режим webhook: Telegram сам присылает апдейты на встроенный aiohttp-сервер.
+
+По сравнению с polling апдейт не ждёт очередного getUpdates, а накопившиеся за время перезапуска апдейты
+не теряются. Запросы без правильного секретного токена (WEBHOOK_SECRET) отклоняются, одновременно
+обрабатывается не больше WEBHOOK_MAX_CONCURRENCY апдейтов. Первый ответ на callback query или inline query
+(callback_query.answer(), inline_query.answer()) возвращается Telegram прямо в теле ответа на запрос webhook,
+без отдельного вызова API. Telegram принимает только первый ответ на запрос, поэтому следующие ответы
+на тот же запрос (например, из обработчика, вызванного другим обработчиком) отбрасываются: иначе они ушли бы
+через API раньше тела ответа и заменили бы его.
+"""
+
+import asyncio
+import hmac
+import logging
+
+from aiogram.bot import api
+from aiogram.dispatcher.webhook import WebhookRequestHandler, BOT_DISPATCHER_KEY
+from aiogram.utils.executor import Executor
+from aiohttp import web
+
+from bot import bot, webhook_reply
+from config import (WEBHOOK_HOST, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT,
+                    WEBHOOK_MAX_CONCURRENCY, SKIP_UPDATES)
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class _Reply:
+    """Место для одного ответа в теле ответа webhook. После отправки ответа Telegram место закрывается."""
+
+    __slots__ = ('response', 'query_id', 'closed')
+
+    def __init__(self):
+        self.response = None
+        self.query_id = None
+        self.closed = False
+
+    def take(self, response, query_id):
+        """
+        Кладёт ответ на запрос query_id в тело ответа webhook. Возвращает True, если вызывать API не нужно:
+        ответ занял место или место уже занято ответом на тот же запрос (повторный ответ отбрасывается).
+        """
+        if self.closed:
+            return False
+        if self.response is not None:
+            return query_id == self.query_id
+        self.response, self.query_id = response, query_id
+        return True
+
+
+def check_secret(request):
+    """Отклоняет запрос, если задан WEBHOOK_SECRET, а заголовок с секретным токеном не совпадает."""
+    if WEBHOOK_SECRET and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), WEBHOOK_SECRET):
+        raise web.HTTPUnauthorized()
+
+
+class WebhookHandler(WebhookRequestHandler):
+    """Обработчик запросов Telegram: проверка секрета, ограничение параллельности и ответ в теле запроса."""
+
+    async def post(self):
+        check_secret(self.request)
+        dispatcher = self.get_dispatcher()
+        update = await self.parse_update(dispatcher.bot)
+        reply = _Reply()
+        async with self.request.app['webhook_semaphore']:
+            # Задача обработки апдейта копирует контекст, поэтому bot.answer_callback_query увидит reply
+            token = webhook_reply.set(reply)
+            try:
+                results = await self.process_update(update)
+            finally:
+                webhook_reply.reset(token)
+                reply.closed = True
+        response = reply.response or self.get_response(results)
+        return response.get_web_response() if response else web.Response(text='ok')
+
+
+def make_app(dispatcher):
+    """Создаёт aiohttp-приложение с обработчиком webhook по пути WEBHOOK_PATH."""
+    app = web.Application()
+    app[BOT_DISPATCHER_KEY] = dispatcher
+    app['webhook_semaphore'] = asyncio.Semaphore(WEBHOOK_MAX_CONCURRENCY)
+    app.router.add_route('*', WEBHOOK_PATH, WebhookHandler, name='webhook_handler')
+    return app
+
+
+async def set_webhook(dispatcher):
+    """Регистрирует webhook в Telegram. Накопившиеся апдейты сбрасываются только при SKIP_UPDATES."""
+    payload = {
+        'url': WEBHOOK_HOST.rstrip('/') + WEBHOOK_PATH,
+        'max_connections': min(WEBHOOK_MAX_CONCURRENCY, 100),
+        'drop_pending_updates': SKIP_UPDATES,
+    }
+    if WEBHOOK_SECRET:
+        payload['secret_token'] = WEBHOOK_SECRET
+    await bot.request(api.Methods.SET_WEBHOOK, payload)
+    log.info('Webhook: %s', payload['url'])
+
+
+def start_webhook(dispatcher, on_startup=None, on_shutdown=None):
+    """Запускает бота в режиме webhook: регистрирует адрес в Telegram и поднимает aiohttp-сервер."""
+    executor = Executor(dispatcher)
+    executor.on_startup(set_webhook, polling=False)
+    if on_startup is not None:
+        executor.on_startup(on_startup, polling=False)
+    if on_shutdown is not None:
+        executor.on_shutdown(on_shutdown, polling=False)
+    # Маршрут уже добавлен в make_app; webhook при остановке не удаляется, чтобы Telegram копил апдейты до перезапуска
+    executor.set_webhook(web_app=make_app(dispatcher))
+    executor.run_app(host=WEBAPP_HOST, port=WEBAPP_PORT)